@@ -7,7 +7,7 @@ from artist import Plot
 from sapphire import Station
 from sapphire.transformations.clock import datetime_to_gps, gps_to_datetime
 
-from get_aligned_eventtimes import get_aligned, get_station_numbers
+from get_aligned_eventtimes import get_aligned, get_data
 
 YEARS = range(2004, datetime.date.today().year + 1)
 YEARS_TICKS = np.array([datetime_to_gps(datetime.date(y, 1, 1)) for y in YEARS])
@@ -24,7 +24,7 @@ def normalize_event_rates(data, station_numbers):
     expected number of events per hour for such a station.
 
     """
-    scaled_data = data.copy()
+    scaled_data = data.astype(float)
     for i, s in enumerate(station_numbers):
         n = Station(s).n_detectors()
         if n == 2:
@@ -60,8 +60,9 @@ def plot_histogram(data, timestamps, station_numbers):
 
 if __name__ == "__main__":
     if 'aligned_data_all' not in globals():
-        aligned_data, aligned_data_all, first, last = get_aligned()
-        station_numbers = get_station_numbers()
+        data = get_data()
+        aligned_data, aligned_data_all, first, last = get_aligned(data)
+        station_numbers = data.stations
 
     timestamps = np.arange(first, last + 3601, 3600)
     scaled_data = normalize_event_rates(aligned_data_all, station_numbers)
@@ -6,15 +6,17 @@ calculates the distances of the combinations, and makes
 a histogram to show these distances.
 
 """
-from itertools import combinations
-
 import numpy
 
+from scipy.spatial.distance import pdist
+
 from artist import Plot
 
-from sapphire import HiSPARCNetwork, HiSPARCStations, Network, ScienceParkCluster
+from sapphire import HiSPARCStations, Network, ScienceParkCluster
 from sapphire.utils import c
 
+from distance_matrix import get_distance_matrix
+
 
 def distances_sciencepark():
     cluster = ScienceParkCluster(force_stale=True)
@@ -28,8 +30,9 @@ def distances_netherlands():
 
 
 def distances_all_stations():
-    cluster = HiSPARCNetwork(force_stale=True)
-    distances_stations(cluster, name='_all')
+    distances = get_distance_matrix().distances()
+    distances = distances[numpy.triu_indices_from(distances, k=1)]
+    plot_station_distances(distances[~numpy.isnan(distances)], name='_all')
 
 
 def distances_stations(cluster, name=''):
@@ -65,8 +68,9 @@ def plot_station_distances(distances, name=''):
 
 
 def distance_combinations(coordinates):
-    distances = [distance(c1, c2) for c1, c2 in combinations(coordinates, 2)]
-    return distances
+    """Distances for all combinations of 2 coordinates"""
+
+    return pdist(numpy.array(coordinates).reshape(len(coordinates), -1))
 
 
 def distance(c1, c2):
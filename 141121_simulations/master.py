@@ -11,6 +11,8 @@ from artist import Plot, PolarPlot
 from sapphire import GroundParticlesSimulation, HiSPARCStations, ReconstructESDCoincidences, ReconstructESDEvents
 from sapphire.utils import angle_between
 
+from timing_offsets import TimingOffsets
+
 RESULT_PATH = 'result_400_gen_16394.h5'
 CORSIKA_DATA = 'corsika.h5'
 GRAYS = ['black', 'darkgray', 'gray', 'lightgray']
@@ -165,9 +167,7 @@ def reconstruct_simulations():
         rec_coins = ReconstructESDCoincidences(data, '/coincidences',
                                                overwrite=True, progress=True)
         rec_coins.prepare_output()
-        rec_coins.offsets = {station.number: [o + station.gps_offset
-                                              for o in station.detector_offsets]
-                             for station in cluster.stations}
+        rec_coins.offsets = TimingOffsets.from_cluster(cluster).offsets_at(0)
         try:
             rec_coins.reconstruct_directions()
             rec_coins.store_reconstructions()
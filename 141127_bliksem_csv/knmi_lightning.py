@@ -1,15 +1,20 @@
-import csv
 import os
 
 from datetime import date, timedelta
+from multiprocessing import Pool
 
 import numpy as np
 import tables
 
 from date_generator import daterange
-from knmi_timestamps import get_gps_timestamp
+from knmi_timestamps import get_gps_timestamps
 
 LGT_PATH = "/Users/arne/Datastore/Lightning/"
+COLUMNS = ['timestamp', 'nanoseconds', 'latitude', 'longitude', 'current']
+DISCHARGE_DTYPE = [('timestamp', np.uint32), ('nanoseconds', np.uint32),
+                   ('latitude', np.float64), ('longitude', np.float64),
+                   ('current', np.int32)]
+FORMAT = ['%d', '%d', '%.6f', '%.6f', '%d']
 
 
 def discharges(datafile, type=4):
@@ -24,21 +29,51 @@ def discharges(datafile, type=4):
         4 = CG stroke
         5 = CG return stroke.
 
-    :return: arrays time_offset, latitude, longitude for events of chosen type
+    :return: generator of timestamp, nanoseconds, latitude, longitude
+             and current for events of chosen type
+
+    """
+    return (tuple(discharge) for discharge in discharge_array(datafile, type))
+
+
+def discharge_array(datafile, type=4):
+    """Get the discharges of certain type as a structured array
+
+    All time offsets are converted to GPS timestamps at once.
+
+    :param datafile: PyTables instance of the KNMI LGT file.
+    :param type: the type of detected event, see `discharges`.
+    :return: array with timestamp, nanoseconds, latitude, longitude and
+             current columns.
 
     """
     # FIXME: Might be a discharge2, check this.
     discharge_table = datafile.get_node('/discharge1')
-    cg_idx = np.where(discharge_table.event_type[:] == type)
+    cg_idx = np.where(discharge_table.event_type[:] == type)[0]
+
+    result = np.empty(len(cg_idx), dtype=DISCHARGE_DTYPE)
+    timestamps, nanoseconds = get_gps_timestamps(datafile, discharge_table.time_offset[:][cg_idx])
+    result['timestamp'] = timestamps
+    result['nanoseconds'] = nanoseconds
+    result['latitude'] = discharge_table.latitude[:][cg_idx]
+    result['longitude'] = discharge_table.longitude[:][cg_idx]
+    result['current'] = discharge_table.current[:][cg_idx].astype(int)
+
+    return result
 
-    discharges = ((get_gps_timestamp(datafile, discharge_table.time_offset[idx])[0],
-                   get_gps_timestamp(datafile, discharge_table.time_offset[idx])[1],
-                   '%.6f' % discharge_table.latitude[idx],
-                   '%.6f' % discharge_table.longitude[idx],
-                   int(discharge_table.current[idx]))
-                  for idx in cg_idx[0])
 
-    return discharges
+def day_discharges(args):
+    """Get the discharges for one day, or None if there is no valid file
+
+    :param args: tuple of the date and discharge type.
+
+    """
+    d, type = args
+    try:
+        with data_file(d) as data:
+            return discharge_array(data, type)
+    except Exception:
+        return None
 
 
 def data_file(date):
@@ -77,23 +112,31 @@ def data_path(date):
     return os.path.join(rootdir, filepath)
 
 
-def data_to_csv():
-    for year in range(2004, 2013):
+def data_to_csv(years=range(2004, 2013), type=1, processes=None):
+    """Write the discharges to a TSV file per year
+
+    The days are read and converted in parallel worker processes, the
+    results are written in order, one chunk per day.
+
+    :param years: the years to export.
+    :param type: the type of detected event, see `discharges`.
+    :param processes: number of worker processes, default is one per CPU.
+
+    """
+    worker_pool = Pool(processes)
+    for year in years:
         print year
+        # The daterange includes the stop date, so stop at the last day
+        days = [(d, type)
+                for d in daterange(date(year, 1, 1), date(year, 12, 31))]
         with open(LGT_PATH + 'robert_cc_%d.tsv' % year, 'w') as output:
-            csvwriter = csv.writer(output, delimiter='\t')
-            csvwriter.writerow(['timestamp', 'nanoseconds', 'latitude',
-                                'longitude', 'current'])
-
-            for d in daterange(date(year, 1, 1), date(year + 1, 1, 1)):
-                try:
-                    data = data_file(d)
-                    for discharge in discharges(data, type=1):
-                        csvwriter.writerow(discharge)
-                except:
-                    continue
-                else:
-                    data.close()
+            output.write('\t'.join(COLUMNS) + '\r\n')
+            for day in worker_pool.imap(day_discharges, days):
+                if day is not None and len(day):
+                    np.savetxt(output, day, fmt=FORMAT, delimiter='\t',
+                               newline='\r\n')
+    worker_pool.close()
+    worker_pool.join()
 
 
 if __name__ == '__main__':
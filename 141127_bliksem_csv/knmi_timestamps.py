@@ -1,6 +1,8 @@
 import calendar
 import datetime
 
+from numpy import around, asarray, int64, unique
+
 from sapphire.transformations import clock
 
 
@@ -15,6 +17,47 @@ def get_gps_timestamp(file, time_offset):
     return timestamp, nanosecond
 
 
+def get_gps_timestamps(file, time_offsets):
+    """Convert many time_offsets to gps timestamps and nanoseconds at once
+
+    The reference datetime is read only once. Like `get_gps_timestamp`
+    the offsets are rounded to whole microseconds.
+
+    :param file: KNMI LGT file object
+    :param time_offsets: array of time offsets in fractional seconds
+
+    :return: arrays of GPS timestamps and nanoseconds
+
+    """
+    reference_date = get_reference_datetime(file)
+    reference_timestamp = calendar.timegm(reference_date.utctimetuple())
+
+    microseconds = (around(asarray(time_offsets) * 1e6).astype(int64) +
+                    reference_date.microsecond)
+    timestamps = reference_timestamp + microseconds // int(1e6)
+    nanoseconds = (microseconds % int(1e6)) * 1000
+
+    return utc_to_gps(timestamps), nanoseconds
+
+
+def utc_to_gps(timestamps):
+    """Convert an array of UTC timestamps to GPS timestamps
+
+    The leap second correction is only determined for the unique
+    timestamps.
+
+    """
+    if not len(timestamps):
+        return timestamps
+    first_leap = clock.utc_to_gps(int(timestamps.min())) - int(timestamps.min())
+    last_leap = clock.utc_to_gps(int(timestamps.max())) - int(timestamps.max())
+    if first_leap == last_leap:
+        return timestamps + first_leap
+    unique_timestamps, inverse = unique(timestamps, return_inverse=True)
+    gps = asarray([clock.utc_to_gps(int(ts)) for ts in unique_timestamps])
+    return gps[inverse]
+
+
 def datetime_to_gpstimestamp_nanoseconds(date):
     """Convert datetime objects to GPS timestamp and nanoseconds
 
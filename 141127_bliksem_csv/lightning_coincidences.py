@@ -0,0 +1,280 @@
+"""Find HiSPARC events in coincidence with lightning discharges
+
+Discharges and events are matched if they are within a time window and
+the discharge is within a radius of the station. The discharges are
+first reduced to those near a station using a coarse lat/lon grid, with
+cells at least as large as the radius, followed by an exact distance
+check on the remaining discharges. The time matching is a sorted merge
+using `searchsorted`, both discharges and events are sorted by
+ext_timestamp.
+
+The results are stored in the usual sapphire coincidences layout; one
+coincidence per discharge with at least one matching event, with
+`s_index` and `c_index` referring to the events. The discharge position
+and current are added to the coincidences table and the time difference
+and distance of each matched event are stored in a separate table.
+
+The discharges are processed in chunks (one day file at a time) so
+multi-year datasets can be handled in a single pass.
+
+"""
+from datetime import date
+
+import tables
+
+from numpy import (
+    arange, arcsin, array, concatenate, cos, cumsum, empty, floor, lexsort, radians, repeat, searchsorted, sin,
+    sqrt, uint64, unique, where, zeros)
+
+from sapphire import Station
+
+from date_generator import daterange
+from knmi_lightning import data_file, discharge_array
+
+EVENTDATA_PATH = '/Users/arne/Datastore/Lightning/sciencepark_events.h5'
+STATIONS = [501, 502, 503, 504, 505, 506, 508, 509, 510]
+EARTH_RADIUS = 6371e3  # m
+METER_PER_DEGREE = radians(1) * EARTH_RADIUS
+TIME_WINDOW = int(1e6)  # ns
+RADIUS = 10e3  # m
+
+
+class LightningPair(tables.IsDescription):
+    coincidence_id = tables.UInt32Col(pos=0)
+    s_idx = tables.UInt16Col(pos=1)
+    e_idx = tables.UInt32Col(pos=2)
+    dt = tables.Int64Col(pos=3)
+    distance = tables.Float32Col(pos=4)
+
+
+def coincidence_description(stations):
+    """Description of the coincidences table for these stations
+
+    The sapphire coincidences columns plus the discharge columns.
+
+    """
+    description = {'id': tables.UInt32Col(pos=0),
+                   'timestamp': tables.UInt32Col(pos=1),
+                   'nanoseconds': tables.UInt32Col(pos=2),
+                   'ext_timestamp': tables.UInt64Col(pos=3),
+                   'N': tables.UInt8Col(pos=4),
+                   'latitude': tables.Float64Col(pos=5),
+                   'longitude': tables.Float64Col(pos=6),
+                   'current': tables.Int32Col(pos=7)}
+    for s_idx, station in enumerate(stations):
+        description['s%d' % station] = tables.BoolCol(pos=8 + s_idx)
+    return description
+
+
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    """Distance between points on a sphere, angles in degrees
+
+    :return: distance in meters.
+
+    """
+    lat1, lon1, lat2, lon2 = (radians(latitude1), radians(longitude1),
+                              radians(latitude2), radians(longitude2))
+    a = (sin((lat2 - lat1) / 2) ** 2 +
+         cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * arcsin(sqrt(a))
+
+
+class SpatialGrid(object):
+
+    """Coarse lat/lon grid to quickly select discharges near stations
+
+    The cells are at least `radius` wide (also in longitude, at the
+    highest station latitude), so all discharges within the radius of a
+    station are in the cell of the station or one of its neighbours.
+
+    """
+
+    def __init__(self, positions, radius=RADIUS):
+        max_latitude = max(abs(latitude) for latitude, _ in positions)
+        self.dlat = radius / METER_PER_DEGREE
+        self.dlon = radius / (METER_PER_DEGREE *
+                              cos(radians(min(max_latitude + self.dlat, 89.))))
+        self.station_cells = [self.cells(latitude, longitude)
+                              for latitude, longitude in positions]
+
+    def cells(self, latitude, longitude):
+        return (floor(array(latitude) / self.dlat).astype(int),
+                floor(array(longitude) / self.dlon).astype(int))
+
+    def near(self, s_idx, cells):
+        """Mask for the cells which are neighbours of the station cell"""
+
+        lat_cell, lon_cell = self.station_cells[s_idx]
+        return ((abs(cells[0] - lat_cell) <= 1) &
+                (abs(cells[1] - lon_cell) <= 1))
+
+
+def match_station(d_ets, d_latitude, d_longitude, ext_timestamps, position,
+                  window=TIME_WINDOW, radius=RADIUS):
+    """Find all discharge/event pairs for one station
+
+    :param d_ets,d_latitude,d_longitude: ext_timestamp and position of
+        the discharges near the station, sorted by time.
+    :param ext_timestamps: sorted event ext_timestamps of the station.
+    :param position: (latitude, longitude) of the station.
+    :param window: maximum time difference in ns.
+    :param radius: maximum distance in m.
+    :return: discharge indices, event indices, time differences (event -
+             discharge) and distances of the matched pairs.
+
+    """
+    distance = haversine(d_latitude, d_longitude, *position)
+    d_idx = (distance <= radius).nonzero()[0]
+    d_ets = d_ets[d_idx]
+
+    window = uint64(window)
+    lower = where(d_ets > window, d_ets - window, 0).astype(uint64)
+    start = searchsorted(ext_timestamps, lower, side='left')
+    stop = searchsorted(ext_timestamps, d_ets + window, side='right')
+    n_matches = stop - start
+
+    # Expand the ranges start..stop of each discharge to event indices
+    total = n_matches.sum()
+    first = cumsum(n_matches) - n_matches
+    e_idx = arange(total) - repeat(first - start, n_matches)
+    d_idx = repeat(d_idx, n_matches)
+    dt = ext_timestamps[e_idx].astype('int64') - repeat(d_ets, n_matches).astype('int64')
+    return d_idx, e_idx, dt, distance[d_idx]
+
+
+class LightningCoincidences(object):
+
+    """Search and store coincidences between discharges and events
+
+    :param data: the PyTables datafile with the station events.
+    :param coincidence_group: path of the group to store the results in.
+    :param station_groups: paths to the station groups with events.
+    :param stations: station numbers of the station groups.
+    :param positions: (latitude, longitude) for each station.
+    :param window: maximum time difference in ns.
+    :param radius: maximum distance in m.
+
+    """
+
+    def __init__(self, data, coincidence_group, station_groups, stations,
+                 positions, window=TIME_WINDOW, radius=RADIUS):
+        self.data = data
+        self.stations = stations
+        self.positions = positions
+        self.window = window
+        self.radius = radius
+        self.grid = SpatialGrid(positions, radius)
+        self.ext_timestamps = [data.get_node(group, 'events').col('ext_timestamp')
+                               for group in station_groups]
+
+        parent, name = coincidence_group.rsplit('/', 1)
+        self.group = data.create_group(parent or '/', name, createparents=True)
+        self.coincidences = data.create_table(self.group, 'coincidences',
+                                              coincidence_description(stations))
+        self.pairs = data.create_table(self.group, 'pairs', LightningPair)
+        self.c_index = data.create_vlarray(self.group, 'c_index',
+                                           tables.UInt32Atom(shape=2))
+        data.create_array(self.group, 's_index', list(station_groups))
+        self.group._v_attrs.window = window
+        self.group._v_attrs.radius = radius
+
+    def search_and_store(self, chunks):
+        """Process chunks of discharges, each sorted by time"""
+
+        for discharges in chunks:
+            self.search_chunk(discharges)
+        self.data.flush()
+
+    def search_chunk(self, discharges):
+        """Find and store the coincidences for a chunk of discharges
+
+        :param discharges: structured array with timestamp, nanoseconds,
+                           latitude, longitude and current columns.
+
+        """
+        if not len(discharges):
+            return
+        d_ets = (discharges['timestamp'].astype(uint64) * uint64(1e9) +
+                 discharges['nanoseconds'].astype(uint64))
+        order = d_ets.argsort(kind='mergesort')
+        discharges = discharges[order]
+        d_ets = d_ets[order]
+        cells = self.grid.cells(discharges['latitude'], discharges['longitude'])
+
+        matches = []
+        for s_idx, ext_timestamps in enumerate(self.ext_timestamps):
+            near = self.grid.near(s_idx, cells).nonzero()[0]
+            if not len(near):
+                continue
+            d_idx, e_idx, dt, distance = match_station(
+                d_ets[near], discharges['latitude'][near],
+                discharges['longitude'][near], ext_timestamps,
+                self.positions[s_idx], self.window, self.radius)
+            matches.append((near[d_idx], repeat(s_idx, len(d_idx)), e_idx, dt, distance))
+        if not matches:
+            return
+
+        d_idx, s_idx, e_idx, dt, distance = [concatenate(column) for column in zip(*matches)]
+        if not len(d_idx):
+            return
+        order = lexsort((e_idx, s_idx, d_idx))
+        d_idx, s_idx, e_idx, dt, distance = (d_idx[order], s_idx[order], e_idx[order],
+                                             dt[order], distance[order])
+        self._store(discharges, d_ets, d_idx, s_idx, e_idx, dt, distance)
+
+    def _store(self, discharges, d_ets, d_idx, s_idx, e_idx, dt, distance):
+        coincident, first, n_events = unique(d_idx, return_index=True, return_counts=True)
+        first_id = self.coincidences.nrows
+        coincidence_id = repeat(arange(first_id, first_id + len(coincident)), n_events)
+
+        rows = empty(len(coincident), dtype=self.coincidences.dtype)
+        rows['id'] = arange(first_id, first_id + len(coincident))
+        for column in ['timestamp', 'nanoseconds', 'latitude', 'longitude', 'current']:
+            rows[column] = discharges[column][coincident]
+        rows['ext_timestamp'] = d_ets[coincident]
+        # A station can have several events matching the same discharge
+        rows['N'] = 0
+        for idx, station in enumerate(self.stations):
+            in_station = zeros(len(coincident), dtype=bool)
+            in_station[searchsorted(coincident, d_idx[s_idx == idx])] = True
+            rows['s%d' % station] = in_station
+            rows['N'] += in_station
+        self.coincidences.append(rows)
+
+        pairs = empty(len(d_idx), dtype=self.pairs.dtype)
+        pairs['coincidence_id'] = coincidence_id
+        pairs['s_idx'] = s_idx
+        pairs['e_idx'] = e_idx
+        pairs['dt'] = dt
+        pairs['distance'] = distance
+        self.pairs.append(pairs)
+
+        c_index = array([s_idx, e_idx]).T.astype('uint32')
+        for start, n in zip(first, n_events):
+            self.c_index.append(c_index[start:start + n])
+
+
+def daily_discharges(start, end, type=4):
+    """Generator of the discharges for each day from start to end"""
+
+    for d in daterange(start, end):
+        try:
+            with data_file(d) as datafile:
+                yield discharge_array(datafile, type)
+        except IOError:
+            continue
+
+
+def search_lightning_coincidences(data, start=date(2004, 1, 1), end=date(2012, 12, 31)):
+    station_groups = ['/s%d' % number for number in STATIONS]
+    positions = []
+    for number in STATIONS:
+        location = Station(number).gps_location()
+        positions.append((location['latitude'], location['longitude']))
+    coin = LightningCoincidences(data, '/lightning', station_groups, STATIONS, positions)
+    coin.search_and_store(daily_discharges(start, end, type=4))
+
+
+if __name__ == '__main__':
+    with tables.open_file(EVENTDATA_PATH, 'a') as data:
+        search_lightning_coincidences(data)
@@ -6,8 +6,9 @@ from numpy import isnan, nanmin
 
 from artist import Plot
 
-from sapphire import CoincidenceQuery, HiSPARCStations
-from sapphire.analysis import event_utils
+from sapphire import HiSPARCStations
+
+from event_gallery import detector_layout, read_displays, render_gallery
 
 COIN_DATA = '/Users/arne/Datastore/esd_coincidences/coincidences_n7_120101_140801.h5'
 OFFSETS = {501: [-1.10338, 0.0000, 5.35711, 3.1686],
@@ -18,13 +19,17 @@ OFFSETS = {501: [-1.10338, 0.0000, 5.35711, 3.1686],
            506: [-20.2320, -15.8309, -14.1818, -14.1548],
            508: [-26.2402, -24.9859, -24.0131, -23.2882],
            509: [-24.8369, -23.0218, -20.6011, -24.3757]}
-DETECTOR_IDS = [0, 1, 2, 3]
+STATIONS = [501, 502, 503, 504, 505, 506, 508, 509, 510]
+
 
+def display_coincidences(display, layout):
+    """Make an event display
 
-def display_coincidences(coincidence_events, reconstruction, c_id):
-    cluster = HiSPARCStations(range(501, 511))
+    :param display: coincidence display, see event_gallery.read_displays.
+    :param layout: detector layout, see event_gallery.detector_layout.
 
-    ts0 = coincidence_events[0][1]['ext_timestamp']
+    """
+    reconstruction = display['reconstruction']
 
     x = []
     y = []
@@ -33,18 +38,12 @@ def display_coincidences(coincidence_events, reconstruction, c_id):
 
     plot = Plot(width=r'.6\linewidth', height=r'.5\linewidth')
 
-    for station_number, event in coincidence_events:
-        if station_number == 507:
-            continue
-        station = cluster.get_station(station_number)
-        sx, sy, _ = station.get_xyalpha_coordinates()
-        for detector in station.detectors:
-            dx, dy = detector.get_xy_coordinates()
-            x.append(dx)
-            y.append(dy)
-        t.extend(event_utils.relative_detector_arrival_times(
-            event, ts0, DETECTOR_IDS, offsets=OFFSETS[station_number]))
-        p.extend(event_utils.detector_densities(event, DETECTOR_IDS))
+    for station_number, st, sp in zip(display['stations'], display['t'], display['p']):
+        xy = layout[station_number]['xy']
+        x.extend(xy[:, 0])
+        y.extend(xy[:, 1])
+        t.extend(st[:len(xy)])
+        p.extend(sp[:len(xy)])
 
     mint = nanmin(t)
 
@@ -84,15 +83,11 @@ def display_coincidences(coincidence_events, reconstruction, c_id):
     plot.set_xlabel('x [\si{\meter}]')
     plot.set_ylabel('y [\si{\meter}]')
 
-    plot.save_as_pdf('event_display_%d' % c_id)
+    plot.save_as_pdf('event_display_%d' % display['id'])
 
 
 if __name__ == '__main__':
+    layout = detector_layout(HiSPARCStations(STATIONS))
     with tables.open_file(COIN_DATA, 'r') as data:
-        cq = CoincidenceQuery(data)
-        for c_id in range(30):
-            coincidence = cq.coincidences[c_id]
-            coincidence_events = cq.events_from_stations([coincidence],
-                                                         range(501, 511)).next()
-            reconstruction = cq._get_reconstruction(coincidence)
-            display_coincidences(coincidence_events, reconstruction, c_id)
+        displays = read_displays(data, range(30), STATIONS, OFFSETS, layout)
+    render_gallery(display_coincidences, displays, layout)
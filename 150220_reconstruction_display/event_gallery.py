@@ -0,0 +1,182 @@
+"""Render event displays for many coincidences
+
+Making an event display for each coincidence separately means reading
+the events one coincidence at a time and getting the cluster (from the
+API) for each display. Here the detector coordinates are determined
+once, the events and reconstructions of all selected coincidences are
+read with one read per table, and the arrival times and densities are
+calculated per station with array operations. The displays are then
+rendered by a pool of worker processes.
+
+The render function gets a display (see `read_displays`), the detector
+layout and the extra arguments given to `render_gallery`::
+
+    layout = detector_layout(cluster)
+    with tables.open_file(path, 'r') as data:
+        displays = read_displays(data, c_ids, stations, offsets)
+    render_gallery(display_coincidence, displays, layout)
+
+"""
+import multiprocessing
+import re
+
+from numpy import array, full, in1d, nan, unique, where
+
+ERR = [-1, -999]
+DETECTOR_IDS = [0, 1, 2, 3]
+
+_render = None
+_layout = None
+_args = ()
+
+
+def detector_layout(cluster):
+    """Coordinates and areas of the detectors of each station
+
+    :param cluster: cluster object, the coordinates are determined for
+                    the current timestamp of the cluster.
+    :return: dictionary with the xy coordinates, lla coordinates and
+             area of the detectors for each station.
+
+    """
+    layout = {}
+    for station in cluster.stations:
+        layout[station.number] = {
+            'xy': array([detector.get_xy_coordinates() for detector in station.detectors]),
+            'lla': array([detector.get_lla_coordinates() for detector in station.detectors]),
+            'area': array([detector.get_area() for detector in station.detectors])}
+    return layout
+
+
+def get_offsets(offsets, station_number, timestamps):
+    """Detector offsets for each event
+
+    :param offsets: either a dictionary with the detector offsets for
+                    each station, or an object with a `lookup` method and
+                    `station_numbers` attribute (e.g. TimingOffsets).
+    :return: array (events x 4) with the offsets.
+
+    """
+    if offsets is None:
+        return full((len(timestamps), 4), 0.)
+    if hasattr(offsets, 'lookup'):
+        idx = offsets.station_numbers.index(station_number)
+        return offsets.lookup(timestamps)[:, idx]
+    return array([offsets.get(station_number, [0., 0., 0., 0.])] * len(timestamps), dtype=float)
+
+
+def arrival_times_and_densities(events, offsets, areas):
+    """Detector arrival times (relative to trace start) and densities
+
+    :param events: array of events of a station.
+    :param offsets: array (events x 4) with the detector offsets.
+    :param areas: detector areas.
+    :return: arrays (events x 4) with arrival times, relative to the
+             ext_timestamp of the event, and densities. Missing values
+             are nan.
+
+    """
+    t = full((len(events), 4), nan)
+    p = full((len(events), 4), nan)
+    t_trigger = events['t_trigger']
+    for i in DETECTOR_IDS:
+        t_i = events['t%d' % (i + 1)]
+        n_i = events['n%d' % (i + 1)]
+        valid = ~in1d(t_i, ERR) & ~in1d(t_trigger, ERR)
+        t[:, i] = where(valid, t_i - offsets[:, i] - t_trigger, nan)
+        area = areas[i] if i < len(areas) else .5
+        p[:, i] = where(in1d(n_i, ERR), nan, n_i / area)
+    return t, p
+
+
+def read_displays(data, c_ids, station_numbers, offsets=None, layout=None,
+                  coincidences_group='/coincidences', n=2):
+    """Read everything needed to display the coincidences
+
+    :param data: PyTables file.
+    :param c_ids: ids of the coincidences to display.
+    :param station_numbers: only use events from these stations.
+    :param offsets: detector offsets, see `get_offsets`.
+    :param layout: detector layout, used for the detector areas.
+    :param n: minimum number of events from the stations.
+    :return: list of dictionaries with the coincidence id, reference
+             ext_timestamp, station numbers, relative arrival times
+             (events x 4) and densities (events x 4) of the events, and
+             the reconstruction of the coincidence.
+
+    """
+    group = data.get_node(coincidences_group)
+    s_numbers = [int(re.search('[0-9]+$', s_path).group()) for s_path in group.s_index]
+    c_ids = array(c_ids)
+    coincidences = group.coincidences.read_coordinates(c_ids)
+    reconstructions = group.reconstructions.read_coordinates(c_ids)
+
+    # Event references per coincidence, only for the selected stations
+    c_events = []
+    event_indices = {}
+    for c_id in c_ids:
+        events = [(s_numbers[s_idx], e_idx) for s_idx, e_idx in group.c_index[c_id]
+                  if s_numbers[s_idx] in station_numbers]
+        c_events.append(events)
+        for station_number, e_idx in events:
+            event_indices.setdefault(station_number, []).append(e_idx)
+
+    # Read the events of each station at once
+    station_events = {}
+    for station_number, indices in event_indices.items():
+        s_idx = s_numbers.index(station_number)
+        indices = unique(indices)
+        events = data.get_node(group.s_index[s_idx], 'events').read_coordinates(indices)
+        event_offsets = get_offsets(offsets, station_number, events['timestamp'])
+        areas = layout[station_number]['area'] if layout is not None else []
+        t, p = arrival_times_and_densities(events, event_offsets, areas)
+        station_events[station_number] = {int(e_idx): (int(ets), t_row, p_row)
+                                          for e_idx, ets, t_row, p_row
+                                          in zip(indices, events['ext_timestamp'], t, p)}
+
+    displays = []
+    for coincidence, reconstruction, events in zip(coincidences, reconstructions, c_events):
+        if len(events) < n:
+            continue
+        values = [station_events[station_number][e_idx] for station_number, e_idx in events]
+        ts0 = values[0][0]
+        displays.append({'id': int(coincidence['id']),
+                         'ext_timestamp': ts0,
+                         'stations': [station_number for station_number, _ in events],
+                         't': array([t + (ets - ts0) for ets, t, _ in values]),
+                         'p': array([p for _, _, p in values]),
+                         'reconstruction': reconstruction})
+    return displays
+
+
+def init_worker(render, layout, args):
+    global _render, _layout, _args
+    _render = render
+    _layout = layout
+    _args = args
+
+
+def render_display(display):
+    _render(display, _layout, *_args)
+    return display['id']
+
+
+def render_gallery(render, displays, layout, *args, **kwargs):
+    """Render the displays in parallel
+
+    :param render: function which makes and saves a display, called with
+                   a display, the layout and the extra arguments.
+    :param displays: list of displays from `read_displays`.
+    :param layout: detector layout from `detector_layout`.
+    :param processes: number of worker processes.
+    :return: ids of the rendered coincidences.
+
+    """
+    worker_pool = multiprocessing.Pool(kwargs.get('processes'), initializer=init_worker,
+                                       initargs=(render, layout, args))
+    try:
+        c_ids = list(worker_pool.imap_unordered(render_display, displays))
+    finally:
+        worker_pool.close()
+        worker_pool.join()
+    return sorted(c_ids)
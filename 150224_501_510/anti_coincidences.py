@@ -4,6 +4,8 @@ from numpy import histogram, linspace
 
 from artist import Plot
 
+from coincidence_masks import get_membership
+
 STATIONS = [501, 510]
 EVENTDATA_PATH = '/Users/arne/Datastore/501_510/e_501_510_141101_150201.h5'
 
@@ -21,21 +23,17 @@ def anti_coincidences(data):
 
     colors = ['red', 'blue']
     linestyles = ['solid', 'dashed']
+    counts, _ = get_membership(data)
     for s_id, s_path in enumerate(data.root.coincidences.s_index):
         events = data.get_node(s_path, 'events')
-        # Get all events which are in a coincidence
-        ceids = [e_idx
-                 for c_idx in data.root.coincidences.c_index
-                 for s_idx, e_idx in c_idx if s_idx == s_id]
-        coin_events = events.read_coordinates(ceids)
-        all_events = events.read()
+        # Should filter -999 values, but there are only ~60 of those.
+        all_n = sum(events.col('n%d' % id) for id in ids) / 2.
+        # Events which are in a coincidence
+        coin_n = all_n.compress(counts[s_id] > 0)
 
         bins = linspace(0.01, 40, 300)
-        # Should filter -999 values, but there are only ~60 of those.
-        coin_counts, bins = histogram(sum(coin_events['n%d' % id] for id in ids) / 2.,
-                                      bins=bins)
-        all_counts, bins = histogram(sum(all_events['n%d' % id] for id in ids) / 2.,
-                                     bins=bins)
+        coin_counts, bins = histogram(coin_n, bins=bins)
+        all_counts, bins = histogram(all_n, bins=bins)
         anticoin_counts = all_counts - coin_counts
         # All events
         plot.histogram(all_counts, bins, linestyle='dotted, %s' % colors[s_id])
@@ -45,10 +43,8 @@ def anti_coincidences(data):
         plot.histogram(anticoin_counts, bins, linestyle='dashed, %s' % colors[s_id])
 
         bins = linspace(0.01, 20, 50)
-        coin_counts, bins = histogram(sum(coin_events['n%d' % id] for id in ids) / 2.,
-                                      bins=bins)
-        all_counts, bins = histogram(sum(all_events['n%d' % id] for id in ids) / 2.,
-                                     bins=bins)
+        coin_counts, bins = histogram(coin_n, bins=bins)
+        all_counts, bins = histogram(all_n, bins=bins)
         detection_efficiency = coin_counts.astype('float') / all_counts
         plot2.plot((bins[1:] + bins[:-1]) / 2., detection_efficiency,
                    linestyle='%s' % linestyles[s_id], mark=None)
@@ -67,5 +63,5 @@ def anti_coincidences(data):
 
 
 if __name__ == '__main__':
-    with tables.open_file(EVENTDATA_PATH, 'r') as data:
+    with tables.open_file(EVENTDATA_PATH, 'a') as data:
         anti_coincidences(data)
@@ -0,0 +1,94 @@
+"""Coincidence membership of station events
+
+Convert the `c_index` of a coincidences group to per-station arrays
+which give for each event the number of coincidences it is part of.
+Events in coincidence are those with a non-zero count, which makes
+splitting any event column in coincident and anti-coincident events a
+simple mask operation.
+
+The counts are stored in the coincidences group (when the file is
+opened for writing) so they only need to be determined once.
+
+"""
+import tables
+
+from numpy import bincount, concatenate, zeros
+
+MEMBERSHIP_GROUP = 'membership'
+
+
+def coincidence_membership(c_index, n_events):
+    """Determine how many coincidences each event is part of
+
+    :param c_index: sequence of (s_idx, e_idx) arrays, one per coincidence,
+                    as stored in the c_index of a coincidences group.
+    :param n_events: list with the number of events for each station,
+                     in order of the s_index.
+    :return: list with for each station an array with the number of
+             coincidences each event is in, and an array with the number
+             of events in each coincidence.
+
+    """
+    c_index = list(c_index)
+    multiplicity = zeros(len(c_index), dtype='uint16')
+    counts = [zeros(n, dtype='uint16') for n in n_events]
+    if not len(c_index):
+        return counts, multiplicity
+
+    multiplicity[:] = [len(c_idx) for c_idx in c_index]
+    pairs = concatenate(c_index).reshape(-1, 2)
+    s_idx = pairs[:, 0]
+    e_idx = pairs[:, 1]
+    for s_id, n in enumerate(n_events):
+        counts[s_id][:] = bincount(e_idx[s_idx == s_id], minlength=n)[:n]
+    return counts, multiplicity
+
+
+def get_membership(data, coincidences_group='/coincidences'):
+    """Get the coincidence membership counts for the stations
+
+    The counts are read from the coincidences group if they were stored
+    before and are still up to date, i.e. made for the same number of
+    coincidences and events. Otherwise they are determined and, if
+    possible, stored.
+
+    :param data: the PyTables datafile.
+    :param coincidences_group: path to the coincidences group.
+    :return: list with for each station (in order of the s_index) an array
+             with the number of coincidences each event is in, and the
+             number of events in each coincidence.
+
+    """
+    coin_group = data.get_node(coincidences_group)
+    s_index = coin_group.s_index.read()
+    n_coincidences = coin_group.c_index.nrows
+    n_events = [data.get_node(s_path, 'events').nrows for s_path in s_index]
+
+    try:
+        membership = data.get_node(coin_group, MEMBERSHIP_GROUP)
+        if (membership._v_attrs.n_coincidences == n_coincidences and
+                list(membership._v_attrs.n_events) == n_events):
+            counts = [membership._f_get_child('s%d' % s_id).read()
+                      for s_id in range(len(s_index))]
+            return counts, membership.multiplicity.read()
+    except (tables.NoSuchNodeError, AttributeError):
+        pass
+
+    counts, multiplicity = coincidence_membership(coin_group.c_index.read(), n_events)
+    if data.mode != 'r':
+        store_membership(data, coin_group, counts, multiplicity, n_events)
+    return counts, multiplicity
+
+
+def store_membership(data, coin_group, counts, multiplicity, n_events):
+    """Store the membership counts in the coincidences group"""
+
+    if MEMBERSHIP_GROUP in coin_group:
+        data.remove_node(coin_group, MEMBERSHIP_GROUP, recursive=True)
+    membership = data.create_group(coin_group, MEMBERSHIP_GROUP)
+    for s_id, station_counts in enumerate(counts):
+        data.create_array(membership, 's%d' % s_id, station_counts)
+    data.create_array(membership, 'multiplicity', multiplicity)
+    membership._v_attrs.n_coincidences = len(multiplicity)
+    membership._v_attrs.n_events = n_events
+
@@ -5,10 +5,23 @@ Smopy returns an OpenStreetMap tile image!
 
 Map tiles by CartoDB, under CC BY 3.0. Data by OpenStreetMap, under ODbL
 
+Tiles are kept in an on-disk cache (z/x/y layout), missing tiles are
+fetched concurrently. To only use cached tiles (e.g. without network)::
+
+    map = Map(box, tiles=TileCache(offline=True))
+
+Any object with a `fetch(x, y, z)` method returning the PNG data can be
+used as tile source, e.g. a local directory of tiles::
+
+    map = Map(box, tiles=TileCache(TileDirectory('/path/to/tiles')))
+
 """
 
 # Imports
 # -----------------------------------------------------------------------------
+import os
+import warnings
+
 from six import BytesIO
 
 import matplotlib.pyplot as plt
@@ -18,6 +31,8 @@ from PIL import Image
 # -----------------------------------------------------------------------------
 from six.moves.urllib.request import urlopen
 
+from cached_fetch import N_WORKERS, describe_errors, fetch_missing as fetch_concurrently
+
 # -----------------------------------------------------------------------------
 # Constants
 # -----------------------------------------------------------------------------
@@ -27,6 +42,7 @@ MAXTILES = 25
 
 TILE_SERVER_LABEL = "http://tile.basemaps.cartocdn.com/light_all/{z}/{x}/{y}@2x.png"
 TILE_SERVER = "http://tile.basemaps.cartocdn.com/light_nolabels/{z}/{x}/{y}@2x.png"
+TILE_CACHE_PATH = '/Users/arne/Datastore/map_tiles'
 
 
 # -----------------------------------------------------------------------------
@@ -44,15 +60,144 @@ def fetch_tile(x, y, z):
 
     """
     url = get_url(x, y, z)
-    png = BytesIO(urlopen(url).read())
-    img = Image.open(png)
+    return png_to_image(urlopen(url).read())
+
+
+def png_to_image(png):
+    """Convert PNG data to a PIL image."""
+    img = Image.open(BytesIO(png))
     img.load()
     return img
 
 
-def fetch_map(box, z):
+# -----------------------------------------------------------------------------
+# Tile sources
+# -----------------------------------------------------------------------------
+class TileServer(object):
+
+    """Get tiles from a tile server
+
+    :param url: url template with {z}, {x} and {y} fields.
+    :param name: name of the tile set, used for the cache directory.
+                 Defaults to the part of the url before the zoom level.
+
+    """
+
+    def __init__(self, url=TILE_SERVER, name=None):
+        self.url = url
+        if name is None:
+            name = url.split('/{z}')[0].rsplit('/', 1)[-1]
+        self.name = name
+
+    def fetch(self, x, y, z):
+        """Return the PNG data of tile (x, y) at zoom z."""
+        return urlopen(self.url.format(z=z, x=x, y=y)).read()
+
+
+class TileDirectory(object):
+
+    """Get tiles from a local directory with a z/x/y.png layout
+
+    :param path: path to the directory.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+
+    def fetch(self, x, y, z):
+        """Return the PNG data of tile (x, y) at zoom z."""
+        with open(os.path.join(self.path, str(z), str(x), '%d.png' % y), 'rb') as f:
+            return f.read()
+
+
+class TileCache(object):
+
+    """Tiles from an on-disk cache, with a z/x/y.png layout
+
+    Tiles which are not in the cache are requested from the source
+    (concurrently, with a bounded number of connections) and stored. The
+    files are only written from the calling thread.
+
+    :param source: tile source, an object with a `fetch(x, y, z)` method
+                   returning the PNG data. Defaults to the tile server.
+    :param path: path to the cache, the tiles are stored in a directory
+                 with the name of the source.
+    :param offline: if True, only cached tiles are used, missing tiles
+                    are left blank.
+    :param n_workers: maximum number of concurrent requests.
+
+    """
+
+    def __init__(self, source=None, path=TILE_CACHE_PATH, offline=False, n_workers=N_WORKERS):
+        self.source = TileServer() if source is None else source
+        self.path = os.path.join(path, self.source.name)
+        self.offline = offline
+        self.n_workers = n_workers
+
+    def tile_path(self, x, y, z):
+        return os.path.join(self.path, str(z), str(x), '%d.png' % y)
+
+    def __contains__(self, tile):
+        return os.path.exists(self.tile_path(*tile))
+
+    def read(self, x, y, z):
+        with open(self.tile_path(x, y, z), 'rb') as f:
+            return f.read()
+
+    def store(self, x, y, z, png):
+        path = self.tile_path(x, y, z)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+        # Write to a temporary file first, to never leave partial tiles
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(png)
+        os.rename(tmp_path, path)
+
+    def fetch_missing(self, tiles):
+        """Get tiles which are not in the cache from the source
+
+        Tiles which can not be fetched are not cached and left blank.
+
+        """
+        missing = [tile for tile in tiles if tile not in self]
+        if not missing:
+            return
+        if self.offline:
+            warnings.warn('%d map tiles are not cached, these are left blank' % len(missing))
+            return
+        failed = fetch_concurrently(missing, lambda tile: self.source.fetch(*tile),
+                                    lambda tile, png: self.store(tile[0], tile[1], tile[2], png),
+                                    self.n_workers)
+        if failed:
+            warnings.warn('%d map tiles could not be fetched (%s), these are left blank' %
+                          (len(failed), describe_errors(failed)))
+
+    def get_tiles(self, tiles):
+        """Get many tiles
+
+        :param tiles: list of (x, y, z) tuples.
+        :return: dictionary with the PIL image for each tile, tiles which
+                 are not available (offline) are left out.
+
+        """
+        self.fetch_missing(tiles)
+        return {tile: png_to_image(self.read(*tile)) for tile in tiles if tile in self}
+
+
+def fetch_map(box, z, tiles=None):
     """Fetch OSM tiles composing a box at a given zoom level, and
-    return the assembled PIL image."""
+    return the assembled PIL image.
+
+    :param tiles: tile provider, defaults to a TileCache for the tile
+                  server.
+
+    """
     box = correct_box(box, z)
     x0, y0, x1, y1 = box
     sx, sy = get_box_size(box)
@@ -60,11 +205,14 @@ def fetch_map(box, z):
         raise Exception(("You are requesting a very large map, beware of "
                          "OpenStreetMap tile usage policy "
                          "(http://wiki.openstreetmap.org/wiki/Tile_usage_policy)."))
+    if tiles is None:
+        tiles = TileCache()
+    images = tiles.get_tiles([(x, y, z) for x in range(x0, x1 + 1)
+                              for y in range(y0, y1 + 1)])
     img = Image.new('RGB', (sx * TILE_SIZE, sy * TILE_SIZE))
-    for x in range(x0, x1 + 1):
-        for y in range(y0, y1 + 1):
-            px, py = TILE_SIZE * (x - x0), TILE_SIZE * (y - y0)
-            img.paste(fetch_tile(x, y, z), (px, py))
+    for (x, y, _), tile in images.items():
+        px, py = TILE_SIZE * (x - x0), TILE_SIZE * (y - y0)
+        img.paste(tile, (px, py))
     return img
 
 
@@ -270,10 +418,12 @@ class Map(object):
         coordinates.
 
         Can be called with `Map(box, z=z)` or `Map(lat, lon, z=z)`.
+        Use `tiles` to give a tile provider, e.g. an offline TileCache.
 
         """
         z = kwargs.get('z', 18)
         margin = kwargs.get('margin', .05)
+        self.tiles = kwargs.get('tiles')
 
         box = _box(*args)
         if margin is not None:
@@ -322,7 +472,7 @@ class Map(object):
     def fetch(self):
         """Fetch the image from OSM's servers."""
         if self.img is None:
-            self.img = fetch_map(self.box_tile, self.z)
+            self.img = fetch_map(self.box_tile, self.z, self.tiles)
         self.w, self.h = self.img.size
         return self.img
 
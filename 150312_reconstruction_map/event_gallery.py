@@ -0,0 +1 @@
+../150220_reconstruction_display/event_gallery.py
\ No newline at end of file
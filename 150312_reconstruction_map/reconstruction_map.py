@@ -8,21 +8,15 @@ from smopy import TILE_SIZE, Map, num2deg
 from artist import Plot
 
 from sapphire import CoincidenceQuery, HiSPARCStations, Station
-from sapphire.analysis import event_utils
 from sapphire.transformations import geographic
 
+from event_gallery import detector_layout, read_displays, render_gallery
+from timing_offsets import TimingOffsets
+
 COIN_DATA = '/Users/arne/Datastore/esd_coincidences/coincidences_n7_120101_140801.h5'
-OFFSETS = {501: [-1.10338, 0.0000, 5.35711, 3.1686],
-           502: [-8.11711, -8.5528, -8.72451, -9.3388],
-           503: [-22.9796, -26.6098, -22.7522, -21.8723],
-           504: [-15.4349, -15.2281, -15.1860, -16.5545],
-           505: [-21.6035, -21.3060, -19.6826, -25.5366],
-           506: [-20.2320, -15.8309, -14.1818, -14.1548],
-           508: [-26.2402, -24.9859, -24.0131, -23.2882],
-           509: [-24.8369, -23.0218, -20.6011, -24.3757]}
-DETECTOR_IDS = [0, 1, 2, 3]
 STATIONS = [501, 502, 503, 504, 505, 506, 508, 509]
 CLUSTER = HiSPARCStations(STATIONS)
+OFFSETS = TimingOffsets.from_api(STATIONS, CLUSTER)
 COLORS = ['black', 'red!80!black', 'green!80!black', 'blue!80!black']
 
 
@@ -40,28 +34,29 @@ def make_map(cluster=CLUSTER):
     return map
 
 
-def display_coincidences(coincidence_events, reconstruction, c_id, map):
+def display_coincidences(display, layout, map, cluster_lla):
+    """Make an event display on a map
 
-    cluster = CLUSTER
+    :param display: coincidence display, see event_gallery.read_displays.
+    :param layout: detector layout, see event_gallery.detector_layout.
+    :param map: smopy Map of the cluster.
+    :param cluster_lla: reference position of the cluster coordinates.
 
-    ts0 = coincidence_events[0][1]['ext_timestamp']
+    """
+    reconstruction = display['reconstruction']
+    ts0 = display['ext_timestamp']
 
     latitudes = []
     longitudes = []
     t = []
     p = []
 
-    for station_number, event in coincidence_events:
-        if station_number == 507:
-            continue
-        station = cluster.get_station(station_number)
-        for detector in station.detectors:
-            latitude, longitude, _ = detector.get_lla_coordinates()
-            latitudes.append(latitude)
-            longitudes.append(longitude)
-        t.extend(event_utils.relative_detector_arrival_times(
-            event, ts0, DETECTOR_IDS, offsets=OFFSETS[station_number]))
-        p.extend(event_utils.detector_densities(event, DETECTOR_IDS))
+    for station_number, st, sp in zip(display['stations'], display['t'], display['p']):
+        lla = layout[station_number]['lla']
+        latitudes.extend(lla[:, 0])
+        longitudes.extend(lla[:, 1])
+        t.extend(st[:len(lla)])
+        p.extend(sp[:len(lla)])
 
     image = map.to_pil()
 
@@ -96,7 +91,7 @@ def display_coincidences(coincidence_events, reconstruction, c_id, map):
     core_x = reconstruction['x']
     core_y = reconstruction['y']
 
-    transform = geographic.FromWGS84ToENUTransformation(cluster.lla)
+    transform = geographic.FromWGS84ToENUTransformation(cluster_lla)
     core_lat, core_lon, _ = transform.enu_to_lla((core_x, core_y, 0))
     core_x, core_y = map.to_pixels(core_lat, core_lon)
 
@@ -131,7 +126,7 @@ def display_coincidences(coincidence_events, reconstruction, c_id, map):
 #     plot.set_xlabel('x [\si{\meter}]')
 #     plot.set_ylabel('y [\si{\meter}]')
 
-    plot.save_as_pdf('coincidences/event_display_%d_%d' % (c_id, ts0))
+    plot.save_as_pdf('coincidences/event_display_%d_%d' % (display['id'], ts0))
 
 
 def plot_traces(coincidence_events):
@@ -172,13 +167,14 @@ def plot_traces(coincidence_events):
 
 if __name__ == '__main__':
     map = make_map(CLUSTER)
+    layout = detector_layout(CLUSTER)
     with tables.open_file(COIN_DATA, 'r') as data:
+#         c_ids = data.root.coincidences.coincidences.get_where_list(
+#             ' & '.join('s%d' % station for station in STATIONS))[10:100]
+        displays = read_displays(data, [1999], STATIONS, OFFSETS, layout)
+
         cq = CoincidenceQuery(data)
-#         coincidences = cq.all(STATIONS)
-#         for coincidence in coincidences[10:100]:
         coincidence = cq.coincidences[1999]
         coincidence_events = next(cq.events_from_stations([coincidence], STATIONS))
-        reconstruction = cq._get_reconstruction(coincidence)
-        display_coincidences(coincidence_events, reconstruction, coincidence['id'], map)
-
         plot_traces(coincidence_events)
+    render_gallery(display_coincidences, displays, layout, map, CLUSTER.lla)
@@ -0,0 +1,168 @@
+"""Time dependent timing offsets for reconstructions
+
+The best offsets (detector offsets combined with the station offsets via
+the best path between stations) of a set of stations are determined once
+for every timestamp at which any of the offsets changes, giving one
+sorted timeline per station. The offsets for any number of timestamps
+are then looked up at once with `searchsorted`.
+
+Offsets of a simulated cluster (which do not change over time) can be
+wrapped in the same interface, so the scripts use the same code for
+simulations and for measured data.
+
+For sapphire reconstructions the lookup is done by a direction
+reconstruction class, instead of determining the offsets for every day
+via the API::
+
+    timing_offsets = TimingOffsets.from_api(STATIONS)
+    rec = ReconstructESDCoincidences(data)
+    rec.direction = CoincidenceDirectionReconstructionOffsets(rec.cluster, timing_offsets)
+    rec.reconstruct_and_store(STATIONS)
+
+"""
+import itertools
+
+from numpy import array, concatenate, full, nan, searchsorted, unique, zeros
+
+from sapphire import HiSPARCStations, Station
+from sapphire.analysis.direction_reconstruction import CoincidenceDirectionReconstruction
+
+# Messages of the error the sapphire API raises if there is no data, e.g.
+# station offsets for a pair of stations which are not compared. The error
+# is a plain Exception, or a RuntimeError in newer versions.
+NO_DATA_MESSAGES = ("Couldn't find requested data locally.",
+                    "Couldn't get requested data from server nor find it locally.")
+
+
+def is_no_data_error(error):
+    return type(error) in (Exception, RuntimeError) and str(error) in NO_DATA_MESSAGES
+
+
+def available_station_offsets(stations):
+    """Station offsets of all pairs of stations for which these exist
+
+    Only pairs without station offsets are skipped, other errors are
+    raised.
+
+    :param stations: dictionary with a Station object for each station.
+    :return: list of station offset arrays.
+
+    """
+    offsets = []
+    for sn1, sn2 in itertools.combinations(sorted(stations), 2):
+        try:
+            offsets.append(stations[sn2].station_timing_offsets(sn1))
+        except Exception as error:
+            if not is_no_data_error(error):
+                raise
+    return offsets
+
+
+def lookup(timestamps, table_timestamps):
+    """Index of the entry valid at each timestamp
+
+    The last entry at or before the timestamp, the first for earlier
+    timestamps.
+
+    """
+    idx = searchsorted(table_timestamps, timestamps, side='right') - 1
+    idx[idx < 0] = 0
+    return idx
+
+
+class TimingOffsets(object):
+
+    """Detector offsets including the station offset, over time
+
+    :param station_numbers: list of station numbers.
+    :param timestamps: sorted timestamps at which any offset changes.
+    :param offsets: array (timestamps x stations x 4) with the offsets.
+
+    """
+
+    def __init__(self, station_numbers, timestamps, offsets):
+        self.station_numbers = list(station_numbers)
+        self.timestamps = array(timestamps)
+        self.offsets = array(offsets)
+
+    @classmethod
+    def from_api(cls, station_numbers, cluster=None, force_stale=True):
+        """Determine the best offsets from the API for each period
+
+        The offsets are determined with `determine_best_offsets` of the
+        direction reconstruction, once for each timestamp at which any
+        detector offset or station offset changes. That combines the
+        station offsets via the best path between the stations, skipping
+        unavailable or bad station offsets. Stations without any
+        offsets get nan.
+
+        :param cluster: cluster with the stations, made if not given.
+
+        """
+        if cluster is None:
+            cluster = HiSPARCStations(station_numbers, force_stale=force_stale)
+        stations = {sn: Station(sn, force_stale=force_stale) for sn in station_numbers}
+        timestamps = unique(concatenate(
+            [stations[sn].detector_timing_offsets['timestamp'] for sn in station_numbers] +
+            [offsets['timestamp'] for offsets in available_station_offsets(stations)]))
+
+        direction = CoincidenceDirectionReconstruction(cluster)
+        offsets = full((len(timestamps), len(station_numbers), 4), nan)
+        for k, timestamp in enumerate(timestamps):
+            best_offsets = direction.determine_best_offsets(station_numbers, int(timestamp), stations)
+            for i, sn in enumerate(station_numbers):
+                station_offsets = best_offsets.get(sn, [])
+                offsets[k, i, :len(station_offsets)] = station_offsets
+        return cls(station_numbers, timestamps, offsets)
+
+    @classmethod
+    def from_cluster(cls, cluster):
+        """Use the fixed detector and GPS offsets of a (simulated) cluster"""
+
+        station_numbers = [station.number for station in cluster.stations]
+        offsets = zeros((1, len(station_numbers), 4))
+        for i, station in enumerate(cluster.stations):
+            offsets[0, i, :len(station.detectors)] = [detector.offset + station.gps_offset
+                                                      for detector in station.detectors]
+        return cls(station_numbers, [0], offsets)
+
+    def lookup(self, timestamps):
+        """Get the offsets for many timestamps at once
+
+        :param timestamps: array of timestamps (seconds).
+        :return: array (timestamps x stations x 4) with the offsets.
+
+        """
+        return self.offsets[lookup(array(timestamps), self.timestamps)]
+
+    def periods(self, timestamps):
+        """Index of the set of offsets valid at each timestamp
+
+        Timestamps with the same index use the same offsets, see
+        `offsets_for_period`.
+
+        """
+        return lookup(array(timestamps), self.timestamps)
+
+    def offsets_for_period(self, idx):
+        """Dictionary with the offsets of each station for a period"""
+
+        return {sn: self.offsets[idx, i].tolist()
+                for i, sn in enumerate(self.station_numbers)}
+
+    def offsets_at(self, timestamp):
+        """Dictionary with the offsets of each station at a timestamp"""
+
+        return self.offsets_for_period(self.periods([timestamp])[0])
+
+
+class CoincidenceDirectionReconstructionOffsets(CoincidenceDirectionReconstruction):
+
+    """Use preloaded time dependent offsets instead of the API"""
+
+    def __init__(self, cluster, timing_offsets):
+        super(CoincidenceDirectionReconstructionOffsets, self).__init__(cluster)
+        self.timing_offsets = timing_offsets
+
+    def determine_best_offsets(self, station_numbers, ts0, offsets):
+        return self.timing_offsets.offsets_at(ts0)
@@ -0,0 +1 @@
+../160307_check_reconstructions/parallel_reconstruction.py
\ No newline at end of file
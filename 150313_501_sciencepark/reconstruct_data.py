@@ -3,19 +3,28 @@ import tables
 
 from artist import Plot
 
-from sapphire import CoincidenceQuery, ReconstructESDCoincidences, ReconstructESDEvents
+from sapphire import CoincidenceQuery, ReconstructESDEvents
 from sapphire.utils import angle_between
 
+from direction_lut import EventDirectionReconstructionLUT
+from parallel_reconstruction import reconstruct_and_store_parallel
+
 DATA_PATH = '/Users/arne/Datastore/esd_coincidences/coincidences_n7_100101_140801.h5'
 
 
-def reconstruct_data(data):
+def reconstruct_data(path):
+
+    reconstruct_and_store_parallel(path, overwrite=True)
+
+    with tables.open_file(path, 'a') as data:
+        reconstruct_station_data(data)
+
 
-    rec = ReconstructESDCoincidences(data, overwrite=True)
-    rec.reconstruct_and_store()
+def reconstruct_station_data(data):
 
     station_path = '/hisparc/cluster_amsterdam/station_501'
     rec = ReconstructESDEvents(data, station_path, 501, overwrite=True)
+    rec.direction = EventDirectionReconstructionLUT(rec.station)
     # rec.reconstruct_and_store()
     rec.prepare_output()
     rec.offsets = [-1.10338, 0.0000, 5.35711, 3.1686]
@@ -88,7 +97,6 @@ def analyse_reconstructions(data):
 
 
 if __name__ == '__main__':
-    # with tables.open_file(DATA_PATH, 'a') as data:
-    #     reconstruct_data(data)
+    # reconstruct_data(DATA_PATH)
     with tables.open_file(DATA_PATH, 'r') as data:
         analyse_reconstructions(data)
@@ -0,0 +1,187 @@
+"""Histograms of the particle counts of all detector pairs
+
+For each cut on the average number of particles (minn) and each pair of
+detectors a 2D histogram of the log10 of the particle counts is needed.
+Instead of reading the columns and making a `histogram2d` for each plot,
+all histograms are counted in a single pass over the events. The bin
+indices of each value are determined once and combined into a single
+index (cut, pair, x bin, y bin), which is counted with `bincount`.
+
+The histograms are stored next to the events table so they only need to
+be made once, with the sums of the particle counts to check that the
+events did not change. A plot for a pair and cut is then a slice of the
+counts::
+
+    histograms = DensityHistograms.from_file(data, '/s501')
+    counts, x, y = histograms.histogram(minn=2, i=1, j=0)
+
+"""
+import tables
+
+from numpy import array, bincount, linspace, log10, searchsorted, zeros
+
+HISTOGRAM_GROUP = 'density_histograms'
+N_MIN = 0.5  # remove gamma peak
+N_MAX = 50
+N_EDGES = 60
+MINN_CUTS = [0, 1, 2, 4, 8, 16]
+CHUNKSIZE = 100000
+
+# Detector pairs (i, j) with i >= j, for i == j the average number of
+# particles is compared to detector i.
+PAIRS = [(i, j) for i in range(4) for j in range(4) if i >= j]
+X_COLUMNS = [0 if i == j else i + 1 for i, j in PAIRS]
+Y_COLUMNS = [i + 1 if i == j else j + 1 for i, j in PAIRS]
+
+
+def bin_indices(values, edges):
+    """Bin index of each value, like `histogram`
+
+    The last bin includes its right edge.
+
+    :return: bin indices and a mask of the values inside the bins.
+
+    """
+    n_bins = len(edges) - 1
+    indices = searchsorted(edges, values, side='right') - 1
+    indices[values == edges[-1]] = n_bins - 1
+    valid = (indices >= 0) & (indices < n_bins)
+    return indices, valid
+
+
+def histogram_counts(n, edges, cuts=MINN_CUTS):
+    """Count the events of each cut, pair and bin combination
+
+    Each event is only counted for the highest cut it passes.
+
+    :param n: array (4 x events) with the number of particles.
+    :param edges: bin edges, for the log10 of the number of particles.
+    :param cuts: sorted cuts on the average number of particles.
+    :return: flat array of counts, see `DensityHistograms.from_events`.
+
+    """
+    n_bins = len(edges) - 1
+    average_n = (n[0] + n[1] + n[2] + n[3]) / 4.
+    level = searchsorted(cuts, average_n, side='left') - 1
+    selected = (level >= 0) & (n > 0).all(axis=0)
+
+    log_n = log10(array([average_n.compress(selected)] + [n_i.compress(selected) for n_i in n]))
+    indices, valid = bin_indices(log_n, edges)
+    counted = valid[X_COLUMNS] & valid[Y_COLUMNS]
+    combined = (((level.compress(selected) * len(PAIRS) + array(range(len(PAIRS)))[:, None]) *
+                 n_bins + indices[X_COLUMNS]) * n_bins + indices[Y_COLUMNS])
+    return bincount(combined[counted], minlength=len(cuts) * len(PAIRS) * n_bins ** 2)
+
+
+def read_chunks(events, chunksize=CHUNKSIZE):
+    """Iterate over the particle counts (4 x events) in chunks"""
+
+    for start in range(0, events.nrows, chunksize):
+        yield array([events.read(start, start + chunksize, field='n%d' % (i + 1))
+                     for i in range(4)])
+
+
+def column_sums(events, chunksize=CHUNKSIZE):
+    """Sum of the particle counts of each detector, as fingerprint"""
+
+    sums = zeros(4)
+    for n in read_chunks(events, chunksize):
+        sums += n.sum(axis=1)
+    return sums.tolist()
+
+
+class DensityHistograms(object):
+
+    """Particle count histograms for each cut and detector pair
+
+    :param counts: array (cuts x pairs x bins x bins) of counts.
+    :param edges: bin edges, for the log10 of the number of particles.
+    :param cuts: cuts on the average number of particles, events pass a
+                 cut if the average number of particles is larger.
+    :param nrows: number of events in the events table.
+    :param sums: sum of the particle counts of each detector, to recognize
+                 changed events.
+
+    """
+
+    def __init__(self, counts, edges, cuts, nrows, sums):
+        self.counts = counts
+        self.edges = edges
+        self.cuts = list(cuts)
+        self.nrows = nrows
+        self.sums = list(sums)
+
+    @classmethod
+    def from_events(cls, events, edges=None, cuts=MINN_CUTS, chunksize=CHUNKSIZE):
+        """Count the histograms in a single pass over the events table"""
+
+        if edges is None:
+            edges = linspace(log10(N_MIN), log10(N_MAX), N_EDGES)
+        cuts = sorted(cuts)
+        n_bins = len(edges) - 1
+        counts = zeros(len(cuts) * len(PAIRS) * n_bins ** 2, dtype=int)
+        sums = zeros(4)
+        for n in read_chunks(events, chunksize):
+            counts += histogram_counts(n, edges, cuts)
+            sums += n.sum(axis=1)
+        counts = counts.reshape(len(cuts), len(PAIRS), n_bins, n_bins)
+        # Events passing a cut also pass all lower cuts
+        counts = counts[::-1].cumsum(axis=0)[::-1]
+        return cls(counts, edges, cuts, events.nrows, sums.tolist())
+
+    @classmethod
+    def from_file(cls, data, group, edges=None, cuts=MINN_CUTS):
+        """Get the histograms for a station group, stored or freshly made
+
+        The stored histograms are used if they were made for the same
+        number of events, bins and cuts, and the sums of the particle
+        counts are unchanged. New histograms are stored if the file is
+        writable.
+
+        :param data: the PyTables datafile.
+        :param group: path to the group containing the events table.
+
+        """
+        if edges is None:
+            edges = linspace(log10(N_MIN), log10(N_MAX), N_EDGES)
+        events = data.get_node(group, 'events')
+        try:
+            node = data.get_node(group, HISTOGRAM_GROUP)
+            stored_edges = node.edges.read()
+            if (node._v_attrs.nrows == events.nrows and node._v_attrs.cuts == sorted(cuts) and
+                    len(stored_edges) == len(edges) and (stored_edges == edges).all() and
+                    node._v_attrs.sums == column_sums(events)):
+                return cls(node.counts.read(), stored_edges, node._v_attrs.cuts, events.nrows,
+                           node._v_attrs.sums)
+        except (tables.NoSuchNodeError, AttributeError):
+            pass
+
+        histograms = cls.from_events(events, edges, cuts)
+        if data.mode != 'r':
+            histograms.store(data, group)
+        return histograms
+
+    def store(self, data, group):
+        """Store the histograms in the station group"""
+
+        parent = data.get_node(group)
+        if HISTOGRAM_GROUP in parent:
+            data.remove_node(parent, HISTOGRAM_GROUP, recursive=True)
+        node = data.create_group(parent, HISTOGRAM_GROUP)
+        data.create_array(node, 'counts', self.counts)
+        data.create_array(node, 'edges', self.edges)
+        node._v_attrs.nrows = self.nrows
+        node._v_attrs.cuts = self.cuts
+        node._v_attrs.sums = self.sums
+        node._v_attrs.pairs = PAIRS
+
+    def histogram(self, minn, i, j):
+        """Get the histogram for a cut and detector pair
+
+        :param minn: cut on the average number of particles.
+        :param i,j: detector indices (i >= j), if i == j the average number
+                    of particles (x) is compared to detector i (y).
+        :return: counts, x edges and y edges, like `histogram2d`.
+
+        """
+        return self.counts[self.cuts.index(minn), PAIRS.index((i, j))], self.edges, self.edges
@@ -0,0 +1,204 @@
+"""Index coincidences by multiplicity and station membership
+
+The ESD coincidences table has a column with the number of stations (N)
+and a boolean column per station (s501, s502, ...). Selections like
+`(N == n) & s501 & ~s510` require a full scan of the table for each n.
+
+The index sorts the rows by N, then by a bitmask of the participating
+stations, and keeps the original (time) order within those. All
+coincidences with a given N, or a given N and exact set of stations, are
+then a contiguous slice of the index. The index is stored next to the
+coincidences table so it only needs to be built once.
+
+"""
+import re
+
+import tables
+
+from numpy import arange, array, bincount, diff, lexsort, searchsorted, uint64, zeros
+
+INDEX_GROUP = 'multiplicity_index'
+STATION_COLUMN = re.compile(r'^s(\d+)$')
+
+
+def station_columns(coincidences):
+    """Get the station numbers from the station columns of the table"""
+
+    return sorted(int(STATION_COLUMN.match(name).group(1))
+                  for name in coincidences.colnames
+                  if STATION_COLUMN.match(name))
+
+
+def station_bitmask(coincidences, stations):
+    """Combine the station columns into a single bitmask per coincidence
+
+    Station i in stations is represented by bit i.
+
+    """
+    if len(stations) > 64:
+        raise ValueError('At most 64 stations fit in the bitmask.')
+    mask = zeros(coincidences.nrows, dtype=uint64)
+    for bit, station in enumerate(stations):
+        mask |= coincidences.col('s%d' % station).astype(uint64) << uint64(bit)
+    return mask
+
+
+class CoincidenceIndex(object):
+
+    """Coincidences sorted by N and station bitmask
+
+    :param n: number of stations in each coincidence.
+    :param station_mask: station bitmask of each coincidence.
+    :param ext_timestamp: ext_timestamp of each coincidence.
+    :param stations: station numbers, in order of the bits in the mask.
+    :param order: row numbers in index order, determined if not given.
+
+    """
+
+    def __init__(self, n, station_mask, ext_timestamp, stations, order=None):
+        self.stations = list(stations)
+        if order is None:
+            # lexsort is stable, so the time order is kept within slices
+            order = lexsort((station_mask, n))
+            n = n[order]
+            station_mask = station_mask[order]
+            ext_timestamp = ext_timestamp[order]
+        self.order = order
+        self.n = n
+        self.station_mask = station_mask
+        self.ext_timestamp = ext_timestamp
+
+    @classmethod
+    def from_table(cls, coincidences):
+        """Build the index with a single read of the required columns"""
+
+        stations = station_columns(coincidences)
+        return cls(coincidences.col('N'),
+                   station_bitmask(coincidences, stations),
+                   coincidences.col('ext_timestamp'), stations)
+
+    @classmethod
+    def from_file(cls, data, coincidences_group='/coincidences'):
+        """Get the index for a coincidences group, stored or freshly built
+
+        The stored index is used if it was made for the same number of
+        coincidences. A new index is stored if the file is writable.
+
+        :param data: the PyTables datafile.
+        :param coincidences_group: path to the group containing the
+                                   coincidences table.
+
+        """
+        coincidences = data.get_node(coincidences_group, 'coincidences')
+        try:
+            group = data.get_node(coincidences_group, INDEX_GROUP)
+            if group._v_attrs.nrows == coincidences.nrows:
+                return cls(group.n.read(), group.station_mask.read(),
+                           group.ext_timestamp.read(), group._v_attrs.stations,
+                           order=group.order.read())
+        except (tables.NoSuchNodeError, AttributeError):
+            pass
+
+        index = cls.from_table(coincidences)
+        if data.mode != 'r':
+            index.store(data, coincidences_group)
+        return index
+
+    def store(self, data, coincidences_group='/coincidences'):
+        """Store the index in the coincidences group"""
+
+        parent = data.get_node(coincidences_group)
+        if INDEX_GROUP in parent:
+            data.remove_node(parent, INDEX_GROUP, recursive=True)
+        group = data.create_group(parent, INDEX_GROUP)
+        for name in ['order', 'n', 'station_mask', 'ext_timestamp']:
+            data.create_array(group, name, getattr(self, name))
+        group._v_attrs.nrows = len(self.order)
+        group._v_attrs.stations = self.stations
+
+    def bits(self, stations):
+        """Get the bitmask for a set of stations"""
+
+        mask = uint64(0)
+        for station in stations:
+            mask |= uint64(1) << uint64(self.stations.index(station))
+        return mask
+
+    def slice_for_n(self, n):
+        """Get the index slice with all coincidences with N == n"""
+
+        start, stop = searchsorted(self.n, [n, n + 1])
+        return slice(start, stop)
+
+    def slice_for_stations(self, stations):
+        """Get the index slice for coincidences of exactly these stations"""
+
+        n_slice = self.slice_for_n(len(stations))
+        mask = self.bits(stations)
+        masks = self.station_mask[n_slice]
+        start = searchsorted(masks, mask, side='left')
+        stop = searchsorted(masks, mask, side='right')
+        return slice(n_slice.start + start, n_slice.start + stop)
+
+    def select(self, n=None, include=(), exclude=()):
+        """Get index positions of coincidences matching the selection
+
+        Equivalent to `(N == n) & s_include & ~s_exclude`, but only the
+        slice for N is checked instead of the entire table.
+
+        :param n: number of stations in coincidence, None for any N.
+        :param include: stations which should be in the coincidence.
+        :param exclude: stations which should not be in the coincidence.
+        :return: positions in the index arrays, in time order.
+
+        """
+        index_slice = slice(0, len(self.n)) if n is None else self.slice_for_n(n)
+        include_mask = self.bits(include)
+        exclude_mask = self.bits(exclude)
+        masks = self.station_mask[index_slice]
+        selected = ((masks & include_mask) == include_mask) & ((masks & exclude_mask) == 0)
+        positions = arange(index_slice.start, index_slice.stop)[selected]
+        # Restore time order for selections spanning several station sets
+        return positions[self.order[positions].argsort(kind='mergesort')]
+
+    def rows(self, *args, **kwargs):
+        """Get the table row numbers for a selection, see `select`"""
+
+        return self.order[self.select(*args, **kwargs)]
+
+
+def interval_histograms(n, ext_timestamp, bins, n_values=None):
+    """Histograms of the time between consecutive coincidences for all N
+
+    The intervals for each N are determined in a single pass by stably
+    sorting on N, so consecutive coincidences with the same N remain
+    neighbours in time.
+
+    :param n: number of stations of each coincidence, in time order.
+    :param ext_timestamp: ext_timestamp of each coincidence.
+    :param bins: bin edges for the intervals (in ns).
+    :param n_values: the N values for which to return histograms,
+                     defaults to all N in the data.
+    :return: dictionary with the interval histogram for each N.
+
+    """
+    n = array(n)
+    ext_timestamp = array(ext_timestamp)
+    order = lexsort((ext_timestamp, n))
+    n = n[order]
+    dt = diff(ext_timestamp[order])
+    same_n = n[1:] == n[:-1]
+
+    n_bins = len(bins) - 1
+    bin_idx = searchsorted(bins, dt, side='right') - 1
+    # Like numpy.histogram the last bin includes its right edge
+    bin_idx[dt == bins[-1]] = n_bins - 1
+    valid = same_n & (bin_idx >= 0) & (bin_idx < n_bins)
+
+    if n_values is None:
+        n_values = sorted(set(n.tolist()))
+    max_n = n.max() + 1 if len(n) else 1
+    counts = bincount(n[1:][valid].astype('int64') * n_bins + bin_idx[valid],
+                      minlength=max_n * n_bins).reshape(max_n, n_bins)
+    return {n_value: counts[n_value] if n_value < max_n else zeros(n_bins, dtype=counts.dtype)
+            for n_value in n_values}
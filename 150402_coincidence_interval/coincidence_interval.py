@@ -8,20 +8,22 @@ Be careful with adding 510.
 """
 import tables
 
-from numpy import histogram, logspace
+from numpy import logspace
 
 from artist import Plot
 
+from coincidence_index import CoincidenceIndex, interval_histograms
+
 COIN_PATH = '/Users/arne/Datastore/esd_coincidences/sciencepark_n2_100101_150401.h5'
 
 
-def plot_coincidence_intervals(coincidences):
+def plot_coincidence_intervals(index):
     plot = Plot(axis='semilogx')
     bins = logspace(7, 15, 150)
     minn, maxn = (2, 10)
+    n_counts = coincidence_interval_histograms(index, bins, range(minn, maxn + 1))
     for n in range(minn, maxn + 1):
-        dt = coincidence_interval(coincidences, n)
-        counts, bins = histogram(dt, bins=bins)
+        counts = n_counts[n]
         # The counts are multiplied by 3 ** n to make them more similar in size
         # Difference are cause by energy spectrum, station uptime and positions
         greyness = r'black!%d' % (n * 100 / maxn)
@@ -34,17 +36,25 @@ def plot_coincidence_intervals(coincidences):
     plot.save_as_pdf('coincidence_intervals_501')
 
 
-def coincidence_interval(coincidences, n):
+def coincidence_interval_histograms(index, bins, n_values):
+    """Interval histograms for all N in a single pass over the selection"""
+
+    positions = index.select(include=[501], exclude=[510, 507])
+    return interval_histograms(index.n[positions],
+                               index.ext_timestamp[positions],
+                               bins, n_values)
+
+
+def coincidence_interval(index, n):
     if n == 0:
-        ets = coincidences.col('ext_timestamp')
+        ets = index.ext_timestamp[index.order.argsort()]
     else:
-        ets = coincidences.read_where('(N == n) & s501 & ~s510 & ~s507',
-                                      field='ext_timestamp')
+        ets = index.ext_timestamp[index.select(n, include=[501], exclude=[510, 507])]
     dt = ets[1:] - ets[:-1]
     return dt
 
 
 if __name__ == "__main__":
-    with tables.open_file(COIN_PATH, 'r') as data:
-        coincidences = data.root.coincidences.coincidences
-        plot_coincidence_intervals(coincidences)
+    with tables.open_file(COIN_PATH, 'a') as data:
+        index = CoincidenceIndex.from_file(data, '/coincidences')
+        plot_coincidence_intervals(index)
@@ -0,0 +1 @@
+../150930_coincidences_distance/distance_matrix.py
\ No newline at end of file
@@ -9,18 +9,23 @@ real physics.
 """
 import tables
 
-from numpy import histogram, linspace, pi, random, sin
+from numpy import histogram, linspace, pi
 
 from artist import Plot
 
 from sapphire import FlatFrontSimulation, HiSPARCStations, ReconstructESDEvents
 
+from shower_parameters import PregeneratedParametersMixin, SkewedAzimuth
+
 RESULT_PATH = 'skewed_azimuth.h5'
 
 
-class OffsetAzimuthFlatFrontSimulation(FlatFrontSimulation):
+class OffsetAzimuthFlatFrontSimulation(PregeneratedParametersMixin, FlatFrontSimulation):
 
-    """
+    """Flat front simulation with a skewed azimuth distribution
+
+    The azimuths of all showers are generated at once, see
+    :class:`shower_parameters.SkewedAzimuth`.
 
     :param cluster: :class:`~sapphire.clusters.BaseCluster` instance.
     :param datafile: writeable PyTables file handle.
@@ -30,28 +35,7 @@ class OffsetAzimuthFlatFrontSimulation(FlatFrontSimulation):
 
     """
 
-    @staticmethod
-    def generate_azimuth():
-        """Generate a random azimuth
-
-        Showers have a slanted azimuth distribution.
-
-        Idea from: http://math.stackexchange.com/a/499415
-
-        50% of the samples have a uniform distribution.
-        The other 50% have a sin(phi)**2 distribution.
-
-        """
-        if random.choice([True, False], p=[.4, .6]):
-            x = random.uniform(0, pi / 2)
-            y = random.uniform(0, 1)
-            if not sin(x) ** 2 > y:
-                x += pi / 2
-            value = 2 * x - pi
-        else:
-            value = random.uniform(-pi, pi)
-
-        return value
+    azimuth_distribution = SkewedAzimuth(fraction=.4)
 
     def simulate_detector_response(self, detector, shower_parameters):
         """Simulate detector response to a shower.
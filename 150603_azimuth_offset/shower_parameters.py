@@ -0,0 +1,126 @@
+"""Vectorized shower parameter distributions for simulations
+
+The sapphire simulations draw the azimuth, zenith and core position of
+each shower with a separate call. For custom distributions (e.g. using
+rejection sampling) doing this one shower at a time in Python is slow.
+Here distributions are objects with a `sample(n)` method which returns n
+values at once. The mixin pre-generates the values for all showers and
+the generate methods simply return the next value.
+
+Example::
+
+    class SkewedSimulation(PregeneratedParametersMixin, FlatFrontSimulation):
+        azimuth_distribution = SkewedAzimuth()
+
+"""
+from numpy import arcsin, column_stack, cos, pi, random, sin, sqrt, where
+
+
+class UniformAzimuth(object):
+
+    """Uniform azimuth distribution between -pi and pi"""
+
+    def sample(self, n):
+        return random.uniform(-pi, pi, n)
+
+
+class SkewedAzimuth(object):
+
+    """Azimuth distribution with a preference for some directions
+
+    Idea from: http://math.stackexchange.com/a/499415
+
+    A fraction of the samples has a sin(phi) ** 2 distribution, the others
+    have a uniform distribution.
+
+    :param fraction: fraction of samples with the skewed distribution.
+
+    """
+
+    def __init__(self, fraction=.4):
+        self.fraction = fraction
+
+    def sample(self, n):
+        skewed = random.uniform(0, 1, n) < self.fraction
+        x = random.uniform(0, pi / 2, n)
+        y = random.uniform(0, 1, n)
+        x = where(sin(x) ** 2 > y, x, x + pi / 2)
+        return where(skewed, 2 * x - pi, random.uniform(-pi, pi, n))
+
+
+class IsotropicZenith(object):
+
+    """Zenith distribution for an isotropic flux on a flat detector
+
+    The probability is proportional to sin(theta) cos(theta), sampled
+    using the inverse of the cumulative distribution.
+
+    :param min,max: limits of the zenith angle.
+
+    """
+
+    def __init__(self, min=0, max=pi / 3.):
+        self.min = min
+        self.max = max
+
+    def sample(self, n):
+        p = random.uniform(0, 1, n)
+        low = sin(self.min) ** 2
+        high = sin(self.max) ** 2
+        return arcsin(sqrt(low + p * (high - low)))
+
+
+class UniformCore(object):
+
+    """Core positions uniformly distributed in a circle
+
+    :param max_distance: radius of the circle.
+
+    """
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+
+    def sample(self, n):
+        r = self.max_distance * sqrt(random.uniform(0, 1, n))
+        phi = random.uniform(-pi, pi, n)
+        return column_stack((r * cos(phi), r * sin(phi)))
+
+
+class PregeneratedParametersMixin(object):
+
+    """Draw shower parameters from pre-generated samples
+
+    Set any of the distribution attributes to an object with a `sample`
+    method, parameters without a distribution are generated by the
+    simulation class as usual. The values for all N showers of the
+    simulation are generated at once.
+
+    """
+
+    azimuth_distribution = None
+    zenith_distribution = None
+    core_distribution = None
+
+    def _next_value(self, name, distribution):
+        samples = self.__dict__.setdefault('_samples', {})
+        values, idx = samples.get(name, ([], 0))
+        if idx >= len(values):
+            values, idx = distribution.sample(getattr(self, 'N', 1)), 0
+        samples[name] = (values, idx + 1)
+        return values[idx]
+
+    def generate_azimuth(self, *args, **kwargs):
+        if self.azimuth_distribution is None:
+            return super(PregeneratedParametersMixin, self).generate_azimuth(*args, **kwargs)
+        return self._next_value('azimuth', self.azimuth_distribution)
+
+    def generate_zenith(self, *args, **kwargs):
+        if self.zenith_distribution is None:
+            return super(PregeneratedParametersMixin, self).generate_zenith(*args, **kwargs)
+        return self._next_value('zenith', self.zenith_distribution)
+
+    def generate_core_position(self, *args, **kwargs):
+        if self.core_distribution is None:
+            return super(PregeneratedParametersMixin, self).generate_core_position(*args, **kwargs)
+        return self._next_value('core', self.core_distribution)
@@ -0,0 +1,100 @@
+"""Fetch items which are not yet in a local cache concurrently
+
+The trace, station histogram and map tile caches all request many
+independent items from a web service. The items are requested by a
+bounded pool of threads and handed to the cache as they come in, so all
+writes happen in the calling thread. A request which fails because of
+the network or invalid data does not abort the others, failed items are
+not stored but returned with their error, so they are requested again
+next time. Other errors (bugs) are raised as usual::
+
+    failed = fetch_urls(todo, get_url, cache.store, parse=json.loads)
+
+"""
+import zlib
+
+from multiprocessing.pool import ThreadPool
+
+from six.moves.http_client import HTTPException
+from six.moves.urllib.error import HTTPError, URLError
+from six.moves.urllib.request import urlopen
+
+N_WORKERS = 8
+# Network errors and invalid data, other errors are not caught
+FETCH_ERRORS = (IOError, URLError, HTTPError, HTTPException, ValueError, zlib.error)
+
+
+def download(url, parse=None, missing=False):
+    """Download the data at an url
+
+    :param parse: function to convert the downloaded data.
+    :param missing: if True, a 404 response is not an error and None is
+                    returned, e.g. for days without data.
+
+    """
+    try:
+        data = urlopen(url).read()
+    except HTTPError as e:
+        if missing and e.code == 404:
+            return None
+        raise
+    if parse is None:
+        return data
+    return parse(data)
+
+
+def fetch_missing(keys, get, store, n_workers=N_WORKERS):
+    """Get the values for keys concurrently and store them
+
+    :param keys: list of keys which are not yet cached.
+    :param get: function which gets the value for a key, called from the
+                worker threads.
+    :param store: function called with a key and its value, only called
+                  from this thread.
+    :param n_workers: maximum number of concurrent requests.
+    :return: dictionary with the error for each key for which getting the
+             value failed.
+
+    """
+    failed = {}
+    if not keys:
+        return failed
+
+    def get_value(key):
+        try:
+            return key, get(key), None
+        except FETCH_ERRORS as error:
+            return key, None, error
+
+    worker_pool = ThreadPool(min(n_workers, len(keys)))
+    try:
+        # Store results as they come in, writes only happen in this thread
+        for key, value, error in worker_pool.imap_unordered(get_value, keys):
+            if error is not None:
+                failed[key] = error
+            else:
+                store(key, value)
+    finally:
+        worker_pool.close()
+        worker_pool.join()
+    return failed
+
+
+def fetch_urls(keys, get_url, store, parse=None, missing=False, n_workers=N_WORKERS):
+    """Download the values for keys concurrently and store them
+
+    :param get_url: function which returns the url for a key.
+    :param parse,missing: see `download`.
+    :return: dictionary with the error for each key for which the
+             download failed.
+
+    """
+    return fetch_missing(keys, lambda key: download(get_url(key), parse, missing), store,
+                         n_workers)
+
+
+def describe_errors(failed):
+    """The distinct errors of the failed keys, for warnings"""
+
+    return '; '.join(sorted(set('%s: %s' % (type(error).__name__, error)
+                                for error in failed.values())))
@@ -4,7 +4,7 @@ from numpy import any, arange, histogram
 
 from artist import Plot
 
-from sapphire import Station
+from trace_cache import TraceCache, event_traces
 
 COLORS = ['black', 'red!80!black', 'green!80!black', 'blue!80!black']
 
@@ -21,10 +21,12 @@ def plot_n_peaks_histogram(events, station):
 def plot_traces_with_many_peaks(events, station, min_peaks=10):
     filter = any(events.col('n_peaks') > min_peaks, axis=1)
     neve = events.read_coordinates(filter)
-    s = Station(station)
-    for event in neve:
+    with TraceCache() as cache:
+        all_traces = event_traces(cache, station, neve, raw=True)
+    for event, traces in zip(neve, all_traces):
+        if traces is None:
+            continue
         plot = Plot()
-        traces = s.event_trace(event['timestamp'], event['nanoseconds'], raw=True)
         for j, trace in enumerate(traces):
             t = arange(0, (2.5 * len(traces[0])), 2.5)
             plot.plot(t, trace, mark=None, linestyle=COLORS[j])
@@ -15,15 +15,21 @@ from numpy import arange
 
 from artist import Plot
 
-from sapphire import Station
+from trace_cache import TraceCache, event_traces
 
 COLORS = ['black', 'red!80!black', 'green!80!black', 'blue!80!black']
 
 
-def plot_traces(event, station):
-    s = Station(station)
+def plot_events_traces(events, station):
+    with TraceCache() as cache:
+        all_traces = event_traces(cache, station, events, raw=True)
+    for event, traces in zip(events, all_traces):
+        if traces is not None:
+            plot_traces(event, traces, station)
+
+
+def plot_traces(event, traces, station):
     plot = Plot()
-    traces = s.event_trace(event['timestamp'], event['nanoseconds'], raw=True)
     for j, trace in enumerate(traces):
         t = arange(0, (2.5 * len(traces[0])), 2.5)
         plot.plot(t, trace, mark=None, linestyle=COLORS[j])
@@ -50,11 +56,9 @@ if __name__ == "__main__":
         query = ' | '.join(['((t%d > 0) & (t%d < 900))' % (i, i) for i in range(1, 5)])
         pre_events = events.read_where(query)
         print len(pre_events)
-        for event in pre_events:
-            plot_traces(event, station)
+        plot_events_traces(pre_events, station)
 
         t_trigger_events = pre_events.read_where('(t_trigger != -999_ & (t_trigger < 1000)')
         t_trigger_events.sort(order='t_trigger')
         print len(t_trigger_events)
-        for event in t_trigger_events:
-            plot_traces(event, station)
+        plot_events_traces(t_trigger_events, station)
@@ -0,0 +1,174 @@
+"""Fetch event traces in bulk and keep them in a local cache
+
+`Station.event_trace` requests the traces of a single event from the
+public data API, every script and every rerun does these requests again.
+Here the requested (station, timestamp, nanoseconds) triples are grouped,
+the traces which are not yet in the local cache are fetched concurrently
+(with a bounded number of connections), and all fetched traces are stored
+in a PyTables file, keyed by station and ext_timestamp.
+
+Example::
+
+    with TraceCache(TRACE_CACHE_PATH) as cache:
+        traces = fetch_traces(cache, [(501, ts, ns), (502, ts, ns)])
+        traces[(501, ts * int(1e9) + ns)]
+
+"""
+import json
+import warnings
+
+import tables
+
+from numpy import array, uint64
+
+from cached_fetch import N_WORKERS, describe_errors, fetch_urls
+
+API_BASE = 'http://data.hisparc.nl/api/'
+TRACE_URL = 'station/{station_number}/trace/{ext_timestamp}/'
+TRACE_CACHE_PATH = '/Users/arne/Datastore/traces/trace_cache.h5'
+
+
+class TraceRow(tables.IsDescription):
+    ext_timestamp = tables.UInt64Col(pos=0)
+    n_channels = tables.UInt8Col(pos=1)
+
+
+class TraceCache(object):
+
+    """Persistent store of event traces
+
+    For each station there is a table with the ext_timestamps and number
+    of channels, and a variable length array with the flattened traces.
+    Raw and filtered traces are kept in separate groups.
+
+    """
+
+    def __init__(self, path=TRACE_CACHE_PATH):
+        self.data = tables.open_file(path, 'a')
+        self._index = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def _group_path(self, station, raw):
+        return '/%s/s%d' % ('raw' if raw else 'filtered', station)
+
+    def _get_index(self, station, raw):
+        """Map of ext_timestamp to row number for a station"""
+
+        key = (station, raw)
+        if key not in self._index:
+            try:
+                table = self.data.get_node(self._group_path(station, raw), 'index')
+                ext_timestamps = table.col('ext_timestamp').tolist()
+            except tables.NoSuchNodeError:
+                ext_timestamps = []
+            self._index[key] = {ets: row for row, ets in enumerate(ext_timestamps)}
+        return self._index[key]
+
+    def __contains__(self, key):
+        station, ext_timestamp, raw = key
+        return int(ext_timestamp) in self._get_index(station, raw)
+
+    def get(self, station, ext_timestamp, raw=True):
+        """Get traces from the cache
+
+        :return: array with a trace per channel, or None if not cached.
+
+        """
+        row = self._get_index(station, raw).get(int(ext_timestamp))
+        if row is None:
+            return None
+        group = self.data.get_node(self._group_path(station, raw))
+        n_channels = group.index[row]['n_channels']
+        return group.traces[row].reshape(n_channels, -1)
+
+    def store(self, station, ext_timestamp, traces, raw=True):
+        """Add traces to the cache"""
+
+        index = self._get_index(station, raw)
+        if int(ext_timestamp) in index:
+            return
+        path = self._group_path(station, raw)
+        try:
+            group = self.data.get_node(path)
+        except tables.NoSuchNodeError:
+            where, name = path.rsplit('/', 1)
+            group = self.data.create_group(where, name, createparents=True)
+            self.data.create_table(group, 'index', TraceRow)
+            self.data.create_vlarray(group, 'traces', tables.Int16Atom())
+        traces = array(traces, dtype='int16')
+        group.index.append([(uint64(ext_timestamp), len(traces))])
+        group.traces.append(traces.ravel())
+        index[int(ext_timestamp)] = group.index.nrows - 1
+
+    def flush(self):
+        self.data.flush()
+
+
+def get_ext_timestamp(timestamp, nanoseconds):
+    return int(timestamp) * int(1e9) + int(nanoseconds)
+
+
+def trace_url(station, ext_timestamp, raw=True, api_base=API_BASE):
+    url = api_base + TRACE_URL.format(station_number=station, ext_timestamp=ext_timestamp)
+    if raw:
+        url += '?raw'
+    return url
+
+
+def parse_traces(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def fetch_traces(cache, events, raw=True, n_workers=N_WORKERS, api_base=API_BASE):
+    """Get the traces for many events, fetching only those not yet cached
+
+    Events for which the traces can not be fetched are not cached, their
+    traces are None.
+
+    :param cache: a TraceCache instance.
+    :param events: iterable of (station, timestamp, nanoseconds) tuples.
+    :param raw: get the raw traces (without baseline filter).
+    :param n_workers: maximum number of concurrent requests.
+    :param api_base: base url of the data API.
+    :return: dictionary with traces for each (station, ext_timestamp).
+
+    """
+    keys = sorted(set((int(station), get_ext_timestamp(ts, ns))
+                      for station, ts, ns in events))
+    todo = [(station, ext_timestamp) for station, ext_timestamp in keys
+            if (station, ext_timestamp, raw) not in cache]
+
+    try:
+        failed = fetch_urls(todo, lambda key: trace_url(key[0], key[1], raw, api_base),
+                            lambda key, traces: cache.store(key[0], key[1], traces, raw),
+                            parse=parse_traces, n_workers=n_workers)
+    finally:
+        cache.flush()
+    if failed:
+        warnings.warn('Failed to fetch the traces of %d events (%s)' %
+                      (len(failed), describe_errors(failed)))
+
+    return {(station, ext_timestamp): cache.get(station, ext_timestamp, raw)
+            for station, ext_timestamp in keys}
+
+
+def event_traces(cache, station, events, raw=True, **kwargs):
+    """Get the traces for events from a station events table
+
+    :param events: rows from an events table, with timestamp, nanoseconds
+                   and ext_timestamp columns.
+    :return: list of traces in the order of the events, None for events
+             for which the traces could not be fetched.
+
+    """
+    traces = fetch_traces(cache, [(station, event['timestamp'], event['nanoseconds'])
+                                  for event in events], raw, **kwargs)
+    return [traces[(station, int(event['ext_timestamp']))] for event in events]
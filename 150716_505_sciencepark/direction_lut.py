@@ -0,0 +1 @@
+../150728_discrete_directions/direction_lut.py
\ No newline at end of file
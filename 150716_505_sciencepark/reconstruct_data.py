@@ -5,6 +5,8 @@ from artist import Plot
 
 from sapphire import CoincidenceQuery, ReconstructESDEvents
 
+from direction_lut import EventDirectionReconstructionLUT
+
 DATA_PATH = '/Users/arne/Datastore/esd_coincidences/coincidences_n7_100101_140801.h5'
 
 
@@ -15,6 +17,7 @@ def reconstruct_data(data):
 
     station_path = '/hisparc/cluster_amsterdam/station_505'
     rec = ReconstructESDEvents(data, station_path, 505, overwrite=True)
+    rec.direction = EventDirectionReconstructionLUT(rec.station)
     rec.prepare_output()
     rec.offsets = [-0.53, 0.0, 1.64, -2.55]
     rec.store_offsets()
@@ -0,0 +1,240 @@
+"""Audit the GPS locations of all stations in the network
+
+For each station the history of GPS locations (self-surveys and manually
+entered positions) is fetched. The metadata of the stations is requested
+concurrently, all distances are then computed with array operations.
+
+A location is suspect if it jumps more than `MAX_JUMP` from the previous
+location, or if it is more than `MAX_JUMP` from the current location of
+the station. The suspect locations are collected in a report table, which
+can be stored in a PyTables file, e.g. for a nightly check::
+
+    locations, failed = fetch_gps_locations(Network().station_numbers())
+    report = audit_locations(locations)
+    store_report(report, failed)
+
+"""
+from multiprocessing.pool import ThreadPool
+from time import time
+
+import tables
+
+from numpy import arctan2, array, concatenate, cos, empty, radians, sin, sqrt, triu_indices, zeros
+
+from sapphire import Network, Station
+
+REPORT_PATH = '/Users/arne/Datastore/location_audit.h5'
+N_WORKERS = 8
+MAX_JUMP = 250.  # m
+R_EARTH = 6371e3  # m, mean radius of the earth
+WGS84_A = 6378137.  # m, semi-major axis
+WGS84_E2 = 6.69437999014e-3  # eccentricity squared
+
+
+class SuspectLocation(tables.IsDescription):
+    station = tables.UInt32Col(pos=0)
+    timestamp = tables.UInt32Col(pos=1)
+    latitude = tables.Float64Col(pos=2)
+    longitude = tables.Float64Col(pos=3)
+    altitude = tables.Float64Col(pos=4)
+    jump = tables.Float64Col(pos=5)
+    horizontal = tables.Float64Col(pos=6)
+    vertical = tables.Float64Col(pos=7)
+    distance_to_current = tables.Float64Col(pos=8)
+
+
+REPORT_DTYPE = tables.description.dtype_from_descr(SuspectLocation)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance between (arrays of) points
+
+    :param lat1,lon1,lat2,lon2: latitudes and longitudes in degrees.
+    :return: distance in m.
+
+    """
+    lat1, lon1, lat2, lon2 = radians(lat1), radians(lon1), radians(lat2), radians(lon2)
+    a = (sin((lat2 - lat1) / 2) ** 2 +
+         cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2)
+    return 2 * R_EARTH * arctan2(sqrt(a), sqrt(1 - a))
+
+
+def lla_to_ecef(latitude, longitude, altitude):
+    """Convert WGS84 coordinates to ECEF
+
+    :param latitude,longitude: arrays in degrees.
+    :param altitude: array in m.
+    :return: arrays of x, y, z in m.
+
+    """
+    lat = radians(latitude)
+    lon = radians(longitude)
+    n = WGS84_A / sqrt(1 - WGS84_E2 * sin(lat) ** 2)
+    x = (n + altitude) * cos(lat) * cos(lon)
+    y = (n + altitude) * cos(lat) * sin(lon)
+    z = (n * (1 - WGS84_E2) + altitude) * sin(lat)
+    return x, y, z
+
+
+def enu_offsets(locations, reference):
+    """East, north and up offsets of locations relative to a reference
+
+    :param locations: array with latitude, longitude and altitude fields.
+    :param reference: a single location, the origin of the ENU frame.
+    :return: array (locations x 3) with the ENU offsets in m.
+
+    """
+    x, y, z = lla_to_ecef(locations['latitude'], locations['longitude'], locations['altitude'])
+    x0, y0, z0 = lla_to_ecef(reference['latitude'], reference['longitude'], reference['altitude'])
+    dx, dy, dz = x - x0, y - y0, z - z0
+    lat = radians(reference['latitude'])
+    lon = radians(reference['longitude'])
+    east = -sin(lon) * dx + cos(lon) * dy
+    north = -sin(lat) * cos(lon) * dx - sin(lat) * sin(lon) * dy + cos(lat) * dz
+    up = cos(lat) * cos(lon) * dx + cos(lat) * sin(lon) * dy + sin(lat) * dz
+    return array([east, north, up]).T
+
+
+def pairwise_distances(locations):
+    """Haversine distances between all pairs of locations of a station
+
+    :return: the indices of the pairs (i < j) and their distances.
+
+    """
+    i, j = triu_indices(len(locations), 1)
+    distances = haversine(locations['latitude'][i], locations['longitude'][i],
+                          locations['latitude'][j], locations['longitude'][j])
+    return i, j, distances
+
+
+def get_gps_locations(station_number):
+    """Get the GPS locations of a station, sorted by timestamp
+
+    :return: station number and the locations, or None if these are not
+             available.
+
+    """
+    try:
+        locations = Station(station_number).gps_locations
+    except Exception:
+        return station_number, None
+    locations = array(locations)
+    locations.sort(order='timestamp')
+    return station_number, locations
+
+
+def fetch_gps_locations(station_numbers, n_workers=N_WORKERS):
+    """Get the GPS locations of many stations concurrently
+
+    :param station_numbers: list of station numbers.
+    :param n_workers: maximum number of concurrent requests.
+    :return: dictionary with the locations for each station, and a list
+             of stations for which no locations are available.
+
+    """
+    locations = {}
+    failed = []
+    if not station_numbers:
+        return locations, failed
+    worker_pool = ThreadPool(min(n_workers, len(station_numbers)))
+    try:
+        for station_number, station_locations in worker_pool.imap_unordered(get_gps_locations,
+                                                                            station_numbers):
+            if station_locations is None:
+                failed.append(station_number)
+            else:
+                locations[station_number] = station_locations
+    finally:
+        worker_pool.close()
+        worker_pool.join()
+    return locations, sorted(failed)
+
+
+def audit_station(station_number, locations, max_jump=MAX_JUMP):
+    """Find suspect locations of a single station
+
+    The first location is compared only to the current (latest) location.
+
+    :return: array with the REPORT_DTYPE with a row per suspect location.
+
+    """
+    if len(locations) < 2:
+        return empty(0, dtype=REPORT_DTYPE)
+
+    current = locations[-1]
+    enu = enu_offsets(locations, current)
+    steps = concatenate([zeros((1, 3)), enu[1:] - enu[:-1]])
+    jumps = concatenate([[0.], haversine(locations['latitude'][:-1], locations['longitude'][:-1],
+                                         locations['latitude'][1:], locations['longitude'][1:])])
+    to_current = haversine(locations['latitude'], locations['longitude'],
+                           current['latitude'], current['longitude'])
+    suspect = (jumps > max_jump) | (to_current > max_jump)
+
+    report = empty(suspect.sum(), dtype=REPORT_DTYPE)
+    report['station'] = station_number
+    for field in ['timestamp', 'latitude', 'longitude', 'altitude']:
+        report[field] = locations[field][suspect]
+    report['jump'] = jumps[suspect]
+    report['horizontal'] = sqrt(steps[suspect, 0] ** 2 + steps[suspect, 1] ** 2)
+    report['vertical'] = abs(steps[suspect, 2])
+    report['distance_to_current'] = to_current[suspect]
+    return report
+
+
+def audit_locations(locations, max_jump=MAX_JUMP):
+    """Find suspect locations of all stations
+
+    :param locations: dictionary with the locations for each station, see
+                      `fetch_gps_locations`.
+    :return: report array, sorted by station and timestamp.
+
+    """
+    reports = [audit_station(station_number, locations[station_number], max_jump)
+               for station_number in sorted(locations)]
+    if not reports:
+        return empty(0, dtype=REPORT_DTYPE)
+    return concatenate(reports)
+
+
+def max_location_spread(locations):
+    """Largest distance between any two locations for each station"""
+
+    spread = {}
+    for station_number, station_locations in locations.items():
+        if len(station_locations) < 2:
+            spread[station_number] = 0.
+        else:
+            spread[station_number] = pairwise_distances(station_locations)[2].max()
+    return spread
+
+
+def store_report(report, failed=(), max_jump=MAX_JUMP, path=REPORT_PATH):
+    """Store a report as a new table in the report file
+
+    Each run gets its own table, named after the time of the run. The
+    stations without locations are stored as attribute.
+
+    """
+    now = int(time())
+    with tables.open_file(path, 'a') as data:
+        table = data.create_table('/', 't%d' % now, SuspectLocation, createparents=True,
+                                  expectedrows=len(report))
+        table.append(report)
+        table.attrs.timestamp = now
+        table.attrs.failed = list(failed)
+        table.attrs.max_jump = max_jump
+
+
+def print_report(report, failed=()):
+    for station_number in failed:
+        print station_number, 'no GPS locations'
+    for row in report:
+        print ('%d\t%d\t%.5f\t%.5f\t%.1f\tjump: %.1f m (hor: %.1f m, ver: %.1f m)\tfrom current: %.1f m' %
+               tuple(row))
+
+
+if __name__ == "__main__":
+    locations, failed = fetch_gps_locations(Network().station_numbers())
+    report = audit_locations(locations)
+    print_report(report, failed)
+    store_report(report, failed)
@@ -1,46 +1,27 @@
-"""Detect stations that may have issues with GPS locations"""
+"""Detect stations that may have issues with GPS locations
 
-import itertools
+See location_audit.py for a report of the suspect locations.
 
-import numpy
+"""
 
-from sapphire import Network, Station
-
-COLORS = ['black', 'red', 'green', 'blue']
+from sapphire import Network
 
+from location_audit import fetch_gps_locations, max_location_spread
 
-def detect_problems(station):
-    try:
-        gps_locations = station.gps_locations
-    except:
-        print station.station, 'no GPS locations'
-        return
-
-    if len(gps_locations) < 2:
-        return
+COLORS = ['black', 'red', 'green', 'blue']
 
-    for p1, p2 in itertools.combinations(gps_locations, 2):
-        d = distance(p1, p2)
-        if d > .25:
-            print station.station, d
-            break
 
+def detect_problems_network(station_numbers):
+    """Check all stations, with the locations fetched concurrently"""
 
-def distance(s1, s2):
-    """
-    returns distance in km
-    """
-    R = 6371  # km Radius of earth
-    d_lat = numpy.radians(s2['latitude'] - s1['latitude'])
-    d_lon = numpy.radians(s2['longitude'] - s1['longitude'])
-    a = (numpy.sin(d_lat / 2) ** 2 + numpy.cos(numpy.radians(s1['latitude'])) *
-         numpy.cos(numpy.radians(s2['latitude'])) * numpy.sin(d_lon / 2) ** 2)
-    c = 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a))
-    distance = R * c
-    return distance
+    locations, failed = fetch_gps_locations(station_numbers)
+    for sn in failed:
+        print sn, 'no GPS locations'
+    spread = max_location_spread(locations)
+    for sn in sorted(spread):
+        if spread[sn] > 250:
+            print sn, spread[sn] / 1e3
 
 
 if __name__ == "__main__":
-    for sn in Network().station_numbers():
-        station = Station(sn)
-        detect_problems(station)
+    detect_problems_network(Network().station_numbers())
@@ -0,0 +1,171 @@
+"""Lookup table of directions for the discrete arrival times
+
+The arrival times in the detectors are sampled at 2.5 ns, so for a given
+station layout (detector positions and offsets) only a limited set of
+arrival time differences, and thus directions, is possible. Instead of
+calling the reconstruction algorithm for every event, the direction for
+each combination of time differences is reconstructed only once and
+looked up for the other events.
+
+The tables are kept per combination of detector positions and offsets.
+When the detector positions change (e.g. for a new timestamp) or other
+offsets are used a new table is made. Arrival times which are not on
+the sampling grid (e.g. simulations) are reconstructed as usual.
+
+For station reconstructions replace the direction reconstruction::
+
+    rec = ReconstructESDEvents(data, station_path, 501)
+    rec.direction = EventDirectionReconstructionLUT(rec.station)
+    rec.reconstruct_and_store()
+
+"""
+import itertools
+
+from numpy import around, array, ceil, isnan, nan
+
+from sapphire.analysis.direction_reconstruction import EventDirectionReconstruction
+from sapphire.analysis.event_utils import ERR
+from sapphire.api import Station
+from sapphire.utils import c
+
+TIME_RESOLUTION = 2.5  # nanoseconds
+
+
+class DirectionLookupTable(object):
+
+    """Directions for the discrete arrival times of a set of detectors
+
+    The table is keyed by the arrival time differences relative to the
+    first detector, in units of the time resolution. Directions are
+    reconstructed on first use, or all at once using `precompute`.
+
+    :param x,y,z: positions of the detectors.
+    :param offsets: timing offsets of the detectors.
+    :param algorithm: reconstruction algorithm with a `reconstruct_common`
+                      method.
+    :param time_resolution: sampling time of the arrival times.
+
+    """
+
+    def __init__(self, x, y, z, offsets, algorithm, time_resolution=TIME_RESOLUTION):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.offsets = array(offsets)
+        self.algorithm = algorithm
+        self.time_resolution = time_resolution
+        self.directions = {}
+
+    def key(self, t):
+        """Time differences in samples, None if not on the sampling grid
+
+        :param t: arrival times (not corrected for the offsets).
+
+        """
+        dt = (array(t[1:]) - t[0]) / self.time_resolution
+        k = around(dt)
+        if abs(dt - k).max() > 1e-6:
+            return None
+        return tuple(k.astype(int))
+
+    def reconstruct(self, t, initial=None):
+        """Reconstruct the direction for arrival times"""
+
+        return self.algorithm.reconstruct_common(array(t) - self.offsets, self.x, self.y, self.z,
+                                                 initial)
+
+    def lookup(self, t, initial=None):
+        """Get the direction for arrival times
+
+        :param t: arrival times (not corrected for the offsets).
+        :param initial: dictionary with initial values for the
+                        reconstruction, only used for arrival times which
+                        are not on the sampling grid.
+        :return: theta, phi.
+
+        """
+        key = self.key(t)
+        if key is None:
+            return self.reconstruct(t, initial)
+        if key not in self.directions:
+            self.directions[key] = self.reconstruct(t)
+        return self.directions[key]
+
+    def max_samples(self):
+        """Largest possible time difference, in samples
+
+        Based on the largest distance between the detectors and the
+        largest difference between the offsets.
+
+        """
+        positions = array([self.x, self.y, self.z]).T
+        r = max(sum((p0 - p1) ** 2) ** .5 for p0, p1 in itertools.combinations(positions, 2))
+        max_offset = self.offsets.max() - self.offsets.min()
+        return int(ceil((r / c + max_offset) / self.time_resolution))
+
+    def precompute(self):
+        """Reconstruct all possible time differences"""
+
+        n = self.max_samples()
+        for key in itertools.product(range(-n, n + 1), repeat=len(self.x) - 1):
+            if key not in self.directions:
+                t = (0.,) + tuple(k * self.time_resolution for k in key)
+                self.directions[key] = self.reconstruct(t)
+
+    def possible_directions(self):
+        """All valid directions in the table
+
+        :return: arrays of theta and phi.
+
+        """
+        directions = array([d for d in self.directions.values() if not isnan(d[0])])
+        if not len(directions):
+            return array([]), array([])
+        return directions[:, 0], directions[:, 1]
+
+
+class EventDirectionReconstructionLUT(EventDirectionReconstruction):
+
+    """Reconstruct station events using direction lookup tables
+
+    A table is made for each combination of detectors, detector positions
+    and offsets. Only the most recent `max_tables` tables are kept.
+
+    """
+
+    max_tables = 64
+
+    def __init__(self, station, time_resolution=TIME_RESOLUTION):
+        super(EventDirectionReconstructionLUT, self).__init__(station)
+        self.time_resolution = time_resolution
+        self.tables = {}
+
+    def get_table(self, detector_ids, offsets):
+        """Get the lookup table for the current detector positions"""
+
+        positions = tuple(tuple(self.station.detectors[id].get_coordinates()) for id in detector_ids)
+        detector_offsets = tuple(offsets[id] for id in detector_ids)
+        key = (tuple(detector_ids), positions, detector_offsets)
+        if key not in self.tables:
+            if len(self.tables) >= self.max_tables:
+                self.tables.clear()
+            algorithm = self.direct if len(detector_ids) == 3 else self.fit
+            x, y, z = zip(*positions)
+            self.tables[key] = DirectionLookupTable(x, y, z, detector_offsets, algorithm,
+                                                    self.time_resolution)
+        return self.tables[key]
+
+    def reconstruct_event(self, event, detector_ids=None, offsets=[0., 0., 0., 0.], initial=None):
+        """Reconstruct a single event, see EventDirectionReconstruction"""
+
+        if detector_ids is None:
+            detector_ids = range(4)
+        self.station.cluster.set_timestamp(event['timestamp'])
+        if isinstance(offsets, Station):
+            offsets = offsets.detector_timing_offset(event['timestamp'])
+        ids = [id for id in detector_ids if event['t%d' % (id + 1)] not in ERR]
+        if len(ids) < 3:
+            return nan, nan, ids
+        t = [event['t%d' % (id + 1)] for id in ids]
+        theta, phi = self.get_table(ids, offsets).lookup(t, initial)
+        return theta, phi, ids
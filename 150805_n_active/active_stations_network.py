@@ -1,42 +1,17 @@
-import os
-
 from datetime import date
-from glob import glob
 
-from numpy import arange, argmax, genfromtxt, histogram, uint32, zeros
+from numpy import arange, argmax, histogram
 
 from artist import Plot
 
 from sapphire.transformations.clock import datetime_to_gps
 
-PATH = '/Users/arne/Datastore/publicdb_csv/eventtime/*.tsv'
-
-
-def read_eventtime(path):
-    return genfromtxt(path, delimiter='\t', dtype=uint32,
-                      names=['timestamp', 'counts'])
-
-
-def get_data():
-    return {int(os.path.basename(path)[:-4]): read_eventtime(path)
-            for path in glob(PATH)}
+from eventtime_store import load_eventtime
 
 
 def get_aligned():
-    data = get_data()
-
-    first = min(values['timestamp'][0] for values in data.values())
-    last = max(values['timestamp'][-1] for values in data.values())
-
-    timestamps = arange(first, last + 1, 3600)
-    extended_data = zeros((len(data.keys()), (last - first) / 3600 + 1))
-
-    for i, sn in enumerate(data.keys()):
-        start = (data[sn]['timestamp'][0] - first) / 3600
-        end = start + len(data[sn])
-        extended_data[i, start:end] = ((data[sn]['counts'] > 500) &
-                                       (data[sn]['counts'] < 5000))
-    return timestamps, extended_data
+    eventtime = load_eventtime()
+    return eventtime.timestamps, eventtime.active
 
 
 if __name__ == "__main__":
@@ -4,6 +4,8 @@ import urllib
 from sapphire import Network
 from sapphire.utils import pbar
 
+from eventtime_store import read_eventtime_tsvs, update_eventtime
+
 BASE = 'http://data.hisparc.nl/show/source/eventtime/%d/'
 PATH = '/Users/arne/Datastore/publicdb_csv/eventtime/'
 
@@ -15,3 +17,6 @@ if __name__ == "__main__":
         path = PATH + '%d.tsv' % sn
         if not os.path.exists(path):
             urllib.urlretrieve(BASE % sn, path)
+
+    # Add the new hours to the aligned store used by the other scripts
+    update_eventtime(read_eventtime_tsvs(PATH))
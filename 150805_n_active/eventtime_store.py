@@ -0,0 +1,242 @@
+"""Aligned eventtime data for all stations in a single binary store
+
+The eventtime source gives the number of events per hour for a station.
+Here the data of all stations is aligned in one (stations x hours) array
+of uint16 counts, together with a bitmap of the hours in which a station
+was active (between 500 and 5000 events in the hour). These are stored
+in a PyTables file, new hours can be appended without rewriting the
+existing data.
+
+Example::
+
+    eventtime = load_eventtime()
+    spa = eventtime.select([501, 502, 503])
+    spa.active.sum(axis=0)  # number of active stations per hour
+
+"""
+import os
+
+from glob import glob
+
+import tables
+
+from numpy import (
+    arange, array, clip, concatenate, genfromtxt, nonzero, packbits, searchsorted, uint16, uint32, unpackbits, zeros)
+
+from sapphire import Station
+
+STORE_PATH = '/Users/arne/Datastore/publicdb_csv/eventtime.h5'
+TSV_PATH = '/Users/arne/Datastore/publicdb_csv/eventtime/'
+HOUR = 3600
+MIN_COUNTS = 500
+MAX_COUNTS = 5000
+
+
+def is_active(counts):
+    """Flag hours with a reasonable number of events"""
+
+    return (counts > MIN_COUNTS) & (counts < MAX_COUNTS)
+
+
+class Eventtime(object):
+
+    """Aligned eventtime counts
+
+    :param stations: station numbers, one for each row.
+    :param first: timestamp of the first hour (column).
+    :param counts: array (stations x hours) with the number of events.
+    :param active: array (stations x hours) with active flags, derived
+                   from the counts if not given.
+
+    """
+
+    def __init__(self, stations, first, counts, active=None):
+        self.stations = list(stations)
+        self.first = int(first)
+        self.counts = counts
+        self.active = is_active(counts) if active is None else active
+
+    @property
+    def timestamps(self):
+        return arange(self.first, self.first + HOUR * self.counts.shape[1], HOUR)
+
+    @property
+    def last(self):
+        """Timestamp of the last hour in the data"""
+
+        return self.first + HOUR * (self.counts.shape[1] - 1)
+
+    def station_index(self, station):
+        return self.stations.index(station)
+
+    def station_counts(self, station):
+        """Counts for one station, a view on the data"""
+
+        return self.counts[self.station_index(station)]
+
+    def station_active(self, station):
+        """Active flags for one station, a view on the data"""
+
+        return self.active[self.station_index(station)]
+
+    def last_timestamp(self, station):
+        """Timestamp of the last hour with events for a station"""
+
+        with_data = nonzero(self.station_counts(station))[0]
+        if not len(with_data):
+            return None
+        return self.first + HOUR * int(with_data[-1])
+
+    def between(self, start, end):
+        """Restrict to the hours between two timestamps (views on the data)"""
+
+        start_idx, end_idx = searchsorted(self.timestamps, [start, end])
+        return Eventtime(self.stations, self.first + HOUR * start_idx,
+                         self.counts[:, start_idx:end_idx],
+                         self.active[:, start_idx:end_idx])
+
+    def select(self, stations):
+        """Restrict to some stations and the hours in which they have data
+
+        The hours are trimmed to the range from the first to the last hour
+        with events for any of the stations.
+
+        """
+        idx = [self.station_index(station) for station in stations]
+        counts = self.counts[idx]
+        with_data = nonzero(counts.any(axis=0))[0]
+        if not len(with_data):
+            return Eventtime(stations, self.first, counts[:, :0], self.active[idx][:, :0])
+        start, end = with_data[0], with_data[-1] + 1
+        return Eventtime(stations, self.first + HOUR * start,
+                         counts[:, start:end], self.active[idx][:, start:end])
+
+
+def align(data):
+    """Align eventtime data of many stations
+
+    :param data: dictionary with for each station number an array with
+                 timestamp and counts columns.
+    :return: Eventtime instance.
+
+    """
+    data = {station: values for station, values in data.items() if len(values)}
+    stations = sorted(data.keys())
+    if not stations:
+        return Eventtime([], 0, zeros((0, 0), dtype=uint16))
+    first = min(int(values['timestamp'][0]) for values in data.values())
+    last = max(int(values['timestamp'][-1]) for values in data.values())
+    counts = zeros((len(stations), (last - first) // HOUR + 1), dtype=uint16)
+    for i, station in enumerate(stations):
+        values = data[station]
+        columns = (values['timestamp'].astype('int64') - first) // HOUR
+        counts[i, columns] = clip(values['counts'], 0, 2 ** 16 - 1)
+    return Eventtime(stations, first, counts)
+
+
+def read_eventtime_tsv(path):
+    return genfromtxt(path, delimiter='\t', dtype=uint32,
+                      names=['timestamp', 'counts'])
+
+
+def read_eventtime_tsvs(path=TSV_PATH, pattern='*.tsv'):
+    """Read the eventtime TSV files downloaded by eventtime.py"""
+
+    return {int(os.path.basename(tsv)[:-4]): read_eventtime_tsv(tsv)
+            for tsv in glob(os.path.join(path, pattern))}
+
+
+def get_eventtime_api(stations):
+    """Get the eventtime data using the API"""
+
+    return {station: Station(station, force_stale=True).event_time()
+            for station in stations}
+
+
+def store_eventtime(eventtime, path=STORE_PATH):
+    """Write the aligned data to a new store, replacing any existing one"""
+
+    filters = tables.Filters(complevel=1)
+    with tables.open_file(path, 'w') as data:
+        data.create_array('/', 'stations', array(eventtime.stations, dtype=uint32))
+        counts = data.create_earray('/', 'counts', tables.UInt16Atom(),
+                                    shape=(len(eventtime.stations), 0),
+                                    filters=filters,
+                                    expectedrows=eventtime.counts.shape[1])
+        counts.append(eventtime.counts)
+        data.root._v_attrs.first = eventtime.first
+        _store_active(data, eventtime.active, filters)
+
+
+def _store_active(data, active, filters=None):
+    """Store the active flags as bitmap, packed along the hours"""
+
+    if 'active' in data.root:
+        data.remove_node('/', 'active')
+    data.create_carray('/', 'active', obj=packbits(active, axis=1), filters=filters)
+    data.root._v_attrs.n_hours = active.shape[1]
+
+
+def update_eventtime(data, path=STORE_PATH):
+    """Add new hours to the store
+
+    Only the hours after the last hour in the store are added. If the
+    store does not exist yet, or new stations were added, the store is
+    rebuilt.
+
+    :param data: dictionary with for each station number an array with
+                 timestamp and counts columns.
+
+    """
+    if not os.path.exists(path):
+        store_eventtime(align(data), path)
+        return
+    with tables.open_file(path, 'r') as store:
+        stations = store.root.stations.read().tolist()
+        first = int(store.root._v_attrs.first)
+        n_hours = store.root.counts.shape[1]
+    new_stations = [station for station in data if len(data[station]) and station not in stations]
+    if new_stations:
+        store_eventtime(align(data), path)
+        return
+
+    next_hour = first + n_hours * HOUR
+    new_data = {}
+    for station in stations:
+        values = data.get(station)
+        if values is None or not len(values):
+            continue
+        new_data[station] = values[searchsorted(values['timestamp'], next_hour):]
+    last = max([int(values['timestamp'][-1]) for values in new_data.values() if len(values)] or [0])
+    if last < next_hour:
+        return
+
+    new_counts = zeros((len(stations), (last - next_hour) // HOUR + 1), dtype=uint16)
+    for i, station in enumerate(stations):
+        values = new_data.get(station)
+        if values is None or not len(values):
+            continue
+        columns = (values['timestamp'].astype('int64') - next_hour) // HOUR
+        new_counts[i, columns] = clip(values['counts'], 0, 2 ** 16 - 1)
+
+    with tables.open_file(path, 'a') as store:
+        store.root.counts.append(new_counts)
+        # The bitmap is small, simply repack it
+        active = _read_active(store)
+        _store_active(store, concatenate((active, is_active(new_counts)), axis=1),
+                      store.root.counts.filters)
+
+
+def _read_active(store):
+    n_hours = store.root._v_attrs.n_hours
+    return unpackbits(store.root.active.read(), axis=1)[:, :n_hours].astype(bool)
+
+
+def load_eventtime(path=STORE_PATH):
+    """Load the aligned eventtime data from the store"""
+
+    with tables.open_file(path, 'r') as store:
+        return Eventtime(store.root.stations.read().tolist(),
+                         store.root._v_attrs.first,
+                         store.root.counts.read(),
+                         _read_active(store))
@@ -0,0 +1 @@
+../150604_many_peaks/cached_fetch.py
\ No newline at end of file
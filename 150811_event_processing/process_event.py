@@ -4,16 +4,16 @@ from numpy import arange, around, mean, nan, nanmax, nanmin, sign
 
 from artist import Plot
 
-from sapphire import Station
+from trace_cache import TraceCache, fetch_traces
 
 COLORS = ['black', 'red', 'green', 'blue']
 FILTER_THRESHOLD = 25
 
 
 def get_traces():
-    station = Station(502)
-    raw_traces = station.event_trace(1385942677, 963603990, raw=True)
-    return raw_traces
+    with TraceCache() as cache:
+        raw_traces = fetch_traces(cache, [(502, 1385942677, 963603990)], raw=True)
+    return raw_traces[(502, 1385942677963603990)]
 
 
 def filter_traces(raw_traces, use_threshold=True, threshold=FILTER_THRESHOLD):
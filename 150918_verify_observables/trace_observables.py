@@ -0,0 +1,196 @@
+"""Trace observables for many events at once
+
+The same algorithms as `process_traces.TraceObservables`, but for a batch
+of events (events x samples x detectors) using array operations. The
+thresholds are passed explicitly instead of being read from the module
+constants of sapphire, so stations with different DAQ settings can be
+verified without changing any globals.
+
+The observables are padded to 4 detectors with -1, like the values in
+the events table.
+
+"""
+from numpy import around, array, full, isclose, maximum, where, zeros
+
+BASELINE_THRESHOLD = 17
+LOW_THRESHOLD = 253
+LOW_THRESHOLD_III = 82
+OBSERVABLES = ['baseline', 'std_dev', 'n_peaks', 'pulseheights', 'integrals']
+# Events per batch of decoded traces, a batch takes about 20 MB per
+# intermediate array (int64, 2400 samples, 4 detectors)
+BATCH_SIZE = 250
+
+
+def pad(values):
+    """Pad (events x detectors) values to 4 detectors with -1"""
+
+    padded = full((len(values), 4), -1, dtype=values.dtype)
+    padded[:, :values.shape[1]] = values
+    return padded
+
+
+def baselines(traces):
+    """Mean value of the first 50 samples of the traces"""
+
+    return around(traces[:, :50].mean(axis=1)).astype('int')
+
+
+def std_devs(traces):
+    """Standard deviation of the first 50 samples, in milli ADC counts"""
+
+    return around(traces[:, :50].std(axis=1) * 1000).astype('int')
+
+
+def pulseheights(traces, baselines):
+    """Maximum value of the traces minus the baselines"""
+
+    return traces.max(axis=1) - baselines
+
+
+def integrals(traces, baselines, baseline_threshold=BASELINE_THRESHOLD):
+    """Integral of the values more than the threshold above baseline"""
+
+    signal = traces - baselines[:, None, :]
+    return where(signal > baseline_threshold, signal, 0).sum(axis=1)
+
+
+def n_peaks(traces, baselines, low_threshold=LOW_THRESHOLD,
+            low_threshold_iii=LOW_THRESHOLD_III):
+    """Number of peaks in the traces
+
+    The peak finder is a state machine, here it is stepped through the
+    samples for all traces at the same time. The peak threshold of each
+    event depends on the baselines (HiSPARC III v4 or older).
+
+    """
+    signal = traces - baselines[:, None, :]
+    is_iii = (baselines < 100).all(axis=1)
+    peak_threshold = where(is_iii, low_threshold_iii - 30, low_threshold - 200)[:, None]
+
+    shape = baselines.shape
+    count = zeros(shape, dtype='int')
+    in_peak = zeros(shape, dtype='bool')
+    local_minimum = zeros(shape, dtype=signal.dtype)
+    local_maximum = zeros(shape, dtype=signal.dtype)
+
+    for value in signal.transpose(1, 0, 2):
+        lower = ~in_peak & (value < local_minimum)
+        rise = ~in_peak & ~lower & (value - local_minimum > peak_threshold)
+        higher = in_peak & (value > local_maximum)
+        fall = in_peak & ~higher & (local_maximum - value > peak_threshold)
+
+        local_minimum = where(lower | fall, maximum(value, 0), local_minimum)
+        local_maximum = where(rise | higher, value, local_maximum)
+        count += rise
+        in_peak = (in_peak | rise) & ~fall
+
+    return count
+
+
+def trace_observables(traces, event_baselines=None, baseline_threshold=BASELINE_THRESHOLD,
+                      low_threshold=LOW_THRESHOLD, low_threshold_iii=LOW_THRESHOLD_III):
+    """Determine all observables for a batch of traces
+
+    :param traces: array (events x samples x detectors) of traces.
+    :param event_baselines: array (events x detectors) with the baselines
+                            to use for the other observables, if None the
+                            reconstructed baselines are used.
+    :return: dictionary with an array (events x 4) for each observable.
+
+    """
+    traces = array(traces, dtype='int')
+    reconstructed_baselines = baselines(traces)
+    if event_baselines is None:
+        event_baselines = reconstructed_baselines
+    return {'baseline': pad(reconstructed_baselines),
+            'std_dev': pad(std_devs(traces)),
+            'n_peaks': pad(n_peaks(traces, event_baselines, low_threshold, low_threshold_iii)),
+            'pulseheights': pad(pulseheights(traces, event_baselines)),
+            'integrals': pad(integrals(traces, event_baselines, baseline_threshold))}
+
+
+def group_traces(pe, events):
+    """Decode the traces of events, grouped by trace shape
+
+    Traces can have different lengths (e.g. data reduction or different
+    trigger windows), events with the same shape are stacked.
+
+    :param pe: ProcessEvents instance, used to decode the traces.
+    :param events: array of events.
+    :return: dictionary with for each shape the indices of the events and
+             an array (events x samples x detectors) of the traces.
+
+    """
+    groups = {}
+    for i, event in enumerate(events):
+        traces = pe.get_traces_for_event(event)
+        indices, group = groups.setdefault(traces.shape, ([], []))
+        indices.append(i)
+        group.append(traces)
+    return {shape: (array(indices), array(group)) for shape, (indices, group) in groups.items()}
+
+
+def mismatches(events, observables, indices):
+    """Compare reconstructed with stored observables
+
+    A baseline differing by at most 1 is accepted, the other observables
+    should match exactly.
+
+    :return: dictionary with a mask of the events with a mismatch for
+             each observable.
+
+    """
+    masks = {}
+    for name in OBSERVABLES:
+        stored = events[name][indices]
+        atol = 1 if name == 'baseline' else 0
+        masks[name] = ~isclose(observables[name], stored, rtol=1e-7, atol=atol).all(axis=1)
+    return masks
+
+
+def verify_events(pe, events, batch_size=BATCH_SIZE, **thresholds):
+    """Verify the stored observables of events
+
+    The observables other than the baseline are determined using the
+    stored baselines, so a wrong baseline does not cause other
+    mismatches. The traces are decoded in small batches of events to
+    limit the memory use.
+
+    :param pe: ProcessEvents instance, used to decode the traces.
+    :param events: array of events.
+    :param batch_size: number of events for which the traces are decoded
+                       at once.
+    :param thresholds: baseline_threshold, low_threshold and
+                       low_threshold_iii, defaults to the DAQ defaults.
+    :return: dictionary with for each observable the mask of the events
+             with a mismatch.
+
+    """
+    masks = {name: zeros(len(events), dtype='bool') for name in OBSERVABLES}
+    for start in range(0, len(events), batch_size):
+        batch = events[start:start + batch_size]
+        for indices, traces in group_traces(pe, batch).values():
+            event_baselines = batch['baseline'][indices][:, :traces.shape[2]]
+            observables = trace_observables(traces, event_baselines, **thresholds)
+            for name, mask in mismatches(batch, observables, indices).items():
+                masks[name][start + indices] = mask
+    return masks
+
+
+def verify_table(pe, chunksize=10000, **thresholds):
+    """Verify all events of a ProcessEvents source in chunks
+
+    The events are read in chunks, the traces are decoded in smaller
+    batches by `verify_events`.
+
+    :return: dictionary with the mismatch mask and dictionary with the
+             number of mismatches for each observable.
+
+    """
+    masks = {name: zeros(pe.source.nrows, dtype='bool') for name in OBSERVABLES}
+    for start in range(0, pe.source.nrows, chunksize):
+        events = pe.source.read(start, start + chunksize)
+        for name, mask in verify_events(pe, events, **thresholds).items():
+            masks[name][start:start + len(events)] = mask
+    counts = {name: int(mask.sum()) for name, mask in masks.items()}
+    return masks, counts
@@ -17,18 +17,22 @@ from datetime import datetime
 
 import tables
 
-from numpy.testing import assert_allclose
-
 from sapphire import ProcessEvents
-from sapphire.analysis import process_traces
 from sapphire.publicdb import download_data
 
+from trace_observables import verify_table
+
 # 501 - HiSPARC III new DAQ disabled filter no data reduction
 # 510 - HiSPARC III old DAQ disabled filter with data reduction
 # 202 - HiSPARC II PySPARC no filter no data reduction
 # 304 - HiSPARC II old DAQ with filter and data reduction
 STATIONS = [501, 510, 202, 304]
 DATA_PATH = '/Users/arne/Datastore/verify/data.h5'
+# Thresholds used by the DAQ of each station, if not the default
+THRESHOLDS = {501: {'low_threshold_iii': 56},
+              510: {'baseline_threshold': 25, 'low_threshold': 226},
+              202: {'baseline_threshold': 25},
+              304: {'baseline_threshold': 25}}
 
 
 def download():
@@ -42,62 +46,9 @@ def download():
 
 def reconstruct_observables():
     with tables.open_file(DATA_PATH, 'r') as data:
-        default_threshold = process_traces.BASELINE_THRESHOLD
-        default_low_iii = process_traces.LOW_THRESHOLD_III
-        default_low_ii = process_traces.LOW_THRESHOLD
-
         for station in STATIONS:
-            if station in [202, 510, 304]:
-                process_traces.BASELINE_THRESHOLD = 25
-            else:
-                process_traces.BASELINE_THRESHOLD = default_threshold
-            if station in [501]:
-                process_traces.LOW_THRESHOLD_III = 56
-            else:
-                process_traces.LOW_THRESHOLD_III = default_low_iii
-            if station in [510]:
-                process_traces.LOW_THRESHOLD = 226
-            else:
-                process_traces.LOW_THRESHOLD = default_low_ii
-
             pe = ProcessEvents(data, '/s%d' % station)
-            wrong = {'baseline': 0, 'std_dev': 0, 'n_peaks': 0,
-                     'pulseheights': 0, 'integrals': 0}
-            for event in pe.source:
-                traces = pe.get_traces_for_event(event)
-                to = process_traces.TraceObservables(traces)
-
-                try:
-                    assert_allclose(to.baselines, event['baseline'], atol=0)
-                except AssertionError:
-                    try:
-                        assert_allclose(to.baselines, event['baseline'], atol=1)
-                    except AssertionError:
-                        wrong['baseline'] += 1
-                    # print 'baseline:', event['event_id'], to.baselines, event['baseline']
-                    to.baselines = event['baseline']
-                assert_allclose(to.baselines, event['baseline'], atol=0)
-
-                try:
-                    assert_allclose(to.std_dev, event['std_dev'], atol=0)
-                except AssertionError:
-                    wrong['std_dev'] += 1
-#                     print 'std_dev:', event['event_id'], to.std_dev, event['std_dev']
-                try:
-                    assert_allclose(to.n_peaks, event['n_peaks'], atol=0)
-                except AssertionError:
-                    wrong['n_peaks'] += 1
-#                     print 'n_peaks:', event['event_id'], to.n_peaks, event['n_peaks']
-                try:
-                    assert_allclose(to.pulseheights, event['pulseheights'], atol=0)
-                except AssertionError:
-                    wrong['pulseheights'] += 1
-#                     print 'pulseheights:', event['event_id'], to.pulseheights, event['pulseheights']
-                try:
-                    assert_allclose(to.integrals, event['integrals'], atol=0)
-                except AssertionError:
-                    wrong['integrals'] += 1
-#                     print 'integrals:', event['event_id'], to.integrals, event['integrals']
+            _, wrong = verify_table(pe, **THRESHOLDS[station])
             print 'station:', station, wrong, 'total:', pe.source.nrows
 
 
@@ -0,0 +1,227 @@
+"""Station distances for the entire network at any time
+
+The positions of the stations change over time (new GPS locations and
+detector layouts). Here the center of mass coordinates (ENU, relative to
+the network reference) of all stations are determined for every moment
+at which any of them changes, giving a (timestamps x stations x 3)
+array. Queries for a time use the last change before that time; for
+radius queries a KD-tree of the positions at that time is used.
+
+Determining the coordinates requires stepping the cluster through all
+timestamps, so the result is cached on disk. The cache is rebuilt when
+the stations of the network or their latest position change differ.
+
+Example::
+
+    matrix = get_distance_matrix()
+    matrix.close_pairs(min=0, max=15e3)
+    matrix.distance(501, 502, timestamp=1420070400)
+
+"""
+import os
+
+from numpy import (
+    allclose, array, concatenate, empty, full, isnan, load, nan, nanmax, nanmin, nonzero, savez, searchsorted, sqrt,
+    unique)
+from scipy.spatial import cKDTree
+
+from sapphire import HiSPARCNetwork
+
+CACHE_PATH = '/Users/arne/Datastore/station_coordinates.npz'
+_matrix = None
+
+
+def station_timestamps(station):
+    """Timestamps at which the position of the station may change"""
+
+    timestamps = list(station.timestamps)
+    if station.detectors:
+        timestamps += list(station.detectors[0].timestamps)
+    return unique(array(timestamps, dtype='int64'))
+
+
+def latest_timestamp(cluster):
+    """Latest timestamp at which the position of any station changes"""
+
+    return max([0] + [timestamps[-1] for timestamps in map(station_timestamps, cluster.stations)
+                      if len(timestamps)])
+
+
+def cluster_coordinates(cluster):
+    """Get the coordinates of all stations in a cluster over time
+
+    For each station the coordinates are only calculated at its own
+    timestamps, these are then expanded to all timestamps.
+
+    :param cluster: a sapphire cluster object.
+    :return: station numbers, timestamps and the coordinates array. The
+             coordinates of stations without valid GPS location are nan.
+
+    """
+    stations = [station.number for station in cluster.stations]
+    own_timestamps = [station_timestamps(station) for station in cluster.stations]
+    timestamps = unique(concatenate(own_timestamps + [array([0], dtype='int64')]))
+    coordinates = full((len(timestamps), len(stations), 3), nan)
+
+    for s_idx, station in enumerate(cluster.stations):
+        own = own_timestamps[s_idx]
+        if not len(own):
+            continue
+        own_coordinates = empty((len(own), 3))
+        for i, timestamp in enumerate(own):
+            cluster.set_timestamp(timestamp)
+            if allclose(station.get_lla_coordinates(), (0., 0., 0.), atol=1e-7):
+                # Invalid GPS
+                own_coordinates[i] = nan
+            else:
+                own_coordinates[i] = station.calc_center_of_mass_coordinates()
+        # Before its first timestamp a station is at its first position
+        idx = searchsorted(own, timestamps, side='right') - 1
+        idx[idx < 0] = 0
+        coordinates[:, s_idx] = own_coordinates[idx]
+
+    return stations, timestamps, coordinates
+
+
+class StationDistanceMatrix(object):
+
+    """Distances between all stations at any time
+
+    :param stations: station numbers.
+    :param timestamps: sorted timestamps at which positions change.
+    :param coordinates: (timestamps x stations x 3) array of coordinates.
+
+    """
+
+    def __init__(self, stations, timestamps, coordinates):
+        self.stations = list(stations)
+        self.timestamps = array(timestamps)
+        self.coordinates = array(coordinates)
+        self._station_idx = {station: i for i, station in enumerate(self.stations)}
+        self._trees = {}
+
+    @classmethod
+    def from_cluster(cls, cluster):
+        return cls(*cluster_coordinates(cluster))
+
+    @classmethod
+    def from_network(cls, path=CACHE_PATH, rebuild=False):
+        """Load the matrix for the entire network, build it if needed
+
+        The stored matrix is only used if it has the same stations and the
+        same latest position change as the current network.
+
+        """
+        cluster = HiSPARCNetwork(force_stale=True)
+        if not rebuild and os.path.exists(path):
+            matrix = cls.load(path)
+            if (matrix.stations == [station.number for station in cluster.stations] and
+                    matrix.timestamps[-1] == latest_timestamp(cluster)):
+                return matrix
+        matrix = cls.from_cluster(cluster)
+        matrix.save(path)
+        return matrix
+
+    @classmethod
+    def load(cls, path=CACHE_PATH):
+        cache = load(path)
+        return cls(cache['stations'].tolist(), cache['timestamps'], cache['coordinates'])
+
+    def save(self, path=CACHE_PATH):
+        savez(path, stations=self.stations, timestamps=self.timestamps,
+              coordinates=self.coordinates)
+
+    def time_index(self, timestamp=None):
+        """Index of the positions valid at a timestamp, latest if None"""
+
+        if timestamp is None:
+            return len(self.timestamps) - 1
+        return max(searchsorted(self.timestamps, timestamp, side='right') - 1, 0)
+
+    def station_coordinates(self, timestamp=None):
+        """Coordinates of all stations at a timestamp, nan if invalid GPS"""
+
+        return self.coordinates[self.time_index(timestamp)]
+
+    def distance(self, s1, s2, timestamp=None):
+        """Distance between two stations"""
+
+        coordinates = self.station_coordinates(timestamp)
+        c1 = coordinates[self._station_idx[s1]]
+        c2 = coordinates[self._station_idx[s2]]
+        return sqrt(((c1 - c2) ** 2).sum())
+
+    def distances(self, timestamp=None):
+        """(stations x stations) array with all distances at a timestamp"""
+
+        coordinates = self.station_coordinates(timestamp)
+        return sqrt(((coordinates[:, None] - coordinates[None, :]) ** 2).sum(axis=-1))
+
+    def min_max_distance(self, s1, s2):
+        """Minimum and maximum distance between two stations over time"""
+
+        c1 = self.coordinates[:, self._station_idx[s1]]
+        c2 = self.coordinates[:, self._station_idx[s2]]
+        distances = sqrt(((c1 - c2) ** 2).sum(axis=-1))
+        return nanmin(distances), nanmax(distances)
+
+    def _tree(self, t_idx):
+        """KD-tree of the stations with valid positions at a time index"""
+
+        if t_idx not in self._trees:
+            coordinates = self.coordinates[t_idx]
+            valid = nonzero(~isnan(coordinates).any(axis=1))[0]
+            self._trees[t_idx] = (valid, cKDTree(coordinates[valid]))
+        return self._trees[t_idx]
+
+    def close_pairs(self, min=0, max=2e3, timestamp=None):
+        """Station pairs with a distance between min and max
+
+        :return: list of (s1, s2) pairs, with s1 before s2 in the station
+                 list, sorted.
+
+        """
+        t_idx = self.time_index(timestamp)
+        valid, tree = self._tree(t_idx)
+        coordinates = self.coordinates[t_idx]
+        close = []
+        for i, j in tree.query_pairs(max):
+            i, j = sorted((valid[i], valid[j]))
+            distance = sqrt(((coordinates[i] - coordinates[j]) ** 2).sum())
+            if min < distance < max:
+                close.append((self.stations[i], self.stations[j]))
+        return sorted(close, key=lambda pair: (self._station_idx[pair[0]], self._station_idx[pair[1]]))
+
+    def close_triples(self, min=0, max=2e3, timestamp=None):
+        """Station triples for which all pair distances are within range"""
+
+        pairs = self.close_pairs(min, max, timestamp)
+        neighbours = {}
+        for s1, s2 in pairs:
+            neighbours.setdefault(s1, set()).add(s2)
+        triples = []
+        for s1, s2 in pairs:
+            for s3 in sorted(neighbours.get(s1, set()) & neighbours.get(s2, set()),
+                             key=self._station_idx.get):
+                triples.append((s1, s2, s3))
+        return triples
+
+    def within(self, station, radius, timestamp=None):
+        """Stations within a radius of a station (excluding itself)"""
+
+        t_idx = self.time_index(timestamp)
+        valid, tree = self._tree(t_idx)
+        position = self.coordinates[t_idx, self._station_idx[station]]
+        if isnan(position).any():
+            return []
+        return sorted(self.stations[valid[i]] for i in tree.query_ball_point(position, radius)
+                      if self.stations[valid[i]] != station)
+
+
+def get_distance_matrix(path=CACHE_PATH):
+    """Get the network distance matrix, loaded only once per process"""
+
+    global _matrix
+    if _matrix is None:
+        _matrix = StationDistanceMatrix.from_network(path)
+    return _matrix
@@ -21,7 +21,7 @@ import tables
 from sapphire import download_coincidences
 from sapphire.transformations.clock import gps_to_datetime
 
-from eventtime_ranges import get_timestamp_ranges, get_total_exposure
+from eventtime_ranges import get_pairs_timestamp_ranges, get_timestamp_ranges, get_total_exposure
 from rate_from_intervals import determine_rate
 from station_distances import close_pairs_in_network, distance_between_stations
 
@@ -31,8 +31,10 @@ DATAPATH = '/Users/arne/Datastore/pairs/%d_%d.h5'
 def download_coincidences_pairs_multi(close_pairs):
     """Like download_coincidences_pairs, but multithreaded"""
 
+    pair_ranges = get_pairs_timestamp_ranges(close_pairs)
     worker_pool = multiprocessing.Pool(4)
-    worker_pool.map(download_coincidences_pair, close_pairs)
+    worker_pool.map(download_coincidences_pair_ranges,
+                    [(pair, pair_ranges[tuple(pair)]) for pair in close_pairs])
     worker_pool.close()
     worker_pool.join()
 
@@ -40,11 +42,16 @@ def download_coincidences_pairs_multi(close_pairs):
 def download_coincidences_pairs(close_pairs):
     """Download coincidences for the given pairs"""
 
+    pair_ranges = get_pairs_timestamp_ranges(close_pairs)
     for close_pair in close_pairs:
-        download_coincidences_pair(close_pair)
+        download_coincidences_pair(close_pair, pair_ranges[tuple(close_pair)])
 
 
-def download_coincidences_pair(pair):
+def download_coincidences_pair_ranges(args):
+    download_coincidences_pair(*args)
+
+
+def download_coincidences_pair(pair, timestamp_ranges=None):
     path = DATAPATH % tuple(pair)
     tmp_path = path + '_tmp'
     if os.path.exists(path):
@@ -52,7 +59,8 @@ def download_coincidences_pair(pair):
         return
     print 'Starting', pair, datetime.datetime.now()
     distance = distance_between_stations(*pair)
-    timestamp_ranges = get_timestamp_ranges(pair)
+    if timestamp_ranges is None:
+        timestamp_ranges = get_timestamp_ranges(pair)
     total_exposure = get_total_exposure(timestamp_ranges)
     with tables.open_file(tmp_path, 'w') as data:
         data.set_node_attr('/', 'total_exposure', total_exposure)
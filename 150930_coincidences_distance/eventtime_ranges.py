@@ -1,13 +1,24 @@
-from numpy import arange, array, zeros
+from numpy import array
 
-from sapphire import Station
+from eventtime_store import load_eventtime
+from intervals import pair_exposures, pair_ranges, ranges_from_flags
+
+_eventtime = None
+
+
+def get_eventtime():
+    """Load the aligned eventtime data, only once per process"""
+
+    global _eventtime
+    if _eventtime is None:
+        _eventtime = load_eventtime()
+    return _eventtime
 
 
 def get_data(station_numbers):
-    """Read the eventtime csv files for the given station numbers"""
+    """Get the aligned eventtime data for the given station numbers"""
 
-    return {number: Station(number, force_stale=True).event_time()
-            for number in station_numbers}
+    return get_eventtime().select(station_numbers)
 
 
 def get_total_exposure(timestamp_ranges):
@@ -34,21 +45,37 @@ def get_timestamp_ranges(station_numbers, min_n=None):
         min_n = len(station_numbers)
     data = get_data(station_numbers)
 
-    first = min(values['timestamp'][0] for values in data.values())
-    last = max(values['timestamp'][-1] for values in data.values())
+    flags = data.active.sum(axis=0) >= min_n
+    timestamp_ranges = get_ranges(data.timestamps, flags)
+    return timestamp_ranges
 
-    timestamps = arange(first, last + 1, 3600)
-    extended_data = zeros((len(data.keys()), (last - first) / 3600 + 1))
 
-    for i, sn in enumerate(data.keys()):
-        start = (data[sn]['timestamp'][0] - first) / 3600
-        end = start + len(data[sn])
-        extended_data[i, start:end] = ((data[sn]['counts'] > 500) &
-                                       (data[sn]['counts'] < 5000))
+def get_pairs_timestamp_ranges(pairs):
+    """Get timestamp ranges where both stations have data for many pairs
 
-    flags = extended_data.sum(axis=0) >= min_n
-    timestamp_ranges = get_ranges(timestamps, flags)
-    return timestamp_ranges
+    The ranges for all pairs are derived from the shared eventtime data,
+    which is loaded only once.
+
+    :param pairs: list of station number pairs.
+    :return: dictionary with the timestamp ranges for each pair.
+
+    """
+    data = get_eventtime()
+    pairs = [tuple(pair) for pair in pairs]
+    idx = [(data.station_index(s1), data.station_index(s2)) for s1, s2 in pairs]
+    return dict(zip(pairs, pair_ranges(data.timestamps, data.active, idx)))
+
+
+def get_pairs_exposure(station_numbers):
+    """Get the total time both stations had data, for all pairs at once
+
+    :param station_numbers: list of station numbers.
+    :return: (stations x stations) array with the exposure in seconds.
+
+    """
+    data = get_eventtime()
+    idx = [data.station_index(station) for station in station_numbers]
+    return pair_exposures(data.active[idx])
 
 
 def get_ranges(timestamps, flags):
@@ -58,25 +85,8 @@ def get_ranges(timestamps, flags):
     :param flags: list of flags (booleans) which indicate if all of the
                   requested stations have data during that timestamp..
 
-    Inspired by http://stackoverflow.com/a/16315498/1033535
-
     """
-    timestamp_ranges = []
-    prev_flag = False
-    for timestamp, flag in zip(timestamps, flags):
-        if flag:
-            # All stations have data
-            if not timestamp_ranges or len(timestamp_ranges[-1]) == 2:
-                # Start new range
-                timestamp_ranges.append([timestamp])
-        if prev_flag and not flag:
-            # End of a range
-            timestamp_ranges[-1].append(timestamp)
-        prev_flag = flag
-    if timestamp_ranges and len(timestamp_ranges[-1]) == 1:
-        timestamp_ranges[-1].append(timestamps[-1] + 3600)
-
-    return timestamp_ranges
+    return ranges_from_flags(timestamps, flags).tolist()
 
 
 if __name__ == "__main__":
@@ -0,0 +1 @@
+../150805_n_active/eventtime_store.py
\ No newline at end of file
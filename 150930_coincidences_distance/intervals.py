@@ -0,0 +1,146 @@
+"""Interval algebra for station uptime
+
+Intervals are stored as (n, 2) arrays of [start, end) timestamps, sorted
+and non-overlapping. Activity flags (e.g. from the eventtime store) are
+converted to intervals using the changes in the flags, and sets of
+intervals are combined by sweeping over all start and end points at
+once, which gives intersections, unions and 'at least k of n active'.
+
+For many station pairs the total exposure follows directly from the
+active flags; the number of hours in which both stations are active is
+the matrix product of the (stations x hours) flags with its transpose.
+
+"""
+from numpy import array, concatenate, cumsum, diff, empty, int64, maximum, ones, where, zeros
+
+HOUR = 3600
+
+
+def ranges_from_flags(timestamps, flags, step=HOUR):
+    """Convert activity flags to intervals
+
+    :param timestamps: start timestamp of each bin, equally spaced.
+    :param flags: boolean for each bin, True if active.
+    :param step: width of the bins.
+    :return: array of [start, end) intervals in which the flags are set.
+
+    """
+    flags = array(flags, dtype=bool)
+    if not len(flags):
+        return empty((0, 2), dtype=int64)
+    timestamps = array(timestamps, dtype=int64)
+    # Pad with False on both sides, so every run has a start and an end
+    changes = diff(concatenate(([False], flags, [False])).astype(int))
+    starts = where(changes == 1)[0]
+    ends = where(changes == -1)[0]
+    bin_edges = concatenate((timestamps, [timestamps[-1] + step]))
+    return array([bin_edges[starts], bin_edges[ends]], dtype=int64).T
+
+
+def at_least(interval_sets, k):
+    """Intervals in which at least k of the interval sets are active
+
+    :param interval_sets: list of interval arrays, the intervals within a
+                          set should not overlap.
+    :param k: minimum number of active sets.
+    :return: array of [start, end) intervals.
+
+    """
+    interval_sets = [array(intervals, dtype=int64).reshape(-1, 2)
+                     for intervals in interval_sets]
+    if not interval_sets:
+        return empty((0, 2), dtype=int64)
+    intervals = concatenate(interval_sets)
+    if not len(intervals):
+        return intervals
+    points = concatenate((intervals[:, 0], intervals[:, 1]))
+    steps = concatenate((ones(len(intervals), dtype=int),
+                         -ones(len(intervals), dtype=int)))
+    # At equal times process the ends before the starts, so touching
+    # intervals do not overlap.
+    order = (points * 2 + (steps > 0)).argsort(kind='mergesort')
+    points = points[order]
+    active = cumsum(steps[order]) >= k
+    change = diff(concatenate(([False], active)).astype(int))
+    starts = points[change == 1]
+    ends = points[change == -1]
+    result = array([starts, ends], dtype=int64).T
+    return normalize(result)
+
+
+def normalize(intervals):
+    """Remove empty intervals and merge touching intervals"""
+
+    intervals = array(intervals, dtype=int64).reshape(-1, 2)
+    intervals = intervals[intervals[:, 1] > intervals[:, 0]]
+    if not len(intervals):
+        return intervals
+    intervals = intervals[intervals[:, 0].argsort(kind='mergesort')]
+    # A new interval starts where it begins after all previous ends
+    running_end = maximum.accumulate(intervals[:, 1])
+    new = concatenate(([True], intervals[1:, 0] > running_end[:-1]))
+    starts = intervals[new, 0]
+    last = concatenate((where(new)[0][1:] - 1, [len(intervals) - 1]))
+    return array([starts, running_end[last]], dtype=int64).T
+
+
+def intersection(*interval_sets):
+    """Intervals in which all sets are active"""
+
+    return at_least(interval_sets, len(interval_sets))
+
+
+def union(*interval_sets):
+    """Intervals in which any of the sets is active"""
+
+    return at_least(interval_sets, 1)
+
+
+def clip(intervals, start=None, end=None):
+    """Restrict intervals to a time range"""
+
+    intervals = array(intervals, dtype=int64).reshape(-1, 2).copy()
+    if start is not None:
+        intervals[:, 0] = where(intervals[:, 0] < start, start, intervals[:, 0])
+    if end is not None:
+        intervals[:, 1] = where(intervals[:, 1] > end, end, intervals[:, 1])
+    return intervals[intervals[:, 1] > intervals[:, 0]]
+
+
+def total_duration(intervals):
+    """Total time covered by the intervals"""
+
+    intervals = array(intervals, dtype=int64).reshape(-1, 2)
+    return int((intervals[:, 1] - intervals[:, 0]).sum())
+
+
+def pair_exposures(active, step=HOUR):
+    """Exposure time for all pairs of stations at once
+
+    :param active: (stations x bins) array with activity flags.
+    :param step: width of the bins.
+    :return: (stations x stations) array with the total time both stations
+             were active.
+
+    """
+    active = array(active, dtype=float)
+    return active.dot(active.T) * step
+
+
+def pair_ranges(timestamps, active, pairs, step=HOUR):
+    """Intervals in which both stations of each pair are active
+
+    :param timestamps: start timestamp of each bin.
+    :param active: (stations x bins) array with activity flags.
+    :param pairs: list of (i, j) row indices into active.
+    :return: list of interval arrays, one per pair.
+
+    """
+    return [ranges_from_flags(timestamps, active[i] & active[j], step)
+            for i, j in pairs]
+
+
+def k_of_n_flags(active, k):
+    """Flags for bins in which at least k of the stations are active"""
+
+    return active.sum(axis=0) >= k if len(active) else zeros(0, dtype=bool)
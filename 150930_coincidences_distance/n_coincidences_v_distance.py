@@ -26,6 +26,7 @@ from artist import Plot
 from sapphire import HiSPARCNetwork
 from sapphire.utils import pbar
 
+from distance_matrix import get_distance_matrix
 from energy_sensitivity import get_pair_distance_energy_array
 from station_distances import close_pairs_in_network
 from variable_distance import min_max_distance_pair
@@ -46,6 +47,7 @@ NO_LAYOUT = [2, 3, 5, 7, 10, 13, 21, 22, 101, 103, 202, 203,
 
 def get_coincidence_count(close_pairs):
     network = HiSPARCNetwork(force_stale=True)
+    distance_matrix = get_distance_matrix()
     distances = {4: [], 6: [], 8: []}
     distance_errors = {4: [], 6: [], 8: []}
     coincidence_rates = {4: [], 6: [], 8: []}
@@ -64,7 +66,7 @@ def get_coincidence_count(close_pairs):
         with tables.open_file(path, 'r') as data:
             try:
                 total_exposure = data.get_node_attr('/', 'total_exposure')
-                distance = network.calc_distance_between_stations(*pair)
+                distance = distance_matrix.distance(*pair)
                 n_rate = data.get_node_attr('/', 'n_rate')
                 interval_rate = data.get_node_attr('/', 'interval_rate')
                 n_coincidences = data.get_node_attr('/', 'n_coincidences')
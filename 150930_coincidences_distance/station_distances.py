@@ -10,7 +10,9 @@ from itertools import combinations
 
 from numpy import array, sqrt, testing
 
-from sapphire import HiSPARCNetwork, HiSPARCStations
+from sapphire import HiSPARCStations
+
+from distance_matrix import get_distance_matrix
 
 MIN_DISTANCE = 0
 MAX_DISTANCE = 2e3
@@ -30,9 +32,10 @@ def horizontal_distance_between_stations(s1, s2):
     return distance(*xy)
 
 
-def close_pairs_in_network(min=MIN_DISTANCE, max=MAX_DISTANCE):
-    cluster = HiSPARCNetwork(force_stale=True)
-    return close_pairs_in_cluster(cluster, min, max)
+def close_pairs_in_network(min=MIN_DISTANCE, max=MAX_DISTANCE, timestamp=None):
+    """Find pairs of stations, using the cached network distance matrix"""
+
+    return get_distance_matrix().close_pairs(min, max, timestamp)
 
 
 def close_pairs_in_cluster(cluster, min=MIN_DISTANCE, max=MAX_DISTANCE):
@@ -55,15 +58,14 @@ def get_close_pairs(coordinates, min=MIN_DISTANCE, max=MAX_DISTANCE):
     return pairs
 
 
-def close_triples_in_network(min=MIN_DISTANCE, max=MAX_DISTANCE):
+def close_triples_in_network(min=MIN_DISTANCE, max=MAX_DISTANCE, timestamp=None):
     """Find triples of stations
 
     The distances between each of the station pairs in the set must be within
     the min and max value.
 
     """
-    cluster = HiSPARCNetwork(force_stale=True)
-    return close_triples_in_cluster(cluster, min, max)
+    return get_distance_matrix().close_triples(min, max, timestamp)
 
 
 def close_triples_in_cluster(cluster, min=MIN_DISTANCE, max=MAX_DISTANCE):
@@ -2,8 +2,7 @@ import warnings
 
 from artist import Plot
 
-from sapphire import HiSPARCStations
-
+from distance_matrix import get_distance_matrix
 from station_distances import close_pairs_in_network
 
 
@@ -16,19 +15,10 @@ def min_max_distance_pair(pair):
     """Calculate station distance for all timestamps
 
     For each timestamp (GPS and station layout) calculate the station
-    distances.
+    distances, taken from the network distance matrix.
 
     """
-    c = HiSPARCStations(pair, force_stale=True)
-    ts = list(c.stations[0].timestamps)
-    ts += list(c.stations[1].timestamps)
-    ts += list(c.stations[0].detectors[0].timestamps)
-    ts += list(c.stations[1].detectors[0].timestamps)
-    distances = []
-    for t in sorted(ts):
-        c.set_timestamp(t)
-        distances.append(c.calc_distance_between_stations(*pair))
-    return (min(distances), max(distances))
+    return get_distance_matrix().min_max_distance(*pair)
 
 
 def plot_min_max(variable_pairs):
@@ -1,69 +1,62 @@
+import os
+
 from datetime import date
 
 from numpy import max as npmax
-from numpy import argsort, array, average, where, zeros
+from numpy import argsort, array, average, where
 from scipy.stats import binned_statistic
 
 from artist import Plot
 
 from sapphire import Network, Station
 from sapphire.transformations.clock import datetime_to_gps
-from sapphire.utils import pbar
+
+from eventtime_store import STORE_PATH, get_eventtime_api, load_eventtime, update_eventtime
 
 YEARS = range(2004, 2017)
 SPA_STATIONS = [501, 502, 503, 504, 505, 506, 508, 509, 510, 511]
 
 
-def get_eventtime_data(station):
-    """Get eventtime data"""
-    return Station(station, force_stale=True).event_time()
-
-
 def get_station_numbers():
     """Get all station numbers"""
     return Network(force_stale=True).station_numbers()
 
 
 def get_data():
-    """Read all eventtime data into a dictionary"""
-    return {s: get_eventtime_data(s) for s in pbar(get_station_numbers())}
+    """Load the aligned eventtime data, create the store if needed"""
+
+    if not os.path.exists(STORE_PATH):
+        update_eventtime(get_eventtime_api(get_station_numbers()))
+    return load_eventtime()
 
 
 def get_station_end_timestamp(station, data):
-    """Read all eventtime data into a dictionary"""
+    """Get the end of the last hour with data for inactive stations"""
 
     if Station(station, force_stale=True).info['active']:
         return None
     else:
-        # Start of day after last day with data
-        return data[station]['timestamp'][-1] + 3600
+        # Start of hour after last hour with data
+        return data.last_timestamp(station) + 3600
 
 
-def get_aligned(data):
-    """Get data and align it in an array
+def get_aligned(data=None):
+    """Get the aligned data
 
     Data from a station is on a row, the columns are the hourly bins.
 
+    :param data: Eventtime instance, loaded from the store if not given.
+
     :return: several things are returned:
         - the aligned data filtered for number of events in the hour
         - the aligned data unfiltered
         - first and last timestamp of the array
 
     """
-    first = min(values['timestamp'][0] for values in data.values())
-    last = max(values['timestamp'][-1] for values in data.values())
-
-    aligned_data = zeros((len(data.keys()), (last - first) / 3600 + 1))
-    aligned_data_all = zeros((len(data.keys()), (last - first) / 3600 + 1))
-
-    for i, sn in enumerate(sorted(data.keys())):
-        start = (data[sn]['timestamp'][0] - first) / 3600
-        end = start + len(data[sn])
-        aligned_data[i, start:end] = where((data[sn]['counts'] > 500) &
-                                           (data[sn]['counts'] < 5000),
-                                           data[sn]['counts'], 0)
-        aligned_data_all[i, start:end] = data[sn]['counts']
-    return aligned_data, aligned_data_all, first, last
+    if data is None:
+        data = get_data()
+    aligned_data = where(data.active, data.counts, 0)
+    return aligned_data, data.counts, data.first, data.last
 
 
 def plot_luminosity(timestamp, aligned_data, aligned_data_all, i):
@@ -148,10 +141,10 @@ def plot_active_stations(timestamps, stations, aligned_data, data, i):
 if __name__ == "__main__":
     if 'data' not in globals():
         data = get_data()
-        data_spa = {s: data[s] for s in SPA_STATIONS}
+        data_spa = data.select(SPA_STATIONS)
 
     for i, d in enumerate([data, data_spa]):
-        stations = sorted(d.keys())
+        stations = d.stations
         aligned_data, aligned_data_all, first, last = get_aligned(d)
         timestamp = range(first, last + 1, 3600)
         plot_active_stations(timestamp, stations, aligned_data, d, i)
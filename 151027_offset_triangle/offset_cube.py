@@ -0,0 +1,103 @@
+"""Station timing offsets for many stations and timestamps at once
+
+`Station.station_timing_offset` looks up a single offset for a single
+timestamp. Here the offset tables for all pairs of stations are read once
+and the offsets at all requested timestamps are looked up with
+`searchsorted`, giving (reference x station x timestamps) arrays of the
+offsets and errors. The table of a pair is only read once, the offsets of
+the reversed pair have the opposite sign and the same error.
+
+The result is cached on disk, keyed by the stations and timestamps.
+
+Example::
+
+    offsets, errors = offset_cube([501, 502, 503], range(START, STOP, STEP))
+    offsets[0, 1]  # offsets of 502 relative to 501 over time
+
+"""
+import os
+
+from itertools import combinations
+
+from numpy import array, array_equal, full, load, nan, savez, searchsorted, zeros
+
+from sapphire import Station
+
+CUBE_PATH = '/Users/arne/Datastore/station_offsets/offset_cube.npz'
+
+
+def lookup_offsets(table, timestamps):
+    """Look up offsets and errors in an offset table
+
+    Like `Station.station_timing_offset`, the last entry at or before a
+    timestamp is used, the first entry for earlier timestamps.
+
+    :param table: array with timestamp, offset and error columns.
+    :param timestamps: array of timestamps.
+    :return: arrays with the offset and error at each timestamp.
+
+    """
+    if not len(table):
+        return full(len(timestamps), nan), full(len(timestamps), nan)
+    idx = searchsorted(table['timestamp'], timestamps, side='right') - 1
+    idx[idx < 0] = 0
+    return table['offset'][idx], table['error'][idx]
+
+
+def get_offset_tables(stations):
+    """Get the offset table for each pair of stations
+
+    :return: dictionary with tables for (reference, station) pairs, with
+             the reference before the station in the list.
+
+    """
+    station_objects = {station: Station(station, force_stale=True)
+                       for station in stations}
+    return {(ref, station): station_objects[station].station_timing_offsets(ref)
+            for ref, station in combinations(stations, 2)}
+
+
+def build_offset_cube(stations, timestamps):
+    """Determine the offsets and errors for all pairs at all timestamps
+
+    :param stations: list of station numbers.
+    :param timestamps: array of timestamps.
+    :return: offsets and errors arrays (reference x station x timestamps).
+             The diagonals are zero.
+
+    """
+    n = len(stations)
+    offsets = zeros((n, n, len(timestamps)))
+    errors = zeros((n, n, len(timestamps)))
+    tables = get_offset_tables(stations)
+    for (i, ref), (j, station) in combinations(enumerate(stations), 2):
+        offset, error = lookup_offsets(tables[(ref, station)], timestamps)
+        offsets[i, j] = offset
+        offsets[j, i] = -offset
+        errors[i, j] = error
+        errors[j, i] = error
+    return offsets, errors
+
+
+def offset_cube(stations, timestamps, path=CUBE_PATH):
+    """Get the offsets and errors cube, from the cache if possible
+
+    :param stations: list of station numbers.
+    :param timestamps: array of timestamps.
+    :param path: path to the cache file, no caching if None.
+    :return: offsets and errors arrays (reference x station x timestamps).
+
+    """
+    stations = array(stations)
+    timestamps = array(timestamps)
+    if path is not None and os.path.exists(path):
+        cache = load(path)
+        if (array_equal(cache['stations'], stations) and
+                array_equal(cache['timestamps'], timestamps)):
+            return cache['offsets'], cache['errors']
+
+    offsets, errors = build_offset_cube(stations.tolist(), timestamps)
+    if path is not None:
+        savez(path, stations=stations, timestamps=timestamps,
+              offsets=offsets, errors=errors)
+    return offsets, errors
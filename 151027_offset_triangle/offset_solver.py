@@ -0,0 +1,117 @@
+"""Consistent station offsets from all pairwise offsets
+
+The offset between each pair of stations is determined independently,
+so going around a loop of stations (e.g. 501 -> 502 -> 503 -> 501) does
+not exactly give zero. Instead of enumerating all loops, for each time
+bin the station offsets x are determined which best match all pairwise
+offsets d_ij ~ x_j - x_i, weighted by 1 / error ** 2. This is a weighted
+least squares problem with the (sparse) graph Laplacian of the stations.
+
+What remains of each pairwise offset (d_ij - (x_j - x_i)) is the part
+that is inconsistent with the other pairs, i.e. the loop residual of
+that edge.
+
+"""
+from numpy import arange, array, bincount, concatenate, full, isfinite, maximum, nan, nonzero, zeros
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import spsolve
+
+MIN_ERROR = 0.1  # ns, prevents infinite weights for zero errors
+
+
+def solve_offsets(offsets, errors, reference=0):
+    """Least squares station offsets for a single time bin
+
+    :param offsets: (n x n) array, offsets[i, j] is the offset of station
+                    j relative to station i, nan if not available.
+    :param errors: (n x n) array with the errors of the offsets.
+    :param reference: index of the station which gets offset 0. In parts
+                      of the network not connected to the reference the
+                      first station is used.
+    :return: array with the offset of each station, nan for stations
+             without any offsets, and an (n x n) array with the residuals
+             of the pairwise offsets.
+
+    """
+    n = len(offsets)
+    i, j = nonzero(isfinite(offsets) & isfinite(errors))
+    keep = i < j
+    i, j = i[keep], j[keep]
+    d = offsets[i, j]
+    w = 1. / maximum(errors[i, j], MIN_ERROR) ** 2
+
+    x = full(n, nan)
+    residuals = full((n, n), nan)
+    if not len(d):
+        return x, residuals
+
+    # Weighted Laplacian L = A^T W A and right hand side A^T W d, with A
+    # the incidence matrix of the edges (-1 for i, +1 for j).
+    rows = concatenate((i, j, i, j))
+    columns = concatenate((i, j, j, i))
+    values = concatenate((w, w, -w, -w))
+    laplacian = coo_matrix((values, (rows, columns)), shape=(n, n)).tocsr()
+    rhs = bincount(j, w * d, minlength=n) - bincount(i, w * d, minlength=n)
+
+    # One station per connected part of the network is fixed at zero
+    n_components, labels = connected_components(laplacian, directed=False)
+    connected = zeros(n, dtype=bool)
+    connected[i] = True
+    connected[j] = True
+    anchors = zeros(n, dtype=bool)
+    for component in range(n_components):
+        members = nonzero((labels == component) & connected)[0]
+        if not len(members):
+            continue
+        anchor = reference if reference in members else members[0]
+        anchors[anchor] = True
+
+    x[anchors] = 0.
+    free = nonzero(connected & ~anchors)[0]
+    if len(free):
+        x[free] = spsolve(laplacian[free][:, free].tocsc(), rhs[free])
+
+    residuals[i, j] = d - (x[j] - x[i])
+    residuals[j, i] = -residuals[i, j]
+    return x, residuals
+
+
+def solve_offset_cube(offsets, errors, reference=0):
+    """Least squares station offsets for each time bin
+
+    :param offsets,errors: (reference x station x timestamps) arrays, as
+                           returned by `offset_cube`.
+    :return: (stations x timestamps) array of station offsets and a
+             (reference x station x timestamps) array of residuals.
+
+    """
+    n, _, n_bins = offsets.shape
+    x = full((n, n_bins), nan)
+    residuals = full(offsets.shape, nan)
+    for t in range(n_bins):
+        x[:, t], residuals[:, :, t] = solve_offsets(offsets[:, :, t], errors[:, :, t], reference)
+    return x, residuals
+
+
+def consistent_offsets(x):
+    """Pairwise offsets following from the station offsets
+
+    :param x: array with station offsets, optionally with a time axis.
+    :return: array with x[j] - x[i] for all pairs.
+
+    """
+    x = array(x)
+    return x[None, :] - x[:, None]
+
+
+def edge_residuals(residuals):
+    """Residuals of the pairs (i < j), flattened over any time axis
+
+    :return: array with the residuals of the measured pairs.
+
+    """
+    n = len(residuals)
+    i, j = nonzero(arange(n)[:, None] < arange(n)[None, :])
+    values = residuals[i, j].ravel()
+    return values[isfinite(values)]
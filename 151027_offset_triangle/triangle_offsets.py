@@ -2,14 +2,17 @@
 
 from datetime import datetime
 from functools import partial
-from itertools import combinations, permutations
+from itertools import combinations
 
-from numpy import array, histogram, histogram2d, isnan, nanmean
+from numpy import array, histogram, histogram2d, isnan
 
 from artist import Plot
 
 from sapphire import Station, datetime_to_gps
 
+from offset_cube import offset_cube
+from offset_solver import edge_residuals, solve_offset_cube
+
 START = datetime_to_gps(datetime(2011, 6, 1))
 STOP = datetime_to_gps(datetime(2016, 2, 1))
 STEP = int(86400 * 1)
@@ -41,133 +44,106 @@ def get_aligned_offsets(*args, **kwargs):
     return get_aligned_data(0, *args, **kwargs)
 
 
-def get_aligned_errors(offsets, start=START, stop=STOP, step=STEP):
+def get_aligned_errors(*args, **kwargs):
     """Get dictionary of dictionaries with arrays with errors"""
     return get_aligned_data(1, *args, **kwargs)
 
 
-def get_aligned_data(idx, offsets, start=START, stop=STOP, step=STEP):
-    """Get dictionary of dictionaries with arrays with offsets or errors"""
+def get_aligned_data(idx, stations=STATIONS, start=START, stop=STOP, step=STEP):
+    """Get dictionary of dictionaries with arrays with offsets or errors
+
+    The values for all pairs and timestamps are looked up at once, see
+    `offset_cube`.
 
+    """
     timestamps = range(start, stop, step)
-    aoffsets = {ref: {s: array([o(ts)[0] for ts in timestamps])
-                      for s, o in stations.iteritems()}
-                for ref, stations in offsets.iteritems()}
+    cube = offset_cube(stations, timestamps)[idx]
+    aoffsets = {ref: {s: cube[i, j] for j, s in enumerate(stations) if not s == ref}
+                for i, ref in enumerate(stations)}
     return aoffsets
 
 
-def round_trip(offsets):
-    """Examine offset distribution using intermediate stations over time
+def get_solved_offsets(stations=STATIONS, start=START, stop=STOP, step=STEP):
+    """Get the pairwise offsets and the least squares station offsets
 
-    Start and end station are the same, but hops via some other stations.
-    The result should ideally be an offset of 0 ns.
-
-    :param offsets: Dictionary of dictionaries with offset functions.
+    :return: timestamps, pairwise offsets (reference x station x
+             timestamps), station offsets (station x timestamps) and the
+             residuals of the pairwise offsets.
 
     """
-    aoffsets = get_aligned_offsets(offsets, START, STOP, STEP)
-    timestamps = range(START, STOP, STEP)
-    stations = offsets.keys()
-    for n in [2, 3, 4, 5]:
-        plot = Plot()
-        ts = []
-        offs = []
-        for ref in stations:
-            # Intermediate stations
-            for s in combinations(stations, n):
-                if ref in s:
-                    continue
-                offs.extend(aoffsets[ref][s[0]] + aoffsets[s[-1]][ref] +
-                            sum(aoffsets[s[i]][s[i + 1]] for i in range(n - 1)))
-                ts.extend(timestamps)
-        ts = array(ts)
-        offs = array(offs)
-        ts = ts.compress(~isnan(offs))
-        offs = offs.compress(~isnan(offs))
-        counts, xedges, yedges = histogram2d(ts, offs, bins=(timestamps[::4],
-                                                             range(-100, 101, 5)))
-        plot.histogram2d(counts, xedges, yedges, bitmap=True, type='color',
-                         colormap='viridis')
-        plot.set_colorbar()
-        plot.set_ylimits(-100, 100)
-        plot.set_title('n = %d' % n)
-        plot.set_ylabel(r'Station offset residual [\si{\ns}]')
-        plot.set_xlabel(r'Timestamp [\si{\s}]')
-        plot.save_as_pdf('plots/round_trip_%d' % n)
+    timestamps = range(start, stop, step)
+    offsets, errors = offset_cube(stations, timestamps)
+    x, residuals = solve_offset_cube(offsets, errors)
+    return timestamps, offsets, x, residuals
 
 
-def offset_distribution(offsets):
-    """Examine offset distribution using intermediate stations
+def round_trip(stations=STATIONS):
+    """Examine offset residuals over time
 
-    Start and end station are the same, but hops via some other stations.
-    The result should ideally be an offset of 0 ns.
+    The residuals are the parts of the pairwise offsets which are not
+    consistent with the offsets via all other stations, i.e. what remains
+    after going round trips. The result should ideally be 0 ns.
 
-    :param offsets: Dictionary of dictionaries with offset functions.
+    :param stations: list of station numbers.
 
     """
-    aoffsets = get_aligned_offsets(offsets, START, STOP, STEP)
-
-    stations = offsets.keys()
-    for n in [2, 3, 4, 5]:
-        plot = Plot()
-        offs = []
-        for ref in stations:
-            for s in permutations(stations, n):
-                if ref in s:
-                    continue
-                offs.extend(aoffsets[ref][s[0]] + aoffsets[s[-1]][ref] +
-                            sum(aoffsets[s[i]][s[i + 1]] for i in range(n - 1)))
-        plot.histogram(*histogram(offs, bins=range(-100, 100, 2)))
-        plot.set_xlimits(-100, 100)
-        plot.set_ylimits(min=0)
-        plot.set_title('n = %d' % n)
-        plot.set_xlabel(r'Station offset residual [\si{\ns}]')
-        plot.save_as_pdf('plots/round_trip_dist_%d' % n)
-
-
-def stopover(offsets):
-    """Compare direct to via offsets for stations far appart
-
-    :param offsets: Dictionary of dictionaries with offset functions.
+    timestamps, _, _, residuals = get_solved_offsets(stations)
+    i, j = zip(*combinations(range(len(stations)), 2))
+    offs = residuals[i, j].ravel()
+    ts = array(timestamps * len(i))
+    ts = ts.compress(~isnan(offs))
+    offs = offs.compress(~isnan(offs))
+
+    plot = Plot()
+    counts, xedges, yedges = histogram2d(ts, offs, bins=(timestamps[::4],
+                                                         range(-100, 101, 5)))
+    plot.histogram2d(counts, xedges, yedges, bitmap=True, type='color',
+                     colormap='viridis')
+    plot.set_colorbar()
+    plot.set_ylimits(-100, 100)
+    plot.set_ylabel(r'Station offset residual [\si{\ns}]')
+    plot.set_xlabel(r'Timestamp [\si{\s}]')
+    plot.save_as_pdf('plots/round_trip')
+
+
+def offset_distribution(stations=STATIONS):
+    """Examine the distribution of the offset residuals
+
+    :param stations: list of station numbers.
 
     """
-    aoffsets = get_aligned_offsets(offsets, START, STOP, STEP)
-    timestamps = range(START, STOP, STEP)
+    _, _, _, residuals = get_solved_offsets(stations)
 
-    stations = offsets.keys()
-    for from_station, to_station in combinations(stations, 2):
-        plot = Plot()
-        all_offs = []
+    plot = Plot()
+    plot.histogram(*histogram(edge_residuals(residuals), bins=range(-100, 100, 2)))
+    plot.set_xlimits(-100, 100)
+    plot.set_ylimits(min=0)
+    plot.set_xlabel(r'Station offset residual [\si{\ns}]')
+    plot.save_as_pdf('plots/round_trip_dist')
 
-        for i, via_station in enumerate(stations):
-            if via_station in [from_station, to_station]:
-                continue
-            offs = (aoffsets[from_station][via_station] +
-                    aoffsets[via_station][to_station])
 
-            all_offs.append(offs)
+def stopover(stations=STATIONS):
+    """Compare direct to the offsets consistent with all other stations
 
-            plot.plot(timestamps, offs, linestyle='very thin, black!%d' % (i * 5 + 30),
-                      mark=None)
+    :param stations: list of station numbers.
 
-        offs = aoffsets[from_station][to_station]
-        plot.plot(timestamps, offs, linestyle='red', mark=None)
-        # all_offs.append(offs)
+    """
+    timestamps, offsets, x, _ = get_solved_offsets(stations)
 
-        mean_offs = nanmean(all_offs, axis=0)
-        plot.plot(timestamps, mean_offs, linestyle='blue', mark=None)
+    for (i, from_station), (j, to_station) in combinations(enumerate(stations), 2):
+        plot = Plot()
+        plot.plot(timestamps, offsets[i, j], linestyle='red', mark=None)
+        plot.plot(timestamps, x[j] - x[i], linestyle='blue', mark=None)
 
         plot.set_xlimits(START, STOP)
         plot.set_ylimits(-100, 100)
-        plot.set_ylabel(r'Station offset residual [\si{\ns}]')
+        plot.set_ylabel(r'Station offset [\si{\ns}]')
         plot.set_xlabel('Timestamp')
         plot.set_axis_options('line join=round')
         plot.save_as_pdf('plots/stop_over_%d_%d' % (from_station, to_station))
 
 
 if __name__ == "__main__":
-    if 'offsets' not in globals():
-        offsets = get_offsets()
-#     round_trip(offsets)
-#     offset_distribution(offsets)
-    stopover(offsets)
+#     round_trip()
+#     offset_distribution()
+    stopover()
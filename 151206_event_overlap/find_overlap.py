@@ -9,6 +9,12 @@ I was not able to reproduce the misaligned traces seen in 150522_dead_time.
 This script downloads the relevant data and looks for the size of the overlap
 in the traces.
 
+The overlap between the end of a trace and the start of the next is found
+by comparing rolling (polynomial) hashes of all suffixes and prefixes at
+once, which takes O(n) per pair instead of O(n^2). The overlap length for
+each pair of consecutive events is stored in the 'trace_overlap' array
+next to the events table.
+
 """
 import os
 
@@ -16,11 +22,17 @@ from datetime import datetime
 
 import tables
 
-from numpy import array
+from numpy import arange, array, array_equal, concatenate, cumsum, full, int64, nonzero
+
+from sapphire import download_data
 
-from sapphire import Station, download_data
+from trace_cache import TraceCache, fetch_traces
 
 DATA = '/Users/arne/Datastore/event_overlap.h5'
+MAX_DT = 1e4  # ns, only compare traces of events closer than this
+HASH_BASE = 1000003
+HASH_MODULUS = 2147483647  # 2 ** 31 - 1, products of two hashes fit in int64
+_powers = array([1], dtype=int64)
 
 
 def get_data():
@@ -32,19 +44,103 @@ def get_data():
 
 
 def find_overlaps():
-    with tables.open_file(DATA, 'r') as data:
-        events = data.root.s99.events
-        s = Station(99)
-        for i in range(events.nrows - 1):
-            if events[i + 1]['ext_timestamp'] - events[i]['ext_timestamp'] > 1e4:
-                continue
-            t1 = s.event_trace(events[i]['timestamp'], events[i]['nanoseconds'], True)
-            t2 = s.event_trace(events[i + 1]['timestamp'], events[i + 1]['nanoseconds'], True)
-            overlap = longest_overlap(t1[0], t2[0])
-            if overlap is not None:
-                print i, len(overlap) * 2.5, 'ns'
-            else:
-                print i, 'No overlap'
+    with tables.open_file(DATA, 'a') as data:
+        events = data.root.s99.events.read()
+        close = close_pairs(events)
+        with TraceCache() as cache:
+            traces = fetch_traces(cache, [(99, event['timestamp'], event['nanoseconds'])
+                                          for i in close for event in events[i:i + 2]])
+
+        def get_trace(event):
+            event_traces = traces[(99, int(event['ext_timestamp']))]
+            return None if event_traces is None else event_traces[0]
+
+        overlaps = event_overlaps(events, get_trace)
+        store_overlaps(data, data.root.s99, overlaps)
+
+    for i, overlap in enumerate(overlaps):
+        if overlap > 0:
+            print i, overlap * 2.5, 'ns'
+        elif overlap == 0:
+            print i, 'No overlap'
+
+
+def event_overlaps(events, get_trace, max_dt=MAX_DT):
+    """Determine the trace overlap for each pair of consecutive events
+
+    :param events: array of events, sorted by ext_timestamp.
+    :param get_trace: function returning the trace for an event, or None
+                      if the trace is not available.
+    :param max_dt: maximum time between events to compare the traces.
+    :return: array with for event i the overlap length (in samples) with
+             event i + 1, -1 if the pair was not compared.
+
+    """
+    overlaps = full(len(events), -1, dtype='int32')
+    previous_idx, previous_trace = None, None
+    for i in close_pairs(events, max_dt):
+        # Reuse the trace if the event was also in the previous pair
+        trace = previous_trace if previous_idx == i else get_trace(events[i])
+        previous_idx, previous_trace = i + 1, get_trace(events[i + 1])
+        if trace is not None and previous_trace is not None:
+            overlaps[i] = overlap_length(trace, previous_trace)
+    return overlaps
+
+
+def close_pairs(events, max_dt=MAX_DT):
+    """Get the indices of events which are close to the next event"""
+
+    ets = events['ext_timestamp']
+    return nonzero(ets[1:] - ets[:-1] <= max_dt)[0]
+
+
+def store_overlaps(data, group, overlaps):
+    """Store the overlap lengths as column next to the events table"""
+
+    if 'trace_overlap' in group:
+        data.remove_node(group, 'trace_overlap')
+    data.create_array(group, 'trace_overlap', overlaps)
+
+
+def hash_powers(n):
+    """Get HASH_BASE ** i modulo HASH_MODULUS for i < n"""
+
+    global _powers
+    while len(_powers) < n:
+        step = len(_powers)
+        _powers = concatenate([_powers, _powers * pow(HASH_BASE, step, HASH_MODULUS) % HASH_MODULUS])
+    return _powers[:n]
+
+
+def overlap_length(a, b):
+    """Find the length of the longest overlap between two traces
+
+    Find the longest sublist which is at the end of list a and at the
+    start of list b. The hashes of all suffixes of a and all prefixes of
+    b are compared at once, matching hashes are verified.
+
+    :param a,b: the lists to compare.
+    :return: the number of overlapping elements.
+
+    """
+    n = min(len(a), len(b))
+    if not n:
+        return 0
+    a = array(a[len(a) - n:], dtype=int64) % HASH_MODULUS
+    b = array(b[:n], dtype=int64) % HASH_MODULUS
+    powers = hash_powers(n)
+
+    # hash of a[j:] is (cum_a[n] - cum_a[j]) / base ** j, instead of
+    # dividing compare to the prefix hash of b multiplied by base ** j.
+    cum_a = concatenate([[0], cumsum(a * powers % HASH_MODULUS)])
+    cum_b = cumsum(b * powers % HASH_MODULUS) % HASH_MODULUS
+    starts = arange(n)
+    suffix = (cum_a[n] - cum_a[starts]) % HASH_MODULUS
+    prefix = powers[starts] * cum_b[n - 1 - starts] % HASH_MODULUS
+    for start in nonzero(suffix == prefix)[0]:
+        if array_equal(a[start:], b[:n - start]):
+            return n - start
+    return 0
 
 
 def longest_overlap(a, b):
@@ -59,15 +155,9 @@ def longest_overlap(a, b):
     :return: the overlapping sublist.
 
     """
-    a = array(a)
-    b = array(b)
-    if len(a) <= len(b):
-        max_length = len(a)
-    else:
-        max_length = len(b)
-    for i in xrange(max_length):
-        if all(a[-max_length + i:] == b[:max_length - i]):
-            return a[-max_length + i:]
+    length = overlap_length(a, b)
+    if length:
+        return array(a)[-length:]
 
 
 if __name__ == "__main__":
@@ -0,0 +1 @@
+../150604_many_peaks/trace_cache.py
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""Single-pass binned statistics for multiple columns at once
+
+`scipy.stats.binned_statistic` handles one column per call and uses a
+Python callable for statistics like `std`. Here all columns are binned
+simultaneously by combining the bin index with the column index, so the
+counts, sums and sums of squares follow from three calls to `bincount`.
+The median is determined by sorting all values per (column, bin) group
+once and picking the middle elements of each group.
+
+"""
+from __future__ import division
+
+from numpy import atleast_2d, bincount, broadcast_to, errstate, isnan, lexsort, nan, searchsorted, sqrt, where
+
+
+def bin_indices(x, bins):
+    """Get the bin index for each value in x
+
+    Like `scipy.stats.binned_statistic` values equal to the last bin edge
+    are included in the last bin.
+
+    :param x: values to bin.
+    :param bins: monotonically increasing bin edges.
+    :return: bin index for each value, -1 for values outside the bins.
+
+    """
+    n_bins = len(bins) - 1
+    idx = searchsorted(bins, x, side='right') - 1
+    idx = where(x == bins[-1], n_bins - 1, idx)
+    return where((idx >= 0) & (idx < n_bins), idx, -1)
+
+
+def binned_moments(x, y, bins, median=False):
+    """Bin the values in y by x and determine the moments per bin
+
+    Each column of x is paired with the same column of y, i.e. the
+    statistics for column i are those of y[:, i] binned by x[:, i].
+    If x is one-dimensional it is used for all columns of y.
+
+    :param x: array (n,) or (n, m) of values to bin by.
+    :param y: array (n, m) of values for which to determine the statistics.
+    :param bins: monotonically increasing bin edges.
+    :param median: if True, also determine the median per bin.
+    :return: dictionary with the count, mean, std (and median) per bin,
+             each with shape (n_bins, m). The mean, std and median are
+             nan for empty bins.
+
+    """
+    y = atleast_2d(y.T).T
+    x = broadcast_to(atleast_2d(x.T).T, y.shape)
+    n_bins = len(bins) - 1
+    n_columns = y.shape[1]
+
+    idx = bin_indices(x, bins)
+    valid = (idx >= 0) & ~isnan(y)
+    # Combined index: the bins of each column are placed after each other
+    combined = (idx + n_bins * broadcast_to(range(n_columns), y.shape))[valid]
+    values = y[valid]
+
+    length = n_bins * n_columns
+    count = bincount(combined, minlength=length)
+    total = bincount(combined, weights=values, minlength=length)
+    total_sq = bincount(combined, weights=values ** 2, minlength=length)
+
+    with errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = total_sq / count - mean ** 2
+    # Prevent negative variance due to floating point round-off
+    std = sqrt(where(variance > 0, variance, 0.))
+    std = where(count > 0, std, nan)
+
+    moments = {'count': count, 'sum': total, 'sum_sq': total_sq,
+               'mean': mean, 'std': std}
+
+    if median:
+        moments['median'] = _grouped_median(combined, values, count)
+
+    return {key: value.reshape(n_columns, n_bins).T
+            for key, value in moments.items()}
+
+
+def _grouped_median(groups, values, count):
+    """Determine the median of values for each group
+
+    :param groups: group index for each value.
+    :param values: the values.
+    :param count: number of values in each group.
+    :return: median per group, nan for empty groups.
+
+    """
+    sorted_values = values[lexsort((values, groups))]
+    start = count.cumsum() - count
+    low = start + (count - 1) // 2
+    high = start + count // 2
+    filled = count > 0
+    median = where(filled, 0., nan)
+    median[filled] = (sorted_values[low[filled]] +
+                      sorted_values[high[filled]]) / 2.
+    return median
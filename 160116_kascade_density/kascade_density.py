@@ -23,20 +23,24 @@ predicted density as the input. After fitting the curve (in = f(out)) the
 output can be converted back to the actual expected output.
 
 """
+import os
+
 import tables
 
 from numpy import (
-    abs, append, array, copyto, cos, diff, empty_like, histogram, histogram2d, inf, interp, linspace, log10, logspace,
-    mean, median, sqrt, std, where, zeros)
-from scipy.stats import binned_statistic, norm, poisson
+    abs, append, array, column_stack, copyto, cos, diff, empty_like, histogram, histogram2d, inf, interp, linspace,
+    load, log10, logspace, mean, median, savez, sqrt, where, zeros)
+from scipy.stats import norm, poisson
 
 from artist import MultiPlot, Plot
 
 from sapphire.analysis.find_mpv import FindMostProbableValueInSpectrum as FindMPV
 
+from binned_moments import binned_moments
 from fit_curve import fit_curve, fit_function
 
 DATA_PATH = '/Users/arne/Datastore/kascade/kascade-reconstructions.h5'
+CACHE_PATH = '/Users/arne/Datastore/kascade/kascade-densities.npz'
 COLORS = ['black', 'red', 'green', 'blue']
 
 SRC_PH_MPV = 380.  # Pulseheight MPV used for n columns in data file
@@ -80,7 +84,22 @@ def residuals(yfit, ydata):
 
 class KascadeDensity(object):
 
-    def __init__(self, data_path=DATA_PATH):
+    # Derived arrays and fits stored in the cache
+    cached_attributes = ('src_pi', 'src_p', 'mpv_pi', 'mpv_p',
+                         'src_ni', 'src_n', 'mpv_ni', 'mpv', 'mpv_n',
+                         'zenith', 'src_ki', 'src_k', 'cor_ki', 'cor_k',
+                         'med_ki', 'std_ki', 'med_k', 'std_k',
+                         'cor_ni', 'fit_i', 'ref_in_i', 'fit', 'ref_in', 'cor_n',
+                         'res_ni', 'res_n')
+
+    def __init__(self, data_path=DATA_PATH, cache_path=CACHE_PATH):
+        """Read the densities, from the cache if it is up to date
+
+        :param data_path: path to the combined KASCADE/HiSPARC data.
+        :param cache_path: path to the file in which the derived arrays
+                           are stored, use None to disable the cache.
+
+        """
         self.lin_bins = linspace(0.5, 200.5, 201)
         narrow_bins = linspace(0.5, 30.5, 31)
 #         wide_bins = linspace(31.5, 40.5, 4)
@@ -91,10 +110,43 @@ class KascadeDensity(object):
         self.log_bins = logspace(log10(self.lin_bins[0]),
                                  log10(self.lin_bins[-1]), 100)
 
-        with tables.open_file(DATA_PATH, 'r') as data:
-            self.read_densities(data)
+        if not self.load_cache(data_path, cache_path):
+            with tables.open_file(data_path, 'r') as data:
+                self.read_densities(data)
+            self.store_cache(cache_path)
 #         self.process_densities()
 
+    def load_cache(self, data_path, cache_path):
+        """Load derived arrays from the cache
+
+        The cache is only used if it is newer than the data file and if it
+        was made with the same slice bins.
+
+        :return: True if the cache was loaded.
+
+        """
+        if cache_path is None or not os.path.exists(cache_path):
+            return False
+        if os.path.getmtime(cache_path) < os.path.getmtime(data_path):
+            return False
+        cache = load(cache_path)
+        if (cache['slice_bins'].shape != self.slice_bins.shape or
+                not (cache['slice_bins'] == self.slice_bins).all()):
+            return False
+        if not all(key in cache for key in self.cached_attributes):
+            return False
+        for key in self.cached_attributes:
+            setattr(self, key, cache[key])
+        return True
+
+    def store_cache(self, cache_path):
+        """Store derived arrays in the cache"""
+
+        if cache_path is None:
+            return
+        savez(cache_path, slice_bins=self.slice_bins,
+              **{key: getattr(self, key) for key in self.cached_attributes})
+
     def read_densities(self, data):
         """Read and process data points"""
 
@@ -129,18 +181,15 @@ class KascadeDensity(object):
         self.cor_k = self.src_k * cos(self.zenith)
 
         # Median actual (KASCADE) for given measurement (HiSPARC)
-        self.med_ki = zeros((len(self.slice_bins_c), 4))
-        self.std_ki = zeros((len(self.slice_bins_c), 4))
-        for i in range(4):
-            self.med_ki[:, i] = binned_statistic(self.mpv_ni[:, i], self.src_ki[:, i],
-                                                 statistic='mean', bins=self.slice_bins)[0]
-            std_ki = binned_statistic(self.mpv_ni[:, i], self.src_ki[:, i],
-                                      statistic=std, bins=self.slice_bins)[0]
-            self.std_ki[:, i] = where(std_ki < self.med_ki[:, i], std_ki, self.med_ki[:, i] - 0.0001)
-        self.med_k = binned_statistic(self.mpv_n, self.src_k,
-                                      statistic='mean', bins=self.slice_bins)[0]
-        self.std_k = binned_statistic(self.mpv_n, self.src_k,
-                                      statistic=std, bins=self.slice_bins)[0]
+        # Detectors and station average are binned in a single pass
+        moments = binned_moments(column_stack((self.mpv_ni, self.mpv_n)),
+                                 column_stack((self.src_ki, self.src_k)),
+                                 bins=self.slice_bins)
+        self.med_ki = moments['mean'][:, :4]
+        std_ki = moments['std'][:, :4]
+        self.std_ki = where(std_ki < self.med_ki, std_ki, self.med_ki - 0.0001)
+        self.med_k = moments['mean'][:, 4]
+        self.std_k = moments['std'][:, 4]
 
         # Fit PMT curve
         # Fit on the medians of slices, i.e. for given measured value what is
@@ -0,0 +1,87 @@
+"""Convolve model distributions with an angle dependent resolution
+
+A model distribution f on a grid of angles is smeared out by a gaussian
+resolution which may depend on the true angle:
+
+    result[k] = sum_i f(x_i) * gauss(x_k, mu=x_i, sigma=sigma(x_i))
+
+This is a matrix product with a kernel matrix which only depends on the
+resolution parameters, not on the model parameters. The kernel is
+computed in one array operation and cached, so the model parameters can
+be fitted without recomputing it. If the resolution does not depend on
+the angle the convolution is done using FFT.
+
+"""
+from __future__ import division
+
+from numpy import arange, exp, interp, pi, radians, sqrt
+from scipy.signal import fftconvolve
+
+GRID = arange(0.1, 85, 0.1)  # degrees
+
+
+def gauss_pdf(x, mu, sigma):
+    return exp(-(x - mu) ** 2 / (2 * sigma ** 2)) / (sqrt(2 * pi) * sigma)
+
+
+class ResolutionConvolution(object):
+
+    """Convolution with a resolution over a fixed grid of angles
+
+    :param resolution: function of the angles (radians) and the
+                       resolution parameters, giving the resolution
+                       (radians) for each angle.
+    :param grid: angles (degrees) on which the model is evaluated.
+    :param shift_invariant: if True the resolution is the same for all
+                            angles and FFT convolution is used.
+    :param cache_size: number of kernels to keep.
+
+    """
+
+    def __init__(self, resolution, grid=GRID, shift_invariant=False, cache_size=8):
+        self.resolution = resolution
+        self.grid = grid
+        self.rgrid = radians(grid)
+        self.shift_invariant = shift_invariant
+        self.cache_size = cache_size
+        self._kernels = {}
+        # Differences between all (observed, true) angle pairs
+        self._differences = None if shift_invariant else self.rgrid[:, None] - self.rgrid[None, :]
+
+    def kernel(self, *resolution_parameters):
+        """Kernel matrix (observed x true angle) for the resolution"""
+
+        key = tuple(resolution_parameters)
+        if key not in self._kernels:
+            if len(self._kernels) >= self.cache_size:
+                self._kernels.clear()
+            if self.shift_invariant:
+                step = self.rgrid[1] - self.rgrid[0]
+                offsets = step * arange(-len(self.rgrid) + 1, len(self.rgrid))
+                sigma = self.resolution(0., *resolution_parameters)
+                self._kernels[key] = gauss_pdf(offsets, 0., sigma)
+            else:
+                sigma = self.resolution(self.rgrid, *resolution_parameters)
+                self._kernels[key] = gauss_pdf(self._differences, 0., sigma[None, :])
+        return self._kernels[key]
+
+    def convolve(self, values, *resolution_parameters):
+        """Convolve model values on the grid with the resolution"""
+
+        kernel = self.kernel(*resolution_parameters)
+        if self.shift_invariant:
+            n = len(values)
+            return fftconvolve(values, kernel)[n - 1:2 * n - 1]
+        return kernel.dot(values)
+
+    def convolved_model(self, model, x, model_parameters, resolution_parameters):
+        """Evaluate a convolved model at some angles
+
+        :param model: function of the angle (degrees) and the model
+                      parameters.
+        :param x: angles (degrees) at which to evaluate the result.
+        :return: convolved model, interpolated at x.
+
+        """
+        result = self.convolve(model(self.grid, *model_parameters), *resolution_parameters)
+        return interp(radians(x), self.rgrid, result)
@@ -0,0 +1,220 @@
+"""Fetch daily station histograms in bulk and keep them in a local cache
+
+The station statistics (zenith, azimuth, pulseheight and eventtime
+histograms) are available per day from the data source. `Station.zenith`
+and friends request a single day at a time. Here the requested days which
+are not yet in the local cache are fetched concurrently (with a bounded
+number of connections) and stored in a PyTables file, with per station
+and histogram type an index table of the dates and the histogram rows in
+a single array.
+
+Example::
+
+    with HistogramCache() as cache:
+        dates, bins, counts = stacked_histograms(cache, 501, 'zenith', dates)
+
+"""
+import warnings
+
+from datetime import date
+
+import tables
+
+from numpy import array, empty, genfromtxt, vstack
+
+from six import BytesIO
+
+from cached_fetch import N_WORKERS, fetch_urls
+
+SRC_BASE = 'http://data.hisparc.nl/show/source/'
+HISTOGRAM_URL = '{type}/{station_number}/{year}/{month}/{day}/'
+HISTOGRAM_CACHE_PATH = '/Users/arne/Datastore/station_histograms.h5'
+COLUMNS = {'zenith': ('angle', 'counts'),
+           'azimuth': ('angle', 'counts'),
+           'pulseheight': ('pulseheight', 'ph1', 'ph2', 'ph3', 'ph4'),
+           'eventtime': ('timestamp', 'counts')}
+
+
+class HistogramIndex(tables.IsDescription):
+    date = tables.UInt32Col(pos=0)
+    start = tables.UInt32Col(pos=1)
+    n_rows = tables.UInt32Col(pos=2)
+
+
+def date_key(d):
+    """Date as integer, e.g. 20150131"""
+
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+class HistogramCache(object):
+
+    """Persistent store of daily station histograms
+
+    For each histogram type and station there is an index table, with the
+    date and the location of the rows in the data array. Days without
+    data are stored with zero rows, so these are not requested again.
+
+    """
+
+    def __init__(self, path=HISTOGRAM_CACHE_PATH):
+        self.data = tables.open_file(path, 'a')
+        self._index = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def _group_path(self, station, type):
+        return '/%s/s%d' % (type, station)
+
+    def _get_index(self, station, type):
+        """Map of date key to start and number of rows"""
+
+        key = (station, type)
+        if key not in self._index:
+            try:
+                rows = self.data.get_node(self._group_path(station, type), 'index').read()
+            except tables.NoSuchNodeError:
+                rows = []
+            self._index[key] = {int(row['date']): (int(row['start']), int(row['n_rows']))
+                                for row in rows}
+        return self._index[key]
+
+    def __contains__(self, key):
+        station, type, d = key
+        return date_key(d) in self._get_index(station, type)
+
+    def get(self, station, type, d):
+        """Get a histogram from the cache
+
+        :return: array with a row per bin, an empty array if there is no
+                 data for the day, or None if not cached.
+
+        """
+        location = self._get_index(station, type).get(date_key(d))
+        if location is None:
+            return None
+        start, n_rows = location
+        if not n_rows:
+            return empty((0, len(COLUMNS[type])))
+        group = self.data.get_node(self._group_path(station, type))
+        return group.histograms[start:start + n_rows]
+
+    def store(self, station, type, d, histogram):
+        """Add a histogram to the cache, None if there is no data"""
+
+        index = self._get_index(station, type)
+        if date_key(d) in index:
+            return
+        path = self._group_path(station, type)
+        try:
+            group = self.data.get_node(path)
+        except tables.NoSuchNodeError:
+            parent, name = path.rsplit('/', 1)
+            group = self.data.create_group(parent, name, createparents=True)
+            self.data.create_table(group, 'index', HistogramIndex)
+            self.data.create_earray(group, 'histograms', tables.Float64Atom(),
+                                    shape=(0, len(COLUMNS[type])))
+        start = group.histograms.nrows
+        n_rows = 0 if histogram is None else len(histogram)
+        if n_rows:
+            group.histograms.append(histogram)
+        group.index.append([(date_key(d), start, n_rows)])
+        index[date_key(d)] = (start, n_rows)
+
+    def flush(self):
+        self.data.flush()
+
+
+def histogram_url(station, type, d, src_base=SRC_BASE):
+    return src_base + HISTOGRAM_URL.format(type=type, station_number=station,
+                                           year=d.year, month=d.month, day=d.day)
+
+
+def parse_histogram(tsv):
+    """Parse a histogram, None if there is no data for that day"""
+
+    histogram = genfromtxt(BytesIO(tsv), delimiter='\t', dtype='float64', comments='#', ndmin=2)
+    if not histogram.size:
+        return None
+    return histogram
+
+
+def fetch_histograms(cache, station, type, dates, n_workers=N_WORKERS, src_base=SRC_BASE):
+    """Get the histograms for many days, fetching only those not yet cached
+
+    Days from today onwards are fetched but not cached, they may still
+    be incomplete. Days which could not be fetched are not cached either,
+    these are reported in a warning and left out like days without data.
+
+    :param cache: a HistogramCache instance.
+    :param station: station number.
+    :param type: histogram type, one of zenith, azimuth, pulseheight and
+                 eventtime.
+    :param dates: list of dates.
+    :param n_workers: maximum number of concurrent requests.
+    :param src_base: base url of the data source.
+    :return: dictionary with the histogram (or None) for each date.
+
+    """
+    if type not in COLUMNS:
+        raise ValueError('Unknown histogram type: %s' % type)
+    dates = sorted(set(dates))
+    today = date.today()
+    todo = [d for d in dates if (station, type, d) not in cache]
+    recent = {}
+
+    def store(d, histogram):
+        if d >= today:
+            recent[d] = histogram
+        else:
+            cache.store(station, type, d, histogram)
+
+    try:
+        failed = fetch_urls(todo, lambda d: histogram_url(station, type, d, src_base), store,
+                            parse=parse_histogram, missing=True, n_workers=n_workers)
+    finally:
+        cache.flush()
+    if failed:
+        warnings.warn('Failed to fetch the %s histograms of station %d for %s' %
+                      (type, station, ', '.join('%s (%s)' % (d, failed[d]) for d in sorted(failed))))
+
+    histograms = {}
+    for d in dates:
+        histogram = recent[d] if d in recent else cache.get(station, type, d)
+        histograms[d] = histogram if histogram is not None and len(histogram) else None
+    return histograms
+
+
+def stacked_histograms(cache, station, type, dates, **kwargs):
+    """Get the histograms for many days as one array
+
+    Days without data are left out. The bins are taken from the first
+    day, all days should have the same bins (except eventtime).
+
+    :return: the dates with data, the bins (first column) and an array
+             (days x bins x columns) with the other columns.
+
+    """
+    histograms = fetch_histograms(cache, station, type, dates, **kwargs)
+    dates = [d for d in sorted(histograms) if histograms[d] is not None]
+    if not dates:
+        return [], array([]), empty((0, 0, len(COLUMNS[type]) - 1))
+    stacked = array([histograms[d] for d in dates])
+    return dates, stacked[0, :, 0], stacked[:, :, 1:]
+
+
+def concatenated_histograms(cache, station, type, dates, **kwargs):
+    """Get the histograms for many days concatenated, e.g. for eventtime"""
+
+    histograms = fetch_histograms(cache, station, type, dates, **kwargs)
+    values = [histograms[d] for d in sorted(histograms) if histograms[d] is not None]
+    if not values:
+        return empty((0, len(COLUMNS[type])))
+    return vstack(values)
@@ -2,33 +2,28 @@
 
 from __future__ import division
 
-from numpy import arange, array, cos, exp, interp, radians, sin, std, sum
+from datetime import date
+
+from numpy import arange, cos, exp, radians, sin, std, tile
 from scipy.optimize import curve_fit
 from scipy.stats import binned_statistic
 
 from artist import Plot
 
-from sapphire import Station
-from sapphire.utils import gauss
-
-
-def get_zenith_distribution():
-    station = Station(501)
-    counts = []
-    angles = []
-    for j in range(1, 13):
-        for i in range(1, 29):
-            try:
-                zenith_hist = station.zenith(2015, j, i)
-            except:
-                continue
-            total_counts = zenith_hist['counts'].sum()
-            if total_counts:
-                angles.extend(zenith_hist['angle'])
-                # Normalized
-                counts.extend(zenith_hist['counts'] / total_counts)
-    angles = array(angles).astype('float64')
-    counts = array(counts)
+from resolution_convolution import ResolutionConvolution
+from station_histograms import HistogramCache, stacked_histograms
+
+
+def get_zenith_distribution(station=501, year=2015):
+    dates = [date(year, j, i) for j in range(1, 13) for i in range(1, 29)]
+    with HistogramCache() as cache:
+        _, bins, counts = stacked_histograms(cache, station, 'zenith', dates)
+    counts = counts[:, :, 0]
+    total_counts = counts.sum(axis=1)
+    # Normalized
+    counts = counts[total_counts > 0] / total_counts[total_counts > 0, None]
+    angles = tile(bins, len(counts)).astype('float64')
+    counts = counts.ravel()
 
     angles += 1.5  # bin edges to bin centers
     angles_bins = arange(0, 91, 3)
@@ -89,17 +84,45 @@ def mod_ciampa(x, a, b):
     return a * geometry * exp(-b * (1 / cos(rx)))
 
 
+def zenith_resolution(rx, d):
+    """Resolution as function of zenith
+
+    :param rx: zenith in radians.
+    :param d: resolution at zenith 0 in degrees.
+    :return: resolution in radians.
+
+    """
+    return radians(d / cos(rx))
+
+
+CONVOLUTION = ResolutionConvolution(zenith_resolution)
+
+
+def rossi_conv(x, a, b, d):
+    """Rossi convolved with the zenith resolution
+
+    :param x: zenith in degrees.
+
+    """
+    return CONVOLUTION.convolved_model(rossi, x, (a, b), (d,))
+
+
+def iyono_conv(x, a, b, d):
+    """Iyono 2007 convolved with the zenith resolution
+
+    :param x: zenith in degrees.
+
+    """
+    return CONVOLUTION.convolved_model(iyono, x, (a, b), (d,))
+
+
 def mod_ciampa_conv_full(a, b, d):
     """ Based on Ciampa 1998: zenith angle distribution
 
     Positive C parameter
 
     """
-    x = arange(0.1, 85, 0.1)
-    rx = radians(x)
-    result = sum([gauss(rx, mod_ciampa(xi, a, b), rxi, radians(d / cos(rxi)))
-                  for xi, rxi in zip(x, rx)], axis=0)
-    return rx, result
+    return CONVOLUTION.rgrid, CONVOLUTION.convolve(mod_ciampa(CONVOLUTION.grid, a, b), d)
 
 
 def mod_ciampa_conv(x, a, b, d):
@@ -110,12 +133,11 @@ def mod_ciampa_conv(x, a, b, d):
     Positive C parameter
 
     """
-    rx, result = mod_ciampa_conv_full(a, b, d)
-    return interp(radians(x), rx, result)
+    return CONVOLUTION.convolved_model(mod_ciampa, x, (a, b), (d,))
 
 
 def plot_zenith(angle_centers, mean_counts, std_counts):
-    fit_functions = [rossi, iyono, mod_ciampa, mod_ciampa_conv]
+    fit_functions = [rossi, iyono, mod_ciampa, rossi_conv, iyono_conv, mod_ciampa_conv]
 
     rangle_centers = radians(angle_centers)
     sangle_centers = convert_angles(angle_centers)
@@ -16,26 +16,27 @@ Data contaminations:
   consecutive, by using 'set' on the distances spread out recurrances are
   also filtered.
 
+The locations of all stations are fetched concurrently, the positions
+are expressed as ENU offsets relative to the current location.
+
 """
-from numpy import arange, array, histogram, mean, percentile, sqrt
+from numpy import arange, histogram, mean, percentile, sqrt
 
 from artist import Plot
 
-from sapphire import HiSPARCNetwork
+from sapphire import Network
+
+from location_audit import enu_offsets, fetch_gps_locations
 
 
-def calculate_distances_to_cm(network):
+def calculate_distances_to_cm(locations):
     distr = []
     dist_hor = []
     dist_ver = []
-    for station in network.stations:
-        ref_x, ref_y, ref_z, _ = station.get_coordinates()
-        x = array(station.x)
-        y = array(station.y)
-        z = array(station.z)
-        distances = sqrt((x - ref_x) ** 2 +
-                         (y - ref_y) ** 2 +
-                         (z - ref_z) ** 2)
+    for station_number in sorted(locations):
+        station_locations = locations[station_number]
+        x, y, z = enu_offsets(station_locations, station_locations[-1]).T
+        distances = sqrt(x ** 2 + y ** 2 + z ** 2)
         close_by = distances < 15
         if len(close_by) > 3:
             # print station.number, len(close_by)
@@ -83,9 +84,9 @@ def plot_distributions_all(distances, distances_hor, distances_ver):
 
 
 if __name__ == "__main__":
-    if "network" not in globals():
-        network = HiSPARCNetwork()
-    distr, dist_hor, dist_ver = calculate_distances_to_cm(network)
+    if "locations" not in globals():
+        locations, _ = fetch_gps_locations(Network().station_numbers())
+    distr, dist_hor, dist_ver = calculate_distances_to_cm(locations)
     plot_distributions(distr)
     plot_distributions(dist_hor, '_horizontal')
     plot_distributions(dist_ver, '_vertical')
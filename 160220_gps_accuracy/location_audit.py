@@ -0,0 +1 @@
+../150723_bad_locations/location_audit.py
\ No newline at end of file
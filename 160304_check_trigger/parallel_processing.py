@@ -0,0 +1,330 @@
+"""(Re)process events in parallel
+
+`ProcessEventsWithTriggerOffset` decodes the traces and reconstructs the
+arrival and trigger times of all events in a single process, and it
+modifies the source (sorting and removing duplicates in place). Here the
+events are processed in chunks by worker processes. Each worker opens the
+data file read-only and makes the processing class only once.
+
+The trigger thresholds can be given explicitly (instead of using the
+thresholds from the API), the traces can be passed through a filter
+(e.g. `MeanFilter().filter_trace`) before they are used, and the trace
+observables (baseline, pulseheights, integrals, ...) can be determined
+again from the (filtered) traces.
+
+The source table is not changed, the processed events are sorted by
+ext_timestamp, without duplicates, and stored in a new table by the main
+process after the workers are done::
+
+    process_and_store_parallel(path, '/s505', 'events_filtered',
+                               station=505, trace_filter=MeanFilter().filter_trace)
+
+"""
+import multiprocessing
+import os
+
+import tables
+
+from numpy import array, concatenate, empty, histogram, isnan, linspace, nan, where
+
+from sapphire import Station
+from sapphire.analysis.find_mpv import FindMostProbableValueInSpectrum
+from sapphire.analysis.process_events import ProcessEvents, ProcessEventsWithTriggerOffset
+
+from trace_observables import OBSERVABLES, group_traces, trace_observables
+
+CHUNKSIZE = 10000
+OBSERVABLES_BATCH = 250
+PROCESSED_DTYPE = tables.description.dtype_from_descr(ProcessEvents.processed_events_description)
+TIMING_COLUMNS = ['t1', 't2', 't3', 't4', 't_trigger']
+
+_pe = None
+_observables = False
+_observable_thresholds = {}
+
+
+class ProcessEventsWithTraceFilter(ProcessEventsWithTriggerOffset):
+
+    """Reconstruct the arrival and trigger times from filtered traces
+
+    Traces are decoded (and filtered) when they are needed. Traces which
+    were already decoded to determine the observables can be set for the
+    next event with `set_event_traces`, so they are not decoded twice.
+    Only the traces of that one event are kept.
+
+    :param data: the PyTables datafile.
+    :param group: the group containing the station data.
+    :param source: the name of the events table.
+    :param station: Station object, to get the trigger settings from the
+                    API for each event.
+    :param thresholds: trigger thresholds (low, high) for each detector,
+                       only used if no station is given.
+    :param trigger: trigger settings (n_low, n_high, and_or, external),
+                    only used if no station is given.
+    :param trace_filter: function which takes a trace (list of values) and
+                         returns the filtered trace.
+
+    """
+
+    def __init__(self, data, group, source=None, station=None, thresholds=None, trigger=None,
+                 trace_filter=None):
+        super(ProcessEventsWithTraceFilter, self).__init__(data, group, source, progress=False)
+        if station is not None:
+            self.station = station
+        if thresholds is not None:
+            self.thresholds = thresholds
+        if trigger is not None:
+            self.trigger = trigger
+        self.trace_filter = trace_filter
+        self._traces = {}
+
+    def _get_trace(self, idx):
+        """Returns an iterator over the (filtered) trace"""
+
+        if idx in self._traces:
+            return iter(self._traces[idx])
+        trace = super(ProcessEventsWithTraceFilter, self)._get_trace(idx)
+        if self.trace_filter is not None:
+            trace = self.trace_filter(list(trace))
+        return iter(trace)
+
+    def set_event_traces(self, event, traces):
+        """Use decoded traces (samples x detectors) for an event"""
+
+        self._traces = dict(zip([idx for idx in event['traces'] if idx >= 0], traces.T))
+
+    def clear_traces(self):
+        self._traces = {}
+
+
+def get_source(group, source=None):
+    """Get the events table, the original events if already processed"""
+
+    if source is not None:
+        return group._f_get_child(source)
+    if '_events' in group:
+        return group._events
+    return group.events
+
+
+def unique_sorted_rows(source, limit=None):
+    """Rows of the events sorted by ext_timestamp, without duplicates
+
+    :param source: events table.
+    :param limit: maximum number of rows.
+    :return: row numbers into the events table.
+
+    """
+    ext_timestamps = source.col('ext_timestamp')
+    rows = ext_timestamps.argsort(kind='mergesort')
+    sorted_timestamps = ext_timestamps[rows]
+    unique = concatenate([[True], sorted_timestamps[1:] != sorted_timestamps[:-1]])
+    return rows[unique][:limit]
+
+
+def get_chunks(rows, chunksize=CHUNKSIZE):
+    """Split the rows in chunks"""
+
+    return [rows[start:start + chunksize] for start in range(0, len(rows), chunksize)]
+
+
+def init_worker(path, group, source, station, thresholds, trigger, trace_filter,
+                observables, observable_thresholds):
+    """Open the data and make the processing class once per worker
+
+    The file stays open for the lifetime of the worker process.
+
+    """
+    global _pe, _observables, _observable_thresholds
+    data = tables.open_file(path, 'r')
+    _pe = ProcessEventsWithTraceFilter(data, group, source, station, thresholds, trigger,
+                                       trace_filter)
+    _observables = observables
+    _observable_thresholds = observable_thresholds
+
+
+def process_chunk(rows):
+    """Process a chunk of events
+
+    :param rows: row numbers into the events table.
+    :return: array of processed events, without particle densities.
+
+    """
+    events = _pe.source.read_coordinates(rows)
+    processed = empty(len(events), dtype=PROCESSED_DTYPE)
+    for name in PROCESSED_DTYPE.names:
+        if name in events.dtype.names:
+            processed[name] = events[name]
+        else:
+            processed[name] = -1
+
+    if _observables:
+        timings = []
+        for start in range(0, len(processed), OBSERVABLES_BATCH):
+            batch = processed[start:start + OBSERVABLES_BATCH]
+            batch_traces = {}
+            for indices, traces in group_traces(_pe, batch).values():
+                observables = trace_observables(traces, **_observable_thresholds)
+                for name in OBSERVABLES:
+                    batch[name][indices] = observables[name]
+                batch_traces.update(zip(indices, traces))
+            for i, event in enumerate(batch):
+                _pe.set_event_traces(event, batch_traces.pop(i))
+                timings.append(_pe._reconstruct_time_from_traces(event))
+                _pe.clear_traces()
+    else:
+        timings = [_pe._reconstruct_time_from_traces(event) for event in processed]
+
+    timings = array(timings)
+    for idx, name in enumerate(TIMING_COLUMNS):
+        processed[name] = timings[:, idx]
+    return processed
+
+
+def particle_densities(integrals):
+    """Number of particles in the detectors from the pulseintegrals
+
+    The same as `ProcessEvents._process_pulseintegrals`, the integrals are
+    divided by the MPV of the integrals of each detector.
+
+    :param integrals: array (events x 4) of pulseintegrals.
+    :return: array (events x 4) with the number of particles, -1 and
+             -999 status flags are retained, -999 if the MPV fit failed.
+
+    """
+    all_mpv = []
+    for detector_integrals in integrals.T:
+        if (detector_integrals < 0).all():
+            all_mpv.append(nan)
+        else:
+            n, bins = histogram(detector_integrals, bins=linspace(0, 50000, 201))
+            mpv, is_fitted = FindMostProbableValueInSpectrum(n, bins).find_mpv()
+            all_mpv.append(mpv if is_fitted else nan)
+    n_particles = where(integrals >= 0, integrals / array(all_mpv), integrals)
+    return where(isnan(n_particles), -999, n_particles)
+
+
+def process_events_parallel(path, group, source=None, station=None, thresholds=None,
+                            trigger=None, trace_filter=None, observables=False,
+                            observable_thresholds=None, limit=None, chunksize=CHUNKSIZE,
+                            processes=None):
+    """Process all events of a station using multiple processes
+
+    :param path: path to the data file.
+    :param group: group containing the station data.
+    :param source: name of the events table, by default the original
+                   events table.
+    :param station: station number, to get the trigger settings from the
+                    API. If None the thresholds and trigger are used.
+    :param thresholds: trigger thresholds (low, high) for each detector,
+                       defaults to the DAQ defaults.
+    :param trigger: trigger settings, defaults to the default trigger for
+                    the number of detectors.
+    :param trace_filter: function to filter each trace before use.
+    :param observables: if True, determine the trace observables again
+                        from the (filtered) traces.
+    :param observable_thresholds: baseline_threshold, low_threshold and
+                                  low_threshold_iii for the observables.
+    :param limit: maximum number of events to process.
+    :param chunksize: number of events per task.
+    :param processes: number of worker processes, defaults to the number
+                      of cpus.
+    :return: array of processed events.
+
+    """
+    with tables.open_file(path, 'r') as data:
+        source_table = get_source(data.get_node(group), source)
+        source = source_table.name
+        rows = unique_sorted_rows(source_table, limit)
+
+    if station is not None:
+        station = Station(station)
+    if observable_thresholds is None:
+        observable_thresholds = {}
+
+    worker_pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                       initargs=(path, group, source, station, thresholds,
+                                                 trigger, trace_filter, observables,
+                                                 observable_thresholds))
+    try:
+        # imap returns the chunks in the original order
+        chunks = list(worker_pool.imap(process_chunk, get_chunks(rows, chunksize)))
+    finally:
+        worker_pool.close()
+        worker_pool.join()
+
+    if not chunks:
+        return empty(0, dtype=PROCESSED_DTYPE)
+    events = concatenate(chunks)
+    events['event_id'] = range(len(events))
+    n_particles = particle_densities(events['integrals'])
+    for idx in range(4):
+        events['n%d' % (idx + 1)] = n_particles[:, idx]
+    return events
+
+
+def store_events(events, path, group, destination, overwrite=False):
+    """Store processed events in a new table
+
+    :param events: array of processed events.
+    :param path: path to the data file, the file is created if needed.
+    :param group: group for the table, created if needed.
+    :param destination: name of the new events table.
+    :param overwrite: if True, overwrite an existing table.
+
+    """
+    with tables.open_file(path, 'a') as data:
+        if group in data:
+            node = data.get_node(group)
+        else:
+            parent, name = os.path.split(group)
+            node = data.create_group(parent, name, createparents=True)
+        if destination in node:
+            if not overwrite:
+                raise RuntimeError("I will not overwrite previous results "
+                                   "(unless you specify overwrite=True)")
+            data.remove_node(node, destination)
+        table = data.create_table(node, destination, ProcessEvents.processed_events_description,
+                                  expectedrows=len(events))
+        table.append(events)
+        table.flush()
+
+
+def check_destination(path, group, destination, source, overwrite):
+    """Check if the destination is valid before processing"""
+
+    if destination in ('_events', source):
+        raise RuntimeError("Can not replace the source events, choose another destination.")
+    if not overwrite and os.path.exists(path):
+        with tables.open_file(path, 'r') as data:
+            if group in data and destination in data.get_node(group):
+                raise RuntimeError("I will not overwrite previous results "
+                                   "(unless you specify overwrite=True)")
+
+
+def process_and_store_parallel(path, group, destination='events_processed', overwrite=False,
+                               dest_path=None, dest_group=None, **kwargs):
+    """Process all events of a station and store them in a new table
+
+    :param path: path to the data file with the source events.
+    :param group: group containing the station data.
+    :param destination: name of the table for the processed events.
+    :param overwrite: if True, overwrite an existing destination table.
+    :param dest_path: path to the file for the processed events, by
+                      default the source file.
+    :param dest_group: group for the processed events, by default the
+                       source group.
+    :param kwargs: see `process_events_parallel`.
+
+    """
+    if dest_path is None:
+        dest_path = path
+    if dest_group is None:
+        dest_group = group
+    source = kwargs.get('source')
+    if dest_path == path and dest_group == group:
+        check_destination(dest_path, dest_group, destination, source or 'events', overwrite)
+    else:
+        check_destination(dest_path, dest_group, destination, None, overwrite)
+    events = process_events_parallel(path, group, **kwargs)
+    store_events(events, dest_path, dest_group, destination, overwrite)
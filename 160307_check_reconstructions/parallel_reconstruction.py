@@ -0,0 +1,147 @@
+"""Reconstruct coincidences in parallel
+
+`ReconstructESDCoincidences.reconstruct_and_store` reconstructs all
+coincidences in a single process. Here the coincidences table is split
+into chunks of rows which are reconstructed by worker processes. Each
+worker opens the data file read-only and makes the cluster, offsets and
+reconstruction classes only once.
+
+The results are collected in the original order and stored in the
+reconstructions table by the main process, after the workers are done
+(the file can not be written while the workers are reading it)::
+
+    reconstruct_and_store_parallel(path, overwrite=True)
+
+"""
+import multiprocessing
+
+import tables
+
+from sapphire import CoincidenceQuery, ReconstructESDCoincidences
+from sapphire.analysis.core_reconstruction import CoincidenceCoreReconstruction
+from sapphire.analysis.direction_reconstruction import CoincidenceDirectionReconstruction
+
+from timing_offsets import CoincidenceDirectionReconstructionOffsets
+
+CHUNKSIZE = 5000
+
+_cq = None
+_direction = None
+_core = None
+_offsets = None
+_station_numbers = None
+
+
+def init_worker(path, coincidences_group, cluster, offsets, direction_class,
+                timing_offsets, station_numbers):
+    """Open the data and make the reconstruction classes once per worker
+
+    The file stays open for the lifetime of the worker process.
+
+    """
+    global _cq, _direction, _core, _offsets, _station_numbers
+    data = tables.open_file(path, 'r')
+    _cq = CoincidenceQuery(data, coincidences_group)
+    if timing_offsets is None:
+        _direction = direction_class(cluster)
+    else:
+        _direction = CoincidenceDirectionReconstructionOffsets(cluster, timing_offsets)
+    _core = CoincidenceCoreReconstruction(cluster)
+    _offsets = offsets
+    _station_numbers = station_numbers
+
+
+def reconstruct_chunk(chunk):
+    """Reconstruct the directions and cores of a range of coincidences
+
+    Like `ReconstructESDCoincidences.reconstruct_cores` the directions are
+    used as initial values for the core reconstructions.
+
+    :param chunk: start and stop row of the coincidences table.
+    :return: start row, and the theta, phi, station numbers, core x and
+             core y of each coincidence.
+
+    """
+    start, stop = chunk
+    coincidences = _cq.coincidences.read(start, stop)
+    coincidence_events = list(_cq.all_events(coincidences, n=0))
+    theta, phi, station_numbers = _direction.reconstruct_coincidences(
+        coincidence_events, _station_numbers, _offsets, progress=False)
+    initials = [{'theta': c_theta, 'phi': c_phi} for c_theta, c_phi in zip(theta, phi)]
+    core_x, core_y = _core.reconstruct_coincidences(coincidence_events, _station_numbers,
+                                                    progress=False, initials=initials)
+    return start, theta, phi, station_numbers, core_x, core_y
+
+
+def get_chunks(n_rows, chunksize=CHUNKSIZE):
+    """Split a number of rows in (start, stop) ranges"""
+
+    return [(start, min(start + chunksize, n_rows))
+            for start in range(0, n_rows, chunksize)]
+
+
+def reconstruct_and_store_parallel(path, coincidences_group='/coincidences',
+                                   destination='reconstructions', overwrite=False,
+                                   station_numbers=None,
+                                   direction_class=CoincidenceDirectionReconstruction,
+                                   timing_offsets=None, chunksize=CHUNKSIZE,
+                                   processes=None):
+    """Reconstruct all coincidences in a file using multiple processes
+
+    :param path: path to the data file.
+    :param coincidences_group: group containing the coincidences.
+    :param destination: name of the reconstructions table.
+    :param overwrite: if True, overwrite an existing reconstructions table.
+    :param station_numbers: list of station numbers, to only use events
+                            from those stations.
+    :param direction_class: direction reconstruction class to use, e.g.
+                            `CoincidenceDirectionReconstructionDetectors`.
+    :param timing_offsets: a TimingOffsets instance, if given these
+                           offsets are used instead of the API.
+    :param chunksize: number of coincidences per task.
+    :param processes: number of worker processes, defaults to the number
+                      of cpus.
+
+    """
+    with tables.open_file(path, 'r') as data:
+        rec = ReconstructESDCoincidences(data, coincidences_group, progress=False)
+        if timing_offsets is None:
+            rec.get_station_timing_offsets()
+        cluster = rec.cluster
+        offsets = rec.offsets
+        n_rows = rec.coincidences.nrows
+
+    theta = []
+    phi = []
+    numbers = []
+    core_x = []
+    core_y = []
+
+    worker_pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                       initargs=(path, coincidences_group, cluster, offsets,
+                                                 direction_class, timing_offsets,
+                                                 station_numbers))
+    try:
+        # imap returns the chunks in the original order
+        for _, c_theta, c_phi, c_numbers, c_x, c_y in worker_pool.imap(
+                reconstruct_chunk, get_chunks(n_rows, chunksize)):
+            theta.extend(c_theta)
+            phi.extend(c_phi)
+            numbers.extend(c_numbers)
+            core_x.extend(c_x)
+            core_y.extend(c_y)
+    finally:
+        worker_pool.close()
+        worker_pool.join()
+
+    with tables.open_file(path, 'a') as data:
+        rec = ReconstructESDCoincidences(data, coincidences_group, overwrite=overwrite,
+                                         progress=False, destination=destination,
+                                         cluster=cluster)
+        rec.prepare_output()
+        rec.theta = theta
+        rec.phi = phi
+        rec.station_numbers = numbers
+        rec.core_x = core_x
+        rec.core_y = core_y
+        rec.store_reconstructions()
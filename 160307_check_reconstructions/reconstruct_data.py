@@ -1,10 +1,16 @@
 import os.path
 
+from time import time
+
 import tables
 
+from numpy import allclose, array_equal
+
 from sapphire import ReconstructESDCoincidences
 from sapphire.analysis.direction_reconstruction import CoincidenceDirectionReconstructionDetectors
 
+from parallel_reconstruction import reconstruct_and_store_parallel
+
 DATASTORE = "/Users/arne/Datastore/check_reconstructions"
 
 
@@ -20,8 +26,38 @@ def reconstruct_data_using_detectors(data):
     rec_d.reconstruct_and_store()
 
 
+def reconstruct_data_parallel(path):
+    reconstruct_and_store_parallel(path, overwrite=True)
+    reconstruct_and_store_parallel(path, overwrite=True, destination='reconstructions_detectors',
+                                   direction_class=CoincidenceDirectionReconstructionDetectors)
+
+
+def benchmark(path):
+    """Time the serial and parallel reconstructions, check equal results"""
+
+    t0 = time()
+    with tables.open_file(path, 'a') as data:
+        rec = ReconstructESDCoincidences(data, overwrite=True, progress=False,
+                                         destination='reconstructions_serial')
+        rec.reconstruct_and_store()
+    t1 = time()
+    reconstruct_and_store_parallel(path, overwrite=True, destination='reconstructions_parallel')
+    t2 = time()
+    print 'Serial: %.1f s, parallel: %.1f s' % (t1 - t0, t2 - t1)
+
+    with tables.open_file(path, 'r') as data:
+        serial = data.root.coincidences.reconstructions_serial.read()
+        parallel = data.root.coincidences.reconstructions_parallel.read()
+    assert serial.dtype == parallel.dtype
+    for field in serial.dtype.names:
+        if serial.dtype[field].kind == 'f':
+            equal = allclose(serial[field], parallel[field], equal_nan=True)
+        else:
+            equal = array_equal(serial[field], parallel[field])
+        assert equal, 'Parallel %s differs from serial' % field
+
+
 if __name__ == '__main__':
     path = os.path.join(DATASTORE, 'dataset_sciencepark_n10_151101_160201.h5')
-    with tables.open_file(path, 'a') as data:
-        reconstruct_data(data)
-        reconstruct_data_using_detectors(data)
+    reconstruct_data_parallel(path)
+    benchmark(path)
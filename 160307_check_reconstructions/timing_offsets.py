@@ -0,0 +1 @@
+../150312_reconstruction_map/timing_offsets.py
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""Determine the best offsets for a range of days
+
+`CoincidenceDirectionReconstruction.determine_best_offsets` combines the
+station and detector offsets for a single timestamp. Here this is done
+for a grid of timestamps, divided over worker processes. Each worker
+makes the cluster and the `Station` objects (with their offset data) only
+once and reuses them for all its timestamps.
+
+The results are stored in a table with a row per timestamp and a column
+with the 4 detector offsets per station, which can be looked up for use
+in reconstructions::
+
+    offsets = get_best_offsets(1461542400)
+    rec.reconstruct_and_store(offsets=offsets)
+
+"""
+import multiprocessing
+import os
+
+from datetime import datetime
+
+import tables
+
+from numpy import concatenate, empty, full, in1d, nan, searchsorted
+
+from sapphire import HiSPARCStations, Station
+from sapphire.analysis.direction_reconstruction import CoincidenceDirectionReconstruction
+from sapphire.transformations.clock import datetime_to_gps
+
+OFFSETS_PATH = '/Users/arne/Datastore/station_offsets/best_offsets.h5'
+STATIONS = [501, 502, 503, 505, 506, 508, 510, 511]
+START = datetime_to_gps(datetime(2011, 1, 1))
+STOP = datetime_to_gps(datetime(2016, 6, 1))
+STEP = 86400
+
+_crec = None
+_offsets = None
+
+
+def best_offsets_description(station_numbers):
+    description = {'timestamp': tables.UInt32Col(pos=0)}
+    for i, station_number in enumerate(station_numbers):
+        description['s%d' % station_number] = tables.Float32Col(shape=4, pos=i + 1)
+    return description
+
+
+def init_worker(station_numbers):
+    """Make the cluster and Station objects once per worker process"""
+
+    global _crec, _offsets
+    cluster = HiSPARCStations(station_numbers, force_stale=True)
+    _crec = CoincidenceDirectionReconstruction(cluster)
+    _offsets = {sn: Station(sn, force_stale=True) for sn in station_numbers}
+
+
+def best_offsets_for_timestamp(timestamp):
+    """Determine the best offsets for one timestamp in a worker
+
+    :return: timestamp and dictionary with the detector offsets for each
+             station.
+
+    """
+    offsets = _crec.determine_best_offsets(sorted(_offsets.keys()), timestamp, _offsets)
+    return timestamp, offsets
+
+
+def offsets_row(station_numbers, offsets):
+    """Array of the detector offsets, nan for missing detectors"""
+
+    row = full((len(station_numbers), 4), nan)
+    for i, station_number in enumerate(station_numbers):
+        station_offsets = offsets.get(station_number, [])
+        row[i, :len(station_offsets)] = station_offsets
+    return row
+
+
+def sweep_best_offsets(station_numbers, timestamps, processes=None):
+    """Determine the best offsets for many timestamps in parallel
+
+    :param station_numbers: list of station numbers.
+    :param timestamps: list of timestamps, e.g. midnight of each day.
+    :param processes: number of worker processes, default is the number
+                      of cpus.
+    :return: array (timestamps x stations x 4) with the detector offsets.
+
+    """
+    result = empty((len(timestamps), len(station_numbers), 4))
+    if not len(timestamps):
+        return result
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    worker_pool = multiprocessing.Pool(processes, init_worker, (station_numbers,))
+    chunksize = max(len(timestamps) // (4 * processes), 1)
+    for i, (_, offsets) in enumerate(worker_pool.imap(best_offsets_for_timestamp,
+                                                        timestamps, chunksize)):
+        result[i] = offsets_row(station_numbers, offsets)
+    worker_pool.close()
+    worker_pool.join()
+    return result
+
+
+def store_best_offsets(station_numbers, timestamps, offsets, path=OFFSETS_PATH):
+    """Add best offsets to the table, keeping it sorted by timestamp
+
+    Existing rows for the same timestamps are replaced.
+
+    """
+    with tables.open_file(path, 'a') as data:
+        if 'best_offsets' in data.root:
+            table = data.root.best_offsets
+            if list(table.attrs.station_numbers) != list(station_numbers):
+                raise ValueError('Table contains offsets for other stations.')
+            rows = table.read()
+            data.remove_node('/', 'best_offsets')
+        else:
+            rows = None
+        table = data.create_table('/', 'best_offsets', best_offsets_description(station_numbers),
+                                  expectedrows=len(timestamps) + (0 if rows is None else len(rows)))
+        table.attrs.station_numbers = list(station_numbers)
+
+        new_rows = empty(len(timestamps), dtype=table.dtype)
+        new_rows['timestamp'] = timestamps
+        for i, station_number in enumerate(station_numbers):
+            new_rows['s%d' % station_number] = offsets[:, i]
+        if rows is not None:
+            rows = rows[~in1d(rows['timestamp'], new_rows['timestamp'])]
+            new_rows = concatenate((rows, new_rows))
+        table.append(new_rows[new_rows['timestamp'].argsort(kind='mergesort')])
+
+
+def read_best_offsets(path=OFFSETS_PATH):
+    """Read the stored best offsets
+
+    :return: station numbers and the table rows.
+
+    """
+    with tables.open_file(path, 'r') as data:
+        table = data.root.best_offsets
+        return list(table.attrs.station_numbers), table.read()
+
+
+def get_best_offsets(timestamp, path=OFFSETS_PATH, best_offsets=None):
+    """Look up the best offsets valid at a timestamp
+
+    The last entry at or before the timestamp is used.
+
+    :param best_offsets: result of `read_best_offsets`, read from path if
+                         not given.
+    :return: dictionary with the detector offsets for each station.
+
+    """
+    if best_offsets is None:
+        best_offsets = read_best_offsets(path)
+    station_numbers, rows = best_offsets
+    idx = max(searchsorted(rows['timestamp'], timestamp, side='right') - 1, 0)
+    return {sn: rows[idx]['s%d' % sn].tolist() for sn in station_numbers}
+
+
+def sweep(station_numbers=STATIONS, start=START, stop=STOP, step=STEP, path=OFFSETS_PATH):
+    """Determine and store the best offsets for timestamps not yet done
+
+    The stations are checked before the sweep, the offsets can only be
+    added to a table for the same stations.
+
+    """
+    timestamps = range(start, stop, step)
+    if os.path.exists(path):
+        try:
+            stored_stations, rows = read_best_offsets(path)
+        except tables.NoSuchNodeError:
+            pass
+        else:
+            if stored_stations != list(station_numbers):
+                raise ValueError('Table contains offsets for other stations.')
+            timestamps = [ts for ts, done in zip(timestamps, in1d(timestamps, rows['timestamp']))
+                          if not done]
+    offsets = sweep_best_offsets(station_numbers, timestamps)
+    store_best_offsets(station_numbers, timestamps, offsets, path)
+
+
+if __name__ == "__main__":
+    sweep()
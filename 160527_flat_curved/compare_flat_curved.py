@@ -29,6 +29,8 @@ from sapphire.simulations.showerfront import CorsikaStationFront
 from sapphire.transformations import geographic
 from sapphire.utils import angle_between, c, distance_between
 
+from timing_offsets import TimingOffsets
+
 RESULT_PATH_2D = '/Users/arne/Datastore/flat_curved/simulation_2D.h5'
 RESULT_PATH_3D = '/Users/arne/Datastore/flat_curved/simulation_3D.h5'
 RESULT_PATH = '/Users/arne/Datastore/flat_curved/simulation.h5'
@@ -49,8 +51,7 @@ def perform_simulations(data):
 
 def reconstruct_simulations(data):
     cluster = data.root.coincidences._v_attrs['cluster']
-    offsets = {s.number: [d.offset + s.gps_offset for d in s.detectors]
-               for s in cluster.stations}
+    offsets = TimingOffsets.from_cluster(cluster).offsets_at(0)
 
     # Default reconstruction currently first direction then core
     frec = ReconstructESDCoincidences(data, coincidences_group='/coincidences',
@@ -144,8 +145,7 @@ def plot_map(data):
 
 def display_coincidences(cluster, coincidence_events, coincidence,
                          reconstruction, map):
-    offsets = {s.number: [d.offset + s.gps_offset for d in s.detectors]
-               for s in cluster.stations}
+    offsets = TimingOffsets.from_cluster(cluster).offsets_at(0)
     ts0 = coincidence_events[0][1]['ext_timestamp']
 
     latitudes = []
@@ -267,8 +267,7 @@ def plot_distance_vs_delay(data):
     cq.reconstructed = True
 
     cluster = data.root.coincidences._v_attrs['cluster']
-    offsets = {s.number: [d.offset + s.gps_offset for d in s.detectors]
-               for s in cluster.stations}
+    offsets = TimingOffsets.from_cluster(cluster).offsets_at(0)
 
     front = CorsikaStationFront()
     front_r = np.arange(500)
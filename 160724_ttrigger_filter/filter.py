@@ -1,6 +1,5 @@
 import datetime
 import os
-import zlib
 
 import tables
 
@@ -9,10 +8,11 @@ from numpy import arange, histogram, histogram2d, linspace, log10, where
 from artist import Plot
 
 from sapphire import Station
-from sapphire.analysis.process_events import ProcessEventsWithTriggerOffset
 from sapphire.analysis.process_traces import MeanFilter
 from sapphire.publicdb import download_data
 
+from parallel_processing import process_and_store_parallel
+
 DATA_PATH = '/Users/arne/Datastore/ttrigger_filter/data.h5'
 STATION = 505
 GROUP = '/s%d' % STATION
@@ -20,47 +20,6 @@ API_STATION = Station(STATION)
 COLORS = ['black', 'red', 'green', 'blue']
 
 
-class ProcessEventsWithFilteredTraces(ProcessEventsWithTriggerOffset):
-
-    """Filter the traces before extracting data from them
-
-    To be used with data for which the noise filter was disabled.
-
-    :param data: the PyTables datafile
-    :param group: the group containing the station data.  In normal
-        cases, this is simply the group containing the events table.
-    :param source: the name of the events table.  Default: None,
-        meaning the default name 'events'.
-    :param progress: if True show a progressbar while copying and
-                     processing events.
-    :param station: station number of station to which the data belongs.
-
-    """
-
-    def _get_trace(self, idx):
-        """Returns a trace given an index into the blobs array.
-
-        Decompress a trace from the blobs array.
-
-        :param idx: index into the blobs array
-        :return: iterator over the pulseheight values
-
-        """
-        blobs = self._get_blobs()
-
-        try:
-            trace = zlib.decompress(blobs[idx]).split(',')
-        except zlib.error:
-            trace = zlib.decompress(blobs[idx][1:-1]).split(',')
-        if trace[-1] == '':
-            del trace[-1]
-        trace = [int(x) for x in trace]
-
-        filtered_trace = MeanFilter().filter_trace(trace)
-
-        return iter(filtered_trace)
-
-
 def get_data():
     """Ensure data is downloaded and available"""
 
@@ -73,17 +32,16 @@ def get_data():
 
 def process_data():
     """Process data with filtered and unfiltered traces"""
-    with tables.open_file(DATA_PATH, 'a') as data:
-        try:
-            pe = ProcessEventsWithTriggerOffset(data, GROUP, station=STATION)
-            pe.process_and_store_results('events_processed', overwrite=False, limit=10000)
-        except RuntimeError:
-            pass
-        try:
-            pe = ProcessEventsWithFilteredTraces(data, GROUP, station=STATION)
-            pe.process_and_store_results('events_filtered', overwrite=False, limit=10000)
-        except RuntimeError:
-            pass
+
+    try:
+        process_and_store_parallel(DATA_PATH, GROUP, 'events_processed', station=STATION)
+    except RuntimeError:
+        pass
+    try:
+        process_and_store_parallel(DATA_PATH, GROUP, 'events_filtered', station=STATION,
+                                   trace_filter=MeanFilter().filter_trace)
+    except RuntimeError:
+        pass
 
 
 def compare_ttrigger():
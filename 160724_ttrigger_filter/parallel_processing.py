@@ -0,0 +1 @@
+../160304_check_trigger/parallel_processing.py
\ No newline at end of file
@@ -0,0 +1 @@
+../150918_verify_observables/trace_observables.py
\ No newline at end of file